@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Real-time health alerts for the Smart Dairy Farm Management System
+Tails the prediction history for high / medium mastitis scores (from any app
+or worker), drops repeats per cow within a window, and fans the rest out to
+subscribed dashboards. Subscribers are plain deques woken by asyncio events,
+so thousands of idle streams cost a few hundred bytes each and no threads.
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime
+
+# Repeat alerts for a cow at the same (or a lower) level are suppressed for this long
+DEDUPE_SECONDS = float(os.environ.get('CATTLE_ALERT_DEDUPE_SECONDS', 3600))
+
+# How often the prediction history is polled for newly flagged scores
+POLL_INTERVAL = 0.5
+
+# A broker with no subscribers for this long stops polling until the next one arrives
+IDLE_SECONDS = 60
+
+# SSE comment sent on idle streams so proxies keep them open
+HEARTBEAT_SECONDS = 15
+
+# Events buffered per subscriber (a slow client loses the oldest) and kept for Last-Event-ID replay
+SUBSCRIBER_BUFFER = 256
+REPLAY_BUFFER = 1000
+
+ALERT_LEVELS = ('high', 'medium')
+LEVEL_RANK = {'medium': 1, 'high': 2}
+
+
+def alert_event(record):
+    """Alert payload for one flagged prediction row, shaped like /api/health-alerts entries"""
+    return {
+        'id': record['id'],
+        'type': f"{record['risk_level']}_mastitis_risk",
+        'message': f"Cow {record['cow_id']} has {record['risk_level']} mastitis risk "
+                   f"({(record['probability'] or 0) * 100:.0f}%)",
+        'cow_id': record['cow_id'],
+        'risk_level': record['risk_level'],
+        'probability': record['probability'],
+        'model_version': record['model_version'],
+        'timestamp': record['created_at'],
+    }
+
+
+class AlertDeduper:
+    """One alert per cow per window; an escalation from medium to high always gets through
+
+    Times come from the prediction rows, so every worker tailing the same history
+    makes the same decisions.
+    """
+
+    def __init__(self, window=DEDUPE_SECONDS):
+        self.window = window
+        self.last = {}
+        self.suppressed = 0
+
+    def admit(self, event):
+        at = datetime.strptime(event['timestamp'], '%Y-%m-%d %H:%M:%S').timestamp()
+        cow_id = event['cow_id']
+        rank = LEVEL_RANK.get(event['risk_level'], 0)
+        previous = self.last.get(cow_id)
+        if previous is not None and at - previous[0] < self.window and rank <= previous[1]:
+            self.suppressed += 1
+            return False
+        self.last[cow_id] = (at, rank)
+        if len(self.last) > 10000:
+            self.last = {c: v for c, v in self.last.items() if at - v[0] < self.window}
+        return True
+
+
+class _Subscriber:
+    __slots__ = ('events', 'ready', 'levels', 'cow_id', 'dropped')
+
+    def __init__(self, levels, cow_id):
+        self.events = deque(maxlen=SUBSCRIBER_BUFFER)
+        self.ready = asyncio.Event()
+        self.levels = levels
+        self.cow_id = cow_id
+        self.dropped = 0
+
+    def wants(self, event):
+        return event['risk_level'] in self.levels and (self.cow_id is None or event['cow_id'] == self.cow_id)
+
+    def push(self, event):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append(event)
+        self.ready.set()
+
+
+class AlertBroker:
+    """Polls the prediction store from one task per process and fans events out to subscribers
+
+    ``store`` is the PredictionStore or a function returning it, called on each
+    poll so a store its owner has closed and reopened is never read through a
+    stale handle. With ``idle_seconds`` set, polling stops once the broker has
+    had no subscribers that long; start() resumes it from the newest score.
+    """
+
+    def __init__(self, store, poll_interval=POLL_INTERVAL, window=DEDUPE_SECONDS, idle_seconds=None):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.idle_seconds = idle_seconds
+        self.deduper = AlertDeduper(window)
+        self.subscribers = set()
+        self.recent = deque(maxlen=REPLAY_BUFFER)
+        self.published = 0
+        self.last_id = None
+        self._idle_since = None
+        self._task = None
+
+    def publish(self, event):
+        if not self.deduper.admit(event):
+            return False
+        self.recent.append(event)
+        self.published += 1
+        for subscriber in self.subscribers:
+            if subscriber.wants(event):
+                subscriber.push(event)
+        return True
+
+    def _read(self):
+        store = self.store() if callable(self.store) else self.store
+        upto = store.max_id()
+        if self.last_id is None:
+            # Only scores logged after (re)starting are pushed; history is in /api/health-alerts
+            self.last_id = upto
+        if upto <= self.last_id:
+            return []
+        records = store.flagged_between(self.last_id, upto, ALERT_LEVELS)
+        # Unflagged rows are skipped too, so each poll only reads rows it has not seen
+        self.last_id = upto
+        return records
+
+    def _idle(self, now):
+        if self.subscribers or self.idle_seconds is None:
+            self._idle_since = None
+            return False
+        if self._idle_since is None:
+            self._idle_since = now
+        return now - self._idle_since >= self.idle_seconds
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while not self._idle(loop.time()):
+            try:
+                records = await loop.run_in_executor(None, self._read)
+            except Exception as e:
+                print(f"⚠️  Could not read flagged predictions: {e}")
+                records = []
+            for record in records:
+                self.publish(alert_event(record))
+            await asyncio.sleep(self.poll_interval)
+        self.last_id = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._idle_since = None
+            self._task = asyncio.get_running_loop().create_task(self._poll(), name='alert-broker')
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def stream(self, levels=ALERT_LEVELS, cow_id=None, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """Server-sent events for one client: replay after Last-Event-ID, then live alerts"""
+        subscriber = _Subscriber(set(levels), cow_id)
+        if last_event_id is not None:
+            for event in self.recent:
+                if event['id'] > last_event_id and subscriber.wants(event):
+                    subscriber.events.append(event)
+        self.subscribers.add(subscriber)
+        self.start()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                if not subscriber.events:
+                    subscriber.ready.clear()
+                    try:
+                        await asyncio.wait_for(subscriber.ready.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+                        continue
+                while subscriber.events:
+                    event = subscriber.events.popleft()
+                    yield f"id: {event['id']}\nevent: health_alert\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'published': self.published,
+            'suppressed': self.deduper.suppressed,
+            'dropped': sum(s.dropped for s in self.subscribers),
+            'last_id': self.last_id,
+            'dedupe_seconds': self.deduper.window,
+        }
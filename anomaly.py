@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Milk yield anomaly detection for the Smart Dairy Farm Management System
+Each cow's expected yield is a recursive least squares fit (with forgetting) on
+Feed_kg, Temp_C, Humidity and Milking_Time_min. A new production record is
+scored against that expectation before it updates it: a residual far below the
+cow's usual error is a sudden drop, and a one-sided CUSUM of the residual
+z-scores catches a slower slide. The fit, error scale and CUSUM are one fixed
+row of floats per cow in the analytics database, so every worker shares them
+and a herd-day of records is a handful of array operations.
+"""
+
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Model inputs, and centres / scales taken from farm_milk_production.csv (they only condition the fit)
+YIELD_INPUTS = ['feed_kg', 'temp_c', 'humidity', 'milking_time']
+INPUT_CENTERS = np.array([12.0, 25.0, 60.0, 15.0])
+INPUT_SCALES = np.array([1.5, 2.0, 6.0, 3.0])
+
+# Forgetting factor: a record from a month ago weighs 0.98 ** 30 ≈ 0.55 of today's
+FORGETTING = 0.98
+
+# Starting fit: the intercept is learned from the first record, the input slopes more slowly
+PRIOR_INTERCEPT_VARIANCE = 100.0
+PRIOR_SLOPE_VARIANCE = 0.25
+PRIOR_ERROR_SD = 2.0
+MAX_COVARIANCE_TRACE = 1000.0
+
+# Weight of a new squared error in the cow's error scale
+ERROR_ALPHA = 0.1
+
+# Records a cow needs before it can be flagged
+WARMUP_RECORDS = 7
+
+# |z| beyond this is a drop / spike; errors are clipped here before they update the fit
+Z_THRESHOLD = 3.0
+
+# One-sided CUSUM on -z: allowance per record and the level that flags a sustained drop
+CUSUM_ALLOWANCE = 0.5
+CUSUM_THRESHOLD = 4.0
+
+# Anomalies within this many days of the latest record are health signals
+SIGNAL_DAYS = 3
+
+DROP_KINDS = ('yield_drop', 'sustained_drop')
+
+N_COEF = len(YIELD_INPUTS) + 1
+STATE_SIZE = N_COEF + N_COEF * N_COEF + 3  # coefficients, covariance, error variance, records, cusum
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cow_yield_state (
+    cow_id TEXT PRIMARY KEY,
+    state BLOB NOT NULL,
+    day TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS yield_anomalies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cow_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    liters REAL NOT NULL,
+    expected REAL NOT NULL,
+    z REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_yield_anomalies_day ON yield_anomalies (day, cow_id);
+'''
+
+
+def initial_state(n):
+    state = np.zeros((n, STATE_SIZE))
+    covariance = np.diag([PRIOR_INTERCEPT_VARIANCE] + [PRIOR_SLOPE_VARIANCE] * (N_COEF - 1))
+    state[:, N_COEF:N_COEF + N_COEF * N_COEF] = covariance.ravel()
+    state[:, -3] = PRIOR_ERROR_SD ** 2
+    return state
+
+
+def design_matrix(rows):
+    """[1, scaled inputs] per normalized production row (see herd_analytics.normalize_production)"""
+    inputs = (rows[YIELD_INPUTS].to_numpy(dtype=np.float64) - INPUT_CENTERS) / INPUT_SCALES
+    return np.hstack([np.ones((len(inputs), 1)), inputs])
+
+
+def step(state, X, y):
+    """Score then absorb one record per row of state; returns (expected, z, cusum)
+
+    Errors are clipped at Z_THRESHOLD before the update, so a sick cow's drop does
+    not drag her expectation down with it.
+    """
+    coef = state[:, :N_COEF]
+    covariance = state[:, N_COEF:N_COEF + N_COEF * N_COEF].reshape(-1, N_COEF, N_COEF)
+    variance, records, cusum = state[:, -3], state[:, -2], state[:, -1]
+
+    expected = np.einsum('ij,ij->i', X, coef)
+    Px = np.einsum('ijk,ik->ij', covariance, X)
+    leverage = np.einsum('ij,ij->i', X, Px)
+    error = y - expected
+    scale = np.sqrt(variance * (1 + leverage))
+    z = error / scale
+    warm = records >= WARMUP_RECORDS
+    cusum = np.where(warm, np.maximum(0.0, cusum - z - CUSUM_ALLOWANCE), 0.0)
+
+    clipped = np.where(warm, np.clip(error, -Z_THRESHOLD * scale, Z_THRESHOLD * scale), error)
+    gain = Px / (FORGETTING + leverage)[:, None]
+    coef = coef + gain * clipped[:, None]
+    covariance = (covariance - gain[:, :, None] * Px[:, None, :]) / FORGETTING
+    trace = np.trace(covariance, axis1=1, axis2=2)
+    covariance *= np.minimum(1.0, MAX_COVARIANCE_TRACE / trace)[:, None, None]
+    variance = (1 - ERROR_ALPHA) * variance + ERROR_ALPHA * clipped ** 2 / (1 + leverage)
+
+    state[:, :N_COEF] = coef
+    state[:, N_COEF:N_COEF + N_COEF * N_COEF] = covariance.reshape(len(state), -1)
+    state[:, -3], state[:, -2] = variance, records + 1
+    state[:, -1] = np.where(cusum > CUSUM_THRESHOLD, 0.0, cusum)
+    return expected, np.where(warm, z, 0.0), cusum
+
+
+class YieldMonitor:
+    """Scores production records against each cow's expected yield and keeps what it flags"""
+
+    def __init__(self):
+        self._signals = (None, {})
+
+    @staticmethod
+    def prepare(conn):
+        """Create the tables; cow_yield_state from before the day column gets it added"""
+        conn.executescript(SCHEMA)
+        if 'day' not in [row[1] for row in conn.execute('PRAGMA table_info(cow_yield_state)')]:
+            conn.execute("ALTER TABLE cow_yield_state ADD COLUMN day TEXT NOT NULL DEFAULT ''")
+
+    def update(self, conn, rows):
+        """Fold normalized production rows into the per-cow fits (inside the caller's transaction)
+
+        A cow's records in the batch are taken in date order; different cows move in
+        lock step, so the number of vectorized steps is the most records any one cow
+        has in the batch. Each cow's fit remembers the last day it absorbed, and
+        records for that day or earlier are skipped: a replayed cow-day is not
+        counted twice, and a corrected one keeps its first score. Returns the
+        anomalies found.
+        """
+        rows = rows.drop_duplicates(['cow_id', 'date'], keep='last').sort_values('date', kind='stable')
+        # One query for the whole batch: the cow IDs go in as a single JSON array parameter
+        stored = conn.execute('SELECT cow_id, state, day FROM cow_yield_state WHERE cow_id IN '
+                              '(SELECT value FROM json_each(?))',
+                              (json.dumps(rows['cow_id'].unique().tolist()),)).fetchall()
+        applied = rows['cow_id'].map({row[0]: row[2] for row in stored}).fillna('')
+        rows = rows[(rows['date'] > applied).to_numpy()]
+        slots, cows = pd.factorize(rows['cow_id'])
+        cow_ids = cows.tolist()
+        state = initial_state(len(cow_ids))
+        index = dict(zip(cow_ids, range(len(cow_ids))))
+        stored = [row for row in stored if row[0] in index]
+        if stored:
+            found = np.fromiter((index[row[0]] for row in stored), np.int64, len(stored))
+            state[found] = np.frombuffer(b''.join(row[1] for row in stored), dtype=np.float64).reshape(-1, STATE_SIZE)
+
+        order = rows.groupby(slots, sort=False).cumcount().to_numpy()
+        X, y, days = design_matrix(rows), rows['milk_liters'].to_numpy(dtype=np.float64), rows['date'].to_numpy()
+        anomalies = []
+        for k in range(order.max() + 1 if len(rows) else 0):
+            at = np.flatnonzero(order == k)
+            cows = slots[at]
+            sub = state[cows]
+            expected, z, cusum = step(sub, X[at], y[at])
+            state[cows] = sub
+            kinds = np.where(z <= -Z_THRESHOLD, 'yield_drop',
+                             np.where(cusum > CUSUM_THRESHOLD, 'sustained_drop',
+                                      np.where(z >= Z_THRESHOLD, 'yield_spike', '')))
+            for i in np.flatnonzero(kinds != ''):
+                anomalies.append((cow_ids[cows[i]], days[at[i]], str(kinds[i]), float(y[at[i]]),
+                                  round(float(expected[i]), 3), round(float(z[i]), 3)))
+
+        blob, width = state.tobytes(), STATE_SIZE * state.itemsize
+        last = rows.groupby(slots, sort=False)['date'].max()
+        conn.executemany('INSERT OR REPLACE INTO cow_yield_state (cow_id, state, day) VALUES (?, ?, ?)',
+                         [(cow_id, blob[i * width:(i + 1) * width], last[i]) for i, cow_id in enumerate(cow_ids)])
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.executemany('INSERT INTO yield_anomalies (cow_id, day, kind, liters, expected, z, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)', [a + (now,) for a in anomalies])
+        return [self._entry(a + (now,)) for a in anomalies]
+
+    @staticmethod
+    def _entry(row):
+        cow_id, day, kind, liters, expected, z, created_at = tuple(row)
+        return {
+            'cow_id': cow_id,
+            'date': day,
+            'kind': kind,
+            'liters': round(liters, 2),
+            'expected_liters': round(expected, 2),
+            'z': z,
+            'timestamp': created_at,
+        }
+
+    def anomalies(self, conn, since, until=None, cow_id=None, kinds=None):
+        """Flagged records with since <= day <= until, newest day first"""
+        query = 'SELECT cow_id, day, kind, liters, expected, z, created_at FROM yield_anomalies WHERE day >= ?'
+        params = [since]
+        if until is not None:
+            query += ' AND day <= ?'
+            params.append(until)
+        if cow_id is not None:
+            query += ' AND cow_id = ?'
+            params.append(str(cow_id))
+        if kinds is not None:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += list(kinds)
+        return [self._entry(row) for row in conn.execute(query + ' ORDER BY day DESC, id DESC', params)]
+
+    def signal(self, conn, version, cow_id):
+        """A cow's latest yield drop within SIGNAL_DAYS of the latest record, or None
+
+        All cows' signals are read in one query per rollup version, so scoring a
+        cow is a dict lookup.
+        """
+        if self._signals[0] != version:
+            latest = conn.execute('SELECT MAX(day) FROM herd_daily').fetchone()[0]
+            signals = {}
+            if latest is not None:
+                since = (pd.Timestamp(latest) - pd.Timedelta(days=SIGNAL_DAYS - 1)).strftime('%Y-%m-%d')
+                for entry in self.anomalies(conn, since, kinds=DROP_KINDS):
+                    signals.setdefault(entry['cow_id'], entry)
+            self._signals = (version, signals)
+        return self._signals[1].get(str(cow_id))
@@ -1,17 +1,24 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, Response, stream_with_context, g
 import pandas as pd
 import numpy as np
 import joblib
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import json
 from werkzeug.security import generate_password_hash, check_password_hash
 import io
-import csv
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+from model_registry import registry, risk_level_for, DISEASE_FEATURES
+from batch_scoring import score_milk_batch, score_disease_batch, stream_scored_csv, UPLOAD_CHUNK_ROWS
+from reports import report_jobs
+from sensor_store import parse_ndjson, parse_frames
+from rolling_features import herd_state, uses_rolling_features
+from prediction_cache import cache_key
+from herd_analytics import parse_production, DEFAULT_WINDOW_DAYS, TOP_COWS
+from forecasting import DEFAULT_HORIZON
+from anomaly import DROP_KINDS, SIGNAL_DAYS
+from tenancy import tenants, DEFAULT_FARM, FarmAuthRequired, FarmBusy, FarmForbidden, UnknownFarm
+from metrics import HTTP_REQUEST_SECONDS, CONTENT_TYPE, StageTimer, count_error, render as render_metrics
 
 app = Flask(__name__)
 app.secret_key = 'cattle_monitoring_secret_key_2024'
@@ -21,27 +28,98 @@ users = {
     'farmer1': {
         'password': generate_password_hash('password123'),
         'name': 'Ramesh Patel',
-        'farm_name': 'Patel Dairy Farm'
+        'farm_name': 'Patel Dairy Farm',
+        'farm_id': DEFAULT_FARM
     }
 }
+# Other farms' logins come from farms.json
+users.update(tenants.users())
 
-# Load models (we'll create these from the notebooks)
+# Prediction routes that count against a farm's in-flight cap (the default farm has none)
+FARM_LIMITED_ROUTES = {'predict_milk', 'predict_milk_batch', 'predict_disease', 'predict_disease_batch', 'upload_csv'}
+
+# Trained pipelines are loaded once per worker and kept resident in the registry
 milk_model = None
 disease_model = None
 
 def load_models():
     global milk_model, disease_model
     try:
-        # For now, we'll create simple models based on the notebook analysis
-        # In production, you would load the actual trained models
         print("Loading models...")
-        # Placeholder - in real implementation, load the actual models
-        milk_model = "milk_model_loaded"
-        disease_model = "disease_model_loaded"
+        registry.load()
+        # Per-cow rolling state continues from where training left it
+        herd_state.restore()
+        milk_model = registry.get('milk')
+        disease_model = registry.get('disease')
         print("Models loaded successfully!")
     except Exception as e:
         print(f"Error loading models: {e}")
 
+def current_farm():
+    """The logged-in user's farm, or the one the X-API-Key header belongs to (see Tenants.authorize)"""
+    if 'farm' not in g:
+        user = users.get(session.get('user'))
+        g.farm = tenants.authorize(request.headers.get('X-Farm-ID') or request.args.get('farm_id'),
+                                   user_farm=user['farm_id'] if user else None,
+                                   api_key=request.headers.get('X-API-Key'))
+    return g.farm
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Requests without a farm (and the single-farm dashboard) go to tenants.default, which is never turned away
+    if request.endpoint in FARM_LIMITED_ROUTES and current_farm() is not tenants.default:
+        g.farm.enter()
+        g.farm_admitted = True
+
+@app.teardown_request
+def release_farm_slot(error=None):
+    if g.pop('farm_admitted', False):
+        g.farm.leave()
+
+@app.errorhandler(UnknownFarm)
+def unknown_farm(e):
+    return jsonify({
+        'success': False,
+        'error': e.args[0]
+    }), 404
+
+@app.errorhandler(FarmAuthRequired)
+def farm_auth_required(e):
+    return jsonify({
+        'success': False,
+        'error': str(e)
+    }), 401
+
+@app.errorhandler(FarmForbidden)
+def farm_forbidden(e):
+    return jsonify({
+        'success': False,
+        'error': str(e)
+    }), 403
+
+@app.errorhandler(FarmBusy)
+def farm_busy(e):
+    return jsonify({
+        'success': False,
+        'error': str(e)
+    }), 429
+
+@app.after_request
+def note_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_duration(error=None):
+    # Teardown runs even when a view raises, and after_request may not have; those count as 500s.
+    # Label by URL rule (e.g. /export_report/<job_id>) so label values stay bounded
+    started = g.pop('request_started', None)
+    if request.url_rule is not None and started is not None:
+        status = 500 if error is not None else g.get('response_status', 500)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=request.url_rule.rule,
+                                     method=request.method, status=status)
+
 # Language translations
 translations = {
     'en': {
@@ -174,6 +252,9 @@ def disease_detection():
 
 @app.route('/predict_milk', methods=['POST'])
 def predict_milk():
+    timer = StageTimer('/predict_milk')
+    farm = current_farm()
+    models = farm.registry
     try:
         data = request.json
         
@@ -182,31 +263,71 @@ def predict_milk():
         temp_c = float(data['temp_c'])
         humidity = float(data['humidity'])
         milking_time = float(data['milking_time'])
+        timer.mark('parse')
         
         # Calculate temp_humidity_ratio (from the notebook)
         temp_humidity_ratio = temp_c / (humidity + 1)
         
-        # Simple prediction based on the linear regression model from notebook
-        # This is a simplified version - in production, use the actual trained model
-        predicted_milk = (
-            0.5 * feed_kg + 
-            0.3 * temp_c + 
-            0.1 * humidity + 
-            0.2 * milking_time + 
-            0.15 * temp_humidity_ratio + 
-            5.0  # base value
-        )
+        if models.is_loaded('milk'):
+            # Single in-memory predict on the farm's resident pipeline, unless these inputs were seen recently
+            row = [feed_kg, milking_time, temp_humidity_ratio]
+            model_version = models.version('milk')
+            key = cache_key('milk', model_version, row)
+            timer.mark('features')
+            predicted_milk = farm.cache.get(key)
+            if predicted_milk is None:
+                predicted_milk = float(models.predict('milk', [row])[0])
+                farm.cache.put(key, predicted_milk)
+            timer.mark('predict')
+            # Computed in the background; the dashboard polls /explain/<id> for it
+            explanation_id = farm.explainer.submit('milk', row)
+            timer.mark('explain')
+        else:
+            # Fallback formula when no trained model is available
+            predicted_milk = (
+                0.5 * feed_kg + 
+                0.3 * temp_c + 
+                0.1 * humidity + 
+                0.2 * milking_time + 
+                0.15 * temp_humidity_ratio + 
+                5.0  # base value
+            )
+            
+            # Ensure realistic range
+            predicted_milk = max(5.0, min(30.0, predicted_milk))
+            model_version, explanation_id = None, None
         
-        # Ensure realistic range
-        predicted_milk = max(5.0, min(30.0, predicted_milk))
+        farm.store.record('milk', cow_id=data.get('cow_id'), predicted_milk=round(predicted_milk, 2),
+                     model_version=model_version, inputs=data)
+        timer.mark('store')
         
         return jsonify({
             'success': True,
             'predicted_milk': round(predicted_milk, 2),
-            'confidence': 'High (99.4% accuracy)'
+            'confidence': 'High (99.4% accuracy)',
+            'model_version': model_version,
+            'explanation_id': explanation_id
         })
         
     except Exception as e:
+        count_error('/predict_milk', e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/predict_milk_batch', methods=['POST'])
+def predict_milk_batch():
+    """Score a whole herd in one request (JSON array of rows or columnar lists); ?explain=1 adds
+    per-row feature contributions"""
+    farm = current_farm()
+    try:
+        result = score_milk_batch(request.get_json(force=True), explain=request.args.get('explain') in ('1', 'true'),
+                                  farm=farm)
+        farm.store.record_batch('milk', result['results'], result['model_version'])
+        return jsonify(result)
+    except Exception as e:
+        count_error('/predict_milk_batch', e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -214,6 +335,9 @@ def predict_milk():
 
 @app.route('/predict_disease', methods=['POST'])
 def predict_disease():
+    timer = StageTimer('/predict_disease')
+    farm = current_farm()
+    models = farm.registry
     try:
         data = request.json
         
@@ -225,71 +349,215 @@ def predict_disease():
         temperature = float(data['temperature'])
         breed = data['breed']
         
-        # Simulate sensor data (in real implementation, these would come from IoT sensors)
-        iufl = np.random.uniform(0.1, 0.9)
-        eufl = np.random.uniform(0.1, 0.9)
-        iufr = np.random.uniform(0.1, 0.9)
-        eufr = np.random.uniform(0.1, 0.9)
-        iurl = np.random.uniform(0.1, 0.9)
-        eurl = np.random.uniform(0.1, 0.9)
-        iurr = np.random.uniform(0.1, 0.9)
-        eurr = np.random.uniform(0.1, 0.9)
-        
-        # Calculate derived features (from the notebook)
-        avg_all_sensors = np.mean([iufl, eufl, iufr, eufr, iurl, eurl, iurr, eurr])
-        diff_fl = iufl - eufl
-        diff_fr = iufr - eufr
-        diff_rl = iurl - eurl
-        diff_rr = iurr - eurr
-        max_diff = max(abs(diff_fl), abs(diff_fr), abs(diff_rl), abs(diff_rr))
+        sensor_keys = ['iufl', 'eufl', 'iufr', 'eufr', 'iurl', 'eurl', 'iurr', 'eurr']
+        timer.mark('parse')
         
-        # Simple risk assessment based on the model features
-        risk_score = 0
-        
-        # Temperature factor
-        if temperature > 39.5:
-            risk_score += 0.3
-        elif temperature > 38.5:
-            risk_score += 0.2
-        
-        # Previous mastitis history
-        if previous_mastitis == 1:
-            risk_score += 0.4
-        
-        # Sensor differences (inflammation indicators)
-        if max_diff > 0.3:
-            risk_score += 0.3
-        elif max_diff > 0.2:
-            risk_score += 0.2
-        
-        # Months after birth (early lactation period is riskier)
-        if months_after_birth < 3:
-            risk_score += 0.2
+        # Readings in the request win; otherwise use the cow's latest ingested window
+        sensors, sensor_source, window = None, 'simulated', None
+        if all(k in data for k in sensor_keys):
+            sensors, sensor_source = [float(data[k]) for k in sensor_keys], 'request'
+        else:
+            window = farm.sensor_store.window_features(cow_id)
+            if window is not None and all(window[c] is not None for c in DISEASE_FEATURES[:8]):
+                sensors, sensor_source = [window[c] for c in DISEASE_FEATURES[:8]], 'stored'
+            timer.mark('sensor_window')
         
-        # Determine risk level
-        if risk_score >= 0.7:
-            risk_level = 'high'
-            probability = min(0.95, risk_score)
-        elif risk_score >= 0.4:
-            risk_level = 'medium'
-            probability = risk_score
+        if models.is_loaded('disease') and sensors is not None:
+            # Score real sensor readings with the resident classifier
+            row = sensors + [
+                temperature,
+                float(data.get('hardness', 0)),
+                float(data.get('pain', 0)),
+                float(data.get('milk_visibility', 0))
+            ]
+            if uses_rolling_features(models.features('disease')):
+                features = pd.DataFrame([row], columns=DISEASE_FEATURES)
+                row = farm.herd_state.frame(features, [cow_id], [day], [previous_mastitis]).to_numpy()[0]
+            model_version = models.version('disease')
+            key = cache_key('disease', model_version, row)
+            timer.mark('features')
+            probability = farm.cache.get(key)
+            if probability is None:
+                probability = float(models.predict_proba('disease', [row])[0])
+                farm.cache.put(key, probability)
+            risk_level = risk_level_for(probability)
+            timer.mark('predict')
+            explanation_id = farm.explainer.submit('disease', row)
+            timer.mark('explain')
         else:
-            risk_level = 'low'
-            probability = max(0.05, risk_score)
+            risk_level, probability = heuristic_disease_risk(temperature, previous_mastitis, months_after_birth)
+            model_version, sensor_source, explanation_id = None, 'simulated', None
+        
+        farm.store.record('disease', cow_id=cow_id, probability=round(probability, 3), risk_level=risk_level,
+                     model_version=model_version, inputs=data)
+        timer.mark('store')
+        # A recent drop against the cow's expected milk yield often comes before clinical mastitis
+        yield_signal = farm.analytics.yield_signal(cow_id)
+        timer.mark('yield_signal')
         
         return jsonify({
             'success': True,
             'risk_level': risk_level,
             'probability': round(probability, 3),
-            'recommendations': get_recommendations(risk_level)
+            'recommendations': get_recommendations(risk_level),
+            'model_version': model_version,
+            'explanation_id': explanation_id,
+            'sensor_source': sensor_source,
+            'sensor_window': {k: window[k] for k in ('readings', 'since', 'until')} if sensor_source == 'stored' else None,
+            'yield_signal': yield_signal
         })
         
     except Exception as e:
+        count_error('/predict_disease', e)
         return jsonify({
             'success': False,
             'error': str(e)
         })
 
+@app.route('/predict_disease_batch', methods=['POST'])
+def predict_disease_batch():
+    """Score many cows' sensor rows (IUFL..EURR, Temperature, Hardness, Pain, Milk_visibility)"""
+    farm = current_farm()
+    try:
+        result = score_disease_batch(request.get_json(force=True),
+                                     explain=request.args.get('explain') in ('1', 'true'), farm=farm)
+        farm.store.record_batch('disease', result['results'], result['model_version'])
+        return jsonify(result)
+    except Exception as e:
+        count_error('/predict_disease_batch', e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/ingest_sensors', methods=['POST'])
+def ingest_sensors():
+    """Append batched udder quarter readings to the sensor time-series store
+
+    Body: NDJSON (one reading per line: cow_id, ts, iufl..eurr, temperature) or,
+    with Content-Type application/octet-stream, packed binary frames
+    (see sensor_store.pack_frame). Writes happen on a background thread.
+    """
+    farm = current_farm()
+    try:
+        if request.mimetype == 'application/octet-stream':
+            batches, errors = parse_frames(request.get_data()), []
+        else:
+            batches, errors = parse_ndjson(io.TextIOWrapper(request.stream, encoding='utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    accepted = farm.sensor_store.append(batches)
+    received = sum(len(records) for records in batches.values())
+    return jsonify({
+        'success': accepted == received,
+        'accepted': accepted,
+        'dropped': received - accepted,
+        'cows': len(batches),
+        'errors': errors
+    }), 202 if accepted == received else 503
+
+@app.route('/upload_csv', methods=['POST'])
+def upload_csv():
+    """Score a herd CSV export and stream the scored rows back
+
+    The CSV can be sent as the raw request body (streamed, so scoring starts
+    before the upload finishes) or as a multipart 'file' field.
+    Query args: model=milk|disease, format=csv|ndjson, chunk_rows=N
+    """
+    model = request.args.get('model', 'milk')
+    output_format = request.args.get('format', 'csv')
+    chunk_rows = request.args.get('chunk_rows', UPLOAD_CHUNK_ROWS, type=int)
+    
+    if request.mimetype == 'multipart/form-data' and 'file' in request.files:
+        # Detach the spooled upload so request teardown doesn't close it mid-stream
+        upload = request.files['file']
+        stream, upload.stream = upload.stream, io.BytesIO()
+    else:
+        stream = request.stream
+    
+    try:
+        rows = stream_scored_csv(stream, model, output_format, chunk_rows, farm=current_farm())
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    def generate():
+        try:
+            yield from rows
+        finally:
+            stream.close()
+    
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'text/csv'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def heuristic_disease_risk(temperature, previous_mastitis, months_after_birth):
+    """Rule-based risk used when no sensor readings or trained model are available"""
+    # Simulate sensor data (in real implementation, these would come from IoT sensors)
+    iufl = np.random.uniform(0.1, 0.9)
+    eufl = np.random.uniform(0.1, 0.9)
+    iufr = np.random.uniform(0.1, 0.9)
+    eufr = np.random.uniform(0.1, 0.9)
+    iurl = np.random.uniform(0.1, 0.9)
+    eurl = np.random.uniform(0.1, 0.9)
+    iurr = np.random.uniform(0.1, 0.9)
+    eurr = np.random.uniform(0.1, 0.9)
+    
+    # Calculate derived features (from the notebook)
+    avg_all_sensors = np.mean([iufl, eufl, iufr, eufr, iurl, eurl, iurr, eurr])
+    diff_fl = iufl - eufl
+    diff_fr = iufr - eufr
+    diff_rl = iurl - eurl
+    diff_rr = iurr - eurr
+    max_diff = max(abs(diff_fl), abs(diff_fr), abs(diff_rl), abs(diff_rr))
+    
+    # Simple risk assessment based on the model features
+    risk_score = 0
+    
+    # Temperature factor
+    if temperature > 39.5:
+        risk_score += 0.3
+    elif temperature > 38.5:
+        risk_score += 0.2
+    
+    # Previous mastitis history
+    if previous_mastitis == 1:
+        risk_score += 0.4
+    
+    # Sensor differences (inflammation indicators)
+    if max_diff > 0.3:
+        risk_score += 0.3
+    elif max_diff > 0.2:
+        risk_score += 0.2
+    
+    # Months after birth (early lactation period is riskier)
+    if months_after_birth < 3:
+        risk_score += 0.2
+    
+    # Determine risk level
+    if risk_score >= 0.7:
+        risk_level = 'high'
+        probability = min(0.95, risk_score)
+    elif risk_score >= 0.4:
+        risk_level = 'medium'
+        probability = risk_score
+    else:
+        risk_level = 'low'
+        probability = max(0.05, risk_score)
+    
+    return risk_level, probability
+
+YIELD_DROP_RECOMMENDATIONS = [
+    'Check the udder and run a California Mastitis Test',
+    'Take the cow\'s temperature and watch feed intake',
+    'Score her with /predict_disease using today\'s sensor readings'
+]
+
 def get_recommendations(risk_level):
     recommendations = {
         'high': [
@@ -312,84 +580,306 @@ def get_recommendations(risk_level):
     }
     return recommendations.get(risk_level, [])
 
+@app.route('/api/predictions-history')
+def predictions_history():
+    """Logged predictions, e.g. ?cow_id=C017&days=30 or ?risk_level=high&days=1"""
+    farm = current_farm()
+    try:
+        risk_levels = request.args.get('risk_level')
+        records, total = farm.store.history(
+            cow_id=request.args.get('cow_id'),
+            days=request.args.get('days', type=int),
+            kind=request.args.get('type'),
+            risk_levels=risk_levels.split(',') if risk_levels else None,
+            limit=min(request.args.get('limit', 100, type=int), 1000)
+        )
+        
+        history = []
+        for record in records:
+            if record['kind'] == 'milk':
+                prediction, confidence = record['predicted_milk'], None
+            else:
+                prediction = record['risk_level']
+                confidence = round(record['probability'] * 100, 1) if record['probability'] is not None else None
+            history.append({
+                'type': record['kind'],
+                'cow_id': record['cow_id'],
+                'prediction': prediction,
+                'confidence': confidence,
+                'timestamp': record['created_at'],
+                'model_version': record['model_version']
+            })
+        
+        return jsonify({
+            'success': True,
+            'total_predictions': total,
+            'history': history
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/api/health-alerts')
+def health_alerts():
+    """Cows whose latest mastitis score on a day is high or medium risk"""
+    farm = current_farm()
+    try:
+        day = request.args.get('date')
+        flagged = farm.store.cows_at_risk(day, risk_levels=('high', 'medium'))
+        
+        alerts = [{
+            'type': f"{record['risk_level']}_mastitis_risk",
+            'message': f"Cow {record['cow_id']} has {record['risk_level']} mastitis risk "
+                       f"({record['probability'] * 100:.0f}%)",
+            'cow_id': record['cow_id'],
+            'risk_level': record['risk_level'],
+            'probability': record['probability'],
+            'timestamp': record['created_at'],
+            'recommendations': get_recommendations(record['risk_level'])
+        } for record in flagged]
+        
+        # Milk yield drops flagged against each cow's expected yield over the last few days
+        alerts += [{
+            'type': anomaly['kind'],
+            'message': f"Cow {anomaly['cow_id']} gave {anomaly['liters']} L on {anomaly['date']}, "
+                       f"expected {anomaly['expected_liters']} L",
+            'cow_id': anomaly['cow_id'],
+            'liters': anomaly['liters'],
+            'expected_liters': anomaly['expected_liters'],
+            'z': anomaly['z'],
+            'timestamp': anomaly['timestamp'],
+            'recommendations': YIELD_DROP_RECOMMENDATIONS
+        } for anomaly in farm.analytics.yield_anomalies(since=day, kinds=DROP_KINDS)
+          if day is None or anomaly['date'] == day]
+        
+        return jsonify({
+            'success': True,
+            'total_alerts': len(alerts),
+            'alerts': alerts
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/api/farm-analytics')
+def farm_analytics():
+    """Herd yield, feed efficiency and heat-stress aggregates from the production rollups
+
+    Query args: days=N (default 30) ending at end=YYYY-MM-DD (default: latest recorded day),
+    or start/end; cow_id=C001 adds that cow's daily and weekly yield; top=N.
+    """
+    farm = current_farm()
+    try:
+        summary = farm.analytics.summary(
+            days=request.args.get('days', DEFAULT_WINDOW_DAYS, type=int),
+            since=request.args.get('start'),
+            until=request.args.get('end'),
+            cow_id=request.args.get('cow_id'),
+            top=min(request.args.get('top', TOP_COWS, type=int), 100)
+        )
+        return jsonify({'success': True, **summary})
+    except Exception as e:
+        count_error('/api/farm-analytics', e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/api/production', methods=['POST'])
+def ingest_production():
+    """Add milk production records (JSON rows or a farm_milk_production.csv-shaped CSV body)"""
+    farm = current_farm()
+    try:
+        if request.mimetype == 'text/csv':
+            rows = parse_production(request.get_data())
+        else:
+            rows = parse_production(request.get_json(force=True))
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    ingested = farm.analytics.ingest(rows)
+    posted = set(zip(rows['cow_id'], rows['date']))
+    return jsonify({
+        'success': True,
+        'ingested': ingested,
+        'yield_anomalies': [a for a in farm.analytics.yield_anomalies(since=rows['date'].min())
+                            if (a['cow_id'], a['date']) in posted]
+    })
+
+@app.route('/api/yield-anomalies')
+def yield_anomalies():
+    """Production records well below (or above) their cow's expected yield
+
+    Query args: days=N (default 3) back from the latest recorded day, or start=YYYY-MM-DD; cow_id=C001.
+    """
+    anomalies = current_farm().analytics.yield_anomalies(
+        days=request.args.get('days', SIGNAL_DAYS, type=int),
+        since=request.args.get('start'),
+        cow_id=request.args.get('cow_id')
+    )
+    return jsonify({
+        'success': True,
+        'total_anomalies': len(anomalies),
+        'anomalies': anomalies
+    })
+
+@app.route('/api/forecast', methods=['GET', 'POST'])
+def milk_forecast():
+    """Daily milk yield forecasts per cow and for the herd, with an 80% band
+
+    Query args (or a JSON body): horizon=1..30 days (default 7), cow_id=C001, and
+    in the body weather=[{"temp_c": .., "humidity": ..}, ...] for the coming days.
+    """
+    farm = current_farm()
+    params = request.args.to_dict()
+    if request.method == 'POST':
+        params.update(request.get_json(force=True, silent=True) or {})
+    try:
+        forecast = farm.forecaster.forecast(
+            horizon=params.get('horizon', DEFAULT_HORIZON),
+            weather=params.get('weather'),
+            cow_id=params.get('cow_id')
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except KeyError as e:
+        return jsonify({
+            'success': False,
+            'error': e.args[0]
+        }), 404
+    return jsonify({'success': True, **forecast})
+
+@app.route('/model_status')
+def model_status():
+    """Model load times, versions and recent prediction latency for the caller's farm"""
+    farm = current_farm()
+    stats = farm.registry.stats()
+    for name, entry in stats.items():
+        entry['explanations'] = farm.explainer.stats(name)
+    return jsonify(stats)
+
+@app.route('/api/farms')
+def farm_status():
+    """Farms opened by this worker, and whose fine-tuned models are resident against the memory budget"""
+    return jsonify(tenants.stats())
+
+@app.route('/explain/<explanation_id>')
+def explain(explanation_id):
+    """Per-feature contributions behind a prediction, by the explanation_id it returned
+
+    Answers 202 while the background pool is still computing it; poll again.
+    """
+    status = current_farm().explainer.lookup(explanation_id)
+    code = {'done': 200, 'pending': 202, 'failed': 500, 'unknown': 404}[status['status']]
+    return jsonify(dict(status, success=code < 300, explanation_id=explanation_id)), code
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: request, stage and inference latency histograms"""
+    return Response(render_metrics(registry.metadata), content_type=CONTENT_TYPE)
+
 @app.route('/export_report')
 def export_report():
+    """Queue (or serve from cache) a herd report for a time window
+
+    Query args: format=csv|pdf, days=N (default 30) or start/end=YYYY-MM-DD.
+    Returns the file if an identical report is already rendered, otherwise a
+    job ID to poll at /export_report/<job_id>.
+    """
     if 'user' not in session:
         return redirect(url_for('login'))
     
+    farm = current_farm()
     format_type = request.args.get('format', 'csv')
+    days = request.args.get('days', 30, type=int)
+    try:
+        end = datetime.strptime(request.args.get('end') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else end - timedelta(days=days)
+    except ValueError as e:
+        count_error('/export_report', e)
+        return jsonify({
+            'success': False,
+            'error': 'start and end must be dates in YYYY-MM-DD format'
+        }), 400
+    if start > end:
+        return jsonify({
+            'success': False,
+            'error': 'start must not be after end'
+        }), 400
+    since, until = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
     
-    if format_type == 'csv':
-        # Create CSV report
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Report Type', 'Generated Date', 'Farm Name', 'User'])
-        writer.writerow(['Cattle Monitoring Report', datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 
-                        users[session['user']]['farm_name'], session['user']])
-        writer.writerow([])
-        writer.writerow(['Milk Yield Predictions', 'Disease Detection', 'Recommendations'])
-        writer.writerow(['High accuracy model (99.4%)', 'XGBoost model (99.29% ROC AUC)', 'AI-powered insights'])
-        
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'cattle_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+    # Windows that include today change as predictions arrive, so key them on the newest row
+    watermark = farm.store.max_id() if until >= datetime.now().strftime('%Y-%m-%d') else 0
+    models = {name: farm.registry.version(name) for name in ('milk', 'disease')}
     
-    elif format_type == 'pdf':
-        # Create PDF report
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title = Paragraph("Cattle Monitoring Report", styles['Title'])
-        story.append(title)
-        story.append(Spacer(1, 12))
-        
-        # Report details
-        story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
-        story.append(Paragraph(f"Farm: {users[session['user']]['farm_name']}", styles['Normal']))
-        story.append(Paragraph(f"User: {session['user']}", styles['Normal']))
-        story.append(Spacer(1, 20))
-        
-        # Model performance table
-        data = [
-            ['Model', 'Type', 'Accuracy', 'Status'],
-            ['Milk Yield Prediction', 'Regression', '99.4%', 'Active'],
-            ['Disease Detection', 'Classification', '99.29% ROC AUC', 'Active']
-        ]
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(table)
-        doc.build(story)
-        
-        buffer.seek(0)
-        return send_file(
-            buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'cattle_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        )
+    try:
+        job_id = report_jobs.submit(users[session['user']]['farm_name'], session['user'],
+                                    since, until, format_type, watermark, models, db_path=farm.store.path,
+                                    farm_id=farm.id)
+    except ValueError as e:
+        count_error('/export_report', e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     
-    return redirect(url_for('dashboard'))
+    if report_jobs.status(job_id)['status'] == 'done':
+        return download_report(job_id)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'pending',
+        'status_url': url_for('report_status', job_id=job_id),
+        'download_url': url_for('download_report', job_id=job_id)
+    }), 202
 
-if __name__ == '__main__':
+def report_owner():
+    """The session's {'user', 'farm_id'}; report jobs only answer to the user and farm that asked for them"""
+    return {'user': session['user'], 'farm_id': current_farm().id}
+
+@app.route('/export_report/<job_id>')
+def report_status(job_id):
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    
+    status = report_jobs.status(job_id, owner=report_owner())
+    if status['status'] == 'done':
+        status['download_url'] = url_for('download_report', job_id=job_id)
+    return jsonify(status), 404 if status['status'] == 'unknown' else 200
+
+@app.route('/export_report/<job_id>/download')
+def download_report(job_id):
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    
+    status = report_jobs.status(job_id, owner=report_owner())
+    if status['status'] != 'done':
+        return jsonify(status), 404
+    
+    extension = job_id.rsplit('_', 1)[1]
+    return send_file(
+        report_jobs.path(job_id),
+        mimetype='application/pdf' if extension == 'pdf' else 'text/csv',
+        as_attachment=True,
+        download_name=f'cattle_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    )
+
+# Load once per worker process, at import, so run.py and WSGI servers get the models too.
+# The report pool's spawned children re-run the launching script as __mp_main__; they
+# only render from the prediction history, so they skip the models.
+if __name__ != '__mp_main__':
     load_models()
+
+if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
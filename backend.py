@@ -1,8 +1,116 @@
-from fastapi import FastAPI
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+from model_registry import registry, risk_level_for, ModelValidationError, MILK_FEATURES, DISEASE_FEATURES
+from batch_scoring import score_milk_batch, score_disease_batch
+from sensor_store import parse_ndjson, parse_frames
+from rolling_features import herd_state, uses_rolling_features
+from micro_batcher import MicroBatcher
+from prediction_cache import cache_key
+from alerts import AlertBroker, ALERT_LEVELS, IDLE_SECONDS
+from herd_analytics import parse_production, DEFAULT_WINDOW_DAYS, TOP_COWS
+from forecasting import DEFAULT_HORIZON
+from anomaly import SIGNAL_DAYS
+from tenancy import tenants, Farm, FarmAuthRequired, FarmBusy, FarmForbidden, UnknownFarm
+from metrics import CONTENT_TYPE, render as render_metrics
+
+# Single-cow requests are merged into vectorized model calls, one batcher per farm and model
+# (CATTLE_BATCH_MAX_SIZE rows, at most CATTLE_BATCH_MAX_WAIT_MS of queueing).
+# Both tables only hold open farms: evict_farm() drops a farm's entries when tenants closes it
+batchers = {}
+
+def batcher(farm, name):
+    key = (farm.id, name)
+    if key not in batchers:
+        method = "predict" if name == "milk" else "predict_proba"
+        batchers[key] = MicroBatcher(lambda X: getattr(farm.registry, method)(name, X), name=name)
+    return batchers[key]
+
+# High / medium mastitis scores logged by any app or worker, pushed to each farm's dashboards over SSE.
+# A broker looks its farm up on every poll, so live streams keep the farm open and its store
+# current; with no subscribers for IDLE_SECONDS it stops polling and the farm can go idle
+alert_brokers = {}
+
+def alert_broker(farm):
+    if farm.id not in alert_brokers:
+        alert_brokers[farm.id] = AlertBroker(lambda: tenants.get(farm.id).store, idle_seconds=IDLE_SECONDS)
+    broker = alert_brokers[farm.id]
+    broker.start()
+    return broker
+
+async def evict_farm(farm):
+    closing = [alert_brokers.pop(farm.id, None)]
+    closing += [batchers.pop(key) for key in list(batchers) if key[0] == farm.id]
+    for closable in closing:
+        if closable is not None:
+            await closable.close()
+
+@asynccontextmanager
+async def lifespan(app):
+    loop = asyncio.get_running_loop()
+
+    def farm_closed(farm):
+        # Farms are closed on whichever thread looked one up; brokers and batchers live on the loop
+        asyncio.run_coroutine_threadsafe(evict_farm(farm), loop)
+
+    tenants.close_listeners.append(farm_closed)
+    alert_broker(tenants.default)
+    yield
+    tenants.close_listeners.remove(farm_closed)
+    for broker in alert_brokers.values():
+        await broker.close()
+    for batcher_ in batchers.values():
+        await batcher_.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(UnknownFarm)
+async def unknown_farm(request, exc):
+    return JSONResponse({"detail": exc.args[0]}, status_code=404)
+
+@app.exception_handler(FarmBusy)
+async def farm_busy(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=429)
+
+@app.exception_handler(FarmAuthRequired)
+async def farm_auth_required(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=401)
+
+@app.exception_handler(FarmForbidden)
+async def farm_forbidden(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=403)
+
+def current_farm(x_farm_id: Optional[str] = Header(None), x_api_key: Optional[str] = Header(None),
+                 farm_id: Optional[str] = None):
+    # The farm is the API key's (X-API-Key); X-Farm-ID / ?farm_id= may only name that same farm.
+    # Without a key only the default farm is served, and only while farms.json gives it no keys
+    return tenants.authorize(x_farm_id or farm_id, api_key=x_api_key)
+
+# Farm model loads in progress, so a burst of first requests shares one threadpool load
+model_loads = {}
+
+async def farm_models(farm):
+    # A farm's first request loads its fine-tuned models; keep that off the event loop
+    if farm.has_own_models() and not tenants.models.is_resident(farm.id):
+        load = model_loads.get(farm.id)
+        if load is None:
+            load = model_loads[farm.id] = asyncio.ensure_future(run_in_threadpool(lambda: farm.registry))
+            load.add_done_callback(lambda _: model_loads.pop(farm.id, None))
+        return await asyncio.shield(load)
+    return farm.registry
+
+# Load the trained pipelines once per worker; routes only call predict on resident models
+registry.load()
+herd_state.restore()
 
 # ✅ Allow frontend (HTML+JS) to call backend
 app.add_middleware(
@@ -20,6 +128,15 @@ class MilkInput(BaseModel):
     humidity: float
     milking_time: float
 
+class WeatherDay(BaseModel):
+    temp_c: float
+    humidity: float
+
+class ForecastInput(BaseModel):
+    horizon: int = DEFAULT_HORIZON
+    cow_id: Optional[str] = None
+    weather: List[WeatherDay] = []
+
 class DiseaseInput(BaseModel):
     cow_id: str
     day: int
@@ -27,19 +144,220 @@ class DiseaseInput(BaseModel):
     previous_mastitis: int
     temperature: float
     breed: str
+    # Udder quarter sensor readings; the trained classifier is used only when all are present
+    iufl: Optional[float] = None
+    eufl: Optional[float] = None
+    iufr: Optional[float] = None
+    eufr: Optional[float] = None
+    iurl: Optional[float] = None
+    eurl: Optional[float] = None
+    iurr: Optional[float] = None
+    eurr: Optional[float] = None
+    hardness: float = 0
+    pain: float = 0
+    milk_visibility: float = 0
+
+SENSOR_FIELDS = ['iufl', 'eufl', 'iufr', 'eufr', 'iurl', 'eurl', 'iurr', 'eurr']
 
 # ---------- Routes ----------
 @app.post("/predict_milk")
-def predict_milk(data: MilkInput):
+async def predict_milk(data: MilkInput, farm: Farm = Depends(current_farm)):
+    models = await farm_models(farm)
+    if models.is_loaded("milk"):
+        temp_humidity_ratio = data.temp_c / (data.humidity + 1)
+        row = [data.feed_kg, data.milking_time, temp_humidity_ratio]
+        key = cache_key("milk", models.version("milk"), row)
+        predicted_yield = farm.cache.get(key)
+        if predicted_yield is None:
+            predicted_yield = float(await batcher(farm, "milk").submit(row))
+            farm.cache.put(key, predicted_yield)
+        farm.store.record("milk", predicted_milk=round(predicted_yield, 2), model_version=models.version("milk"),
+                          inputs=data.model_dump())
+        return {"predicted_yield": predicted_yield, "confidence": 0.85, "model_version": models.version("milk"),
+                "explanation_id": farm.explainer.submit("milk", row)}
+
     # Dummy logic
     predicted_yield = (data.feed_kg * 2) - (data.temp_c * 0.1)
     confidence = 0.85
     return {"predicted_yield": predicted_yield, "confidence": confidence}
 
+@app.post("/predict_milk_batch")
+def predict_milk_batch(payload: Union[List[Any], Dict[str, Any]] = Body(...), explain: bool = False,
+                       farm: Farm = Depends(current_farm)):
+    # Rows are validated individually so one bad cow does not reject the herd
+    try:
+        with farm.admit():
+            result = score_milk_batch(payload, explain=explain, farm=farm)
+        # Logged like single predictions (one queued write per request), as app.py does
+        farm.store.record_batch("milk", result["results"], result["model_version"])
+        return result
+    except ModelValidationError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
 @app.post("/predict_disease")
-def predict_disease(data: DiseaseInput):
+async def predict_disease(data: DiseaseInput, farm: Farm = Depends(current_farm)):
+    sensors = [getattr(data, field) for field in SENSOR_FIELDS]
+    sensor_source = "request"
+    models = await farm_models(farm)
+    if None in sensors:
+        # Fall back to the cow's latest window of ingested parlour readings; only this
+        # threadpool read holds one of the farm's slots (waiting in a micro-batch holds no thread)
+        with farm.admit():
+            window = await run_in_threadpool(farm.sensor_store.window_features, data.cow_id)
+        sensors = [window[c] for c in DISEASE_FEATURES[:8]] if window is not None else [None]
+        sensor_source = "stored"
+    if models.is_loaded("disease") and None not in sensors:
+        row = sensors + [data.temperature, data.hardness, data.pain, data.milk_visibility]
+        if uses_rolling_features(models.features("disease")):
+            features = pd.DataFrame([row], columns=DISEASE_FEATURES)
+            # Shared with every worker through SQLite, so read and advance it off the event loop
+            row = (await run_in_threadpool(farm.herd_state.frame, features, [data.cow_id], [data.day],
+                                           [data.previous_mastitis])).to_numpy()[0]
+        key = cache_key("disease", models.version("disease"), row)
+        probability = farm.cache.get(key)
+        if probability is None:
+            probability = float(await batcher(farm, "disease").submit(row))
+            farm.cache.put(key, probability)
+        # Logged scores feed /api/predictions-history, the reports and the alert stream
+        farm.store.record("disease", cow_id=data.cow_id, probability=round(probability, 3),
+                          risk_level=risk_level_for(probability), model_version=models.version("disease"),
+                          inputs=data.model_dump())
+        return {
+            "disease": "Mastitis" if probability >= 0.5 else "Healthy",
+            "confidence": round(max(probability, 1 - probability), 3),
+            "probability": round(probability, 3),
+            "risk_level": risk_level_for(probability),
+            "model_version": models.version("disease"),
+            # Computed in the background; the dashboard polls /explain/{id} for it
+            "explanation_id": farm.explainer.submit("disease", row),
+            "sensor_source": sensor_source,
+            # Latest drop against the cow's expected milk yield, from the production records
+            "yield_signal": await run_in_threadpool(farm.analytics.yield_signal, data.cow_id),
+        }
+
     # Dummy disease logic
+    yield_signal = await run_in_threadpool(farm.analytics.yield_signal, data.cow_id)
     if data.temperature > 39:
-        return {"disease": "Mastitis", "confidence": 0.92}
+        return {"disease": "Mastitis", "confidence": 0.92, "yield_signal": yield_signal}
     else:
-        return {"disease": "Healthy", "confidence": 0.95}
+        return {"disease": "Healthy", "confidence": 0.95, "yield_signal": yield_signal}
+
+@app.post("/predict_disease_batch")
+def predict_disease_batch(payload: Union[List[Any], Dict[str, Any]] = Body(...), explain: bool = False,
+                          farm: Farm = Depends(current_farm)):
+    try:
+        with farm.admit():
+            result = score_disease_batch(payload, explain=explain, farm=farm)
+        # High / medium rows reach the alert stream through the prediction history
+        farm.store.record_batch("disease", result["results"], result["model_version"])
+        return result
+    except ModelValidationError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/ingest_sensors", status_code=202)
+async def ingest_sensors(request: Request, farm: Farm = Depends(current_farm)):
+    # NDJSON readings, or packed binary frames with Content-Type application/octet-stream
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/octet-stream"):
+            batches, errors = parse_frames(body), []
+        else:
+            batches, errors = parse_ndjson(body.decode("utf-8").splitlines())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    accepted = farm.sensor_store.append(batches)
+    received = sum(len(records) for records in batches.values())
+    if accepted != received:
+        raise HTTPException(status_code=503, detail="sensor write queue is full")
+    return {"accepted": accepted, "cows": len(batches), "errors": errors}
+
+@app.get("/api/farm-analytics")
+def farm_analytics(days: int = DEFAULT_WINDOW_DAYS, start: Optional[str] = None, end: Optional[str] = None,
+                   cow_id: Optional[str] = None, top: int = TOP_COWS, farm: Farm = Depends(current_farm)):
+    # Reads the production rollups shared with app.py
+    try:
+        return farm.analytics.summary(days=days, since=start, until=end, cow_id=cow_id, top=min(top, 100))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/api/production")
+async def ingest_production(request: Request, farm: Farm = Depends(current_farm)):
+    # JSON rows, or a farm_milk_production.csv-shaped body with Content-Type text/csv
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            rows = parse_production(body)
+        else:
+            rows = parse_production(json.loads(body))
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ingested = await run_in_threadpool(farm.analytics.ingest, rows)
+    posted = set(zip(rows["cow_id"], rows["date"]))
+    anomalies = await run_in_threadpool(farm.analytics.yield_anomalies, since=rows["date"].min())
+    return {"ingested": ingested,
+            "yield_anomalies": [a for a in anomalies if (a["cow_id"], a["date"]) in posted]}
+
+@app.get("/api/yield-anomalies")
+def yield_anomalies(days: int = SIGNAL_DAYS, start: Optional[str] = None, cow_id: Optional[str] = None,
+                    farm: Farm = Depends(current_farm)):
+    anomalies = farm.analytics.yield_anomalies(days=days, since=start, cow_id=cow_id)
+    return {"total_anomalies": len(anomalies), "anomalies": anomalies}
+
+def _forecast(farm, horizon, weather, cow_id):
+    # Folds any newly recorded days in, then answers from the farm's per-process forecast cache
+    try:
+        return farm.forecaster.forecast(horizon=horizon, weather=weather, cow_id=cow_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+@app.get("/api/forecast")
+def milk_forecast(horizon: int = DEFAULT_HORIZON, cow_id: Optional[str] = None, farm: Farm = Depends(current_farm)):
+    return _forecast(farm, horizon, None, cow_id)
+
+@app.post("/api/forecast")
+def milk_forecast_with_weather(data: ForecastInput, farm: Farm = Depends(current_farm)):
+    return _forecast(farm, data.horizon, [day.model_dump() for day in data.weather], data.cow_id)
+
+@app.get("/api/alerts/stream")
+async def alert_stream(risk_level: Optional[str] = None, cow_id: Optional[str] = None,
+                       last_event_id: Optional[int] = Header(None), farm: Farm = Depends(current_farm)):
+    # Server-sent events; each idle client is a parked coroutine, not a thread
+    levels = risk_level.split(",") if risk_level else ALERT_LEVELS
+    return StreamingResponse(alert_broker(farm).stream(levels, cow_id, last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/alerts/stats")
+async def alert_stats(farm: Farm = Depends(current_farm)):
+    # On the loop: alert_broker() (re)starts an idle broker's polling task
+    return alert_broker(farm).stats()
+
+@app.get("/model_status")
+def model_status(farm: Farm = Depends(current_farm)):
+    stats = farm.registry.stats()
+    for name in ("milk", "disease"):
+        stats[name]["batching"] = batcher(farm, name).stats()
+        stats[name]["explanations"] = farm.explainer.stats(name)
+    return stats
+
+@app.get("/api/farms")
+def farms():
+    # Farms opened by this worker and which fine-tuned models it holds in memory
+    return tenants.stats()
+
+@app.get("/explain/{explanation_id}")
+def explain(explanation_id: str, farm: Farm = Depends(current_farm)):
+    # 202 while the background pool is still computing it
+    status = farm.explainer.lookup(explanation_id)
+    code = {"done": 200, "pending": 202, "failed": 500, "unknown": 404}[status["status"]]
+    return JSONResponse(dict(status, explanation_id=explanation_id), status_code=code)
+
+@app.get("/metrics")
+def metrics():
+    # Inference time and rows per model call (i.e. micro-batch sizes) in Prometheus text format
+    return Response(render_metrics(registry.metadata), media_type=CONTENT_TYPE)
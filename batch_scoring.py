@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Batch scoring for whole-herd requests
+Turns a JSON payload into one feature frame, calls the resident pipeline once,
+and returns per-cow results in input order with per-row errors
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from features import DISEASE_FEATURES, milk_feature_frame, udder_features
+from model_registry import HIGH_RISK_THRESHOLD, MEDIUM_RISK_THRESHOLD
+from rolling_features import RollingFeatureEngine, uses_rolling_features
+from tenancy import tenants
+
+# Raw request fields, in the names the single-cow routes already use
+MILK_INPUT_FIELDS = ['feed_kg', 'temp_c', 'humidity', 'milking_time']
+DISEASE_INPUT_FIELDS = [f.lower() for f in DISEASE_FEATURES]
+
+# Clinical observations default to "absent" as in /predict_disease
+DISEASE_DEFAULTS = {'hardness': 0, 'pain': 0, 'milk_visibility': 0}
+
+# Extra fields needed when the mastitis model uses rolling per-cow features
+HISTORY_FIELDS = ['day', 'previous_mastitis']
+HISTORY_DEFAULTS = {'previous_mastitis': 0}
+
+# CSV export headers that differ from the request field names once lower-cased
+FIELD_ALIASES = {'milking_time_min': 'milking_time', 'previous_mastits_status': 'previous_mastitis'}
+
+# Upper bound on rows per request so one call cannot monopolise a worker
+MAX_BATCH_ROWS = 10000
+
+# Rows parsed and scored at a time when streaming an uploaded CSV
+UPLOAD_CHUNK_ROWS = 2000
+
+
+def batch_frame(payload, fields, id_field='cow_id', defaults=None):
+    """Normalize a row-array or columnar JSON payload into numeric columns
+
+    Accepts ``[{...}, {...}]``, ``{"rows": [...]}``, ``{"feed_kg": [...], ...}``
+    or an already parsed DataFrame.
+    Field names are case-insensitive, so CSV headers such as ``IUFL`` or
+    ``Milking_Time_min`` work as well; two columns naming the same field (``IUFL``
+    and ``iufl``) raise ValueError. Returns ``(frame, ids, errors)`` where
+    ``errors`` maps row index to message.
+    """
+    defaults = defaults or {}
+    if isinstance(payload, dict) and 'rows' in payload:
+        payload = payload['rows']
+
+    errors = {}
+    if isinstance(payload, pd.DataFrame):
+        raw = payload.reset_index(drop=True)
+    elif isinstance(payload, list):
+        records = []
+        for i, row in enumerate(payload):
+            if isinstance(row, dict):
+                records.append(row)
+            else:
+                records.append({})
+                errors[i] = 'row must be a JSON object'
+        raw = pd.DataFrame.from_records(records, index=range(len(records)))
+    elif isinstance(payload, dict):
+        lengths = {len(v) for v in payload.values() if isinstance(v, list)}
+        if len(lengths) != 1 or not all(isinstance(v, list) for v in payload.values()):
+            raise ValueError('columnar payload must map each field to a list of equal length')
+        raw = pd.DataFrame(payload)
+    else:
+        raise ValueError('expected a JSON array of rows or a columnar object')
+
+    names = {}
+    for column in raw.columns:
+        names.setdefault(FIELD_ALIASES.get(str(column).lower(), str(column).lower()), []).append(str(column))
+    clashes = [f"{', '.join(given)} (all {field})" for field, given in names.items() if len(given) > 1]
+    if clashes:
+        raise ValueError(f"fields given more than once: {'; '.join(clashes)}")
+    raw.columns = list(names)
+
+    if len(raw) > MAX_BATCH_ROWS:
+        raise ValueError(f'batch of {len(raw)} rows exceeds the limit of {MAX_BATCH_ROWS}')
+
+    frame = pd.DataFrame(index=raw.index)
+    for field in fields:
+        column = raw[field] if field in raw.columns else pd.Series(np.nan, index=raw.index)
+        frame[field] = pd.to_numeric(column, errors='coerce').astype(float)
+        if field in defaults:
+            frame[field] = frame[field].fillna(defaults[field])
+
+    # Rows with missing or non-numeric inputs are reported, not scored
+    invalid = ~np.isfinite(frame.to_numpy()).all(axis=1)
+    for i in np.flatnonzero(invalid):
+        if i not in errors:
+            bad = [f for f in fields if not np.isfinite(frame.iat[i, fields.index(f)])]
+            errors[int(i)] = f"invalid or missing: {', '.join(bad)}"
+
+    ids = raw[id_field].tolist() if id_field in raw.columns else [None] * len(raw)
+    return frame, ids, errors
+
+
+def _assemble(n_rows, ids, errors, scored_index, scored_rows):
+    """Merge scored rows and errors back into input order"""
+    results = [None] * n_rows
+    for i, row in zip(scored_index, scored_rows):
+        results[i] = row
+    for i, message in errors.items():
+        results[i] = {'index': i, 'error': message}
+    for i, result in enumerate(results):
+        result['index'] = i
+        if ids[i] is not None and not (isinstance(ids[i], float) and np.isnan(ids[i])):
+            result['cow_id'] = ids[i]
+    return results
+
+
+def _add_explanations(result, explainer, name, features, scored):
+    """Attach per-row feature contributions, computed for the whole batch in one pass"""
+    explanations = explainer.explain_batch(name, features)
+    for row, explanation in zip(scored, explanations):
+        row['contributions'] = explanation['contributions']
+    if explanations:
+        result['explanation'] = {key: explanations[0][key] for key in ('method', 'scale', 'base_value')}
+    return result
+
+
+def score_milk_batch(payload, explain=False, farm=None):
+    """Predict milk yield for every valid row with a single pipeline call
+
+    With explain=True every scored row also gets its per-feature contributions.
+    farm (default: the default farm) picks the models.
+    """
+    farm = farm or tenants.default
+    registry = farm.registry
+    frame, ids, errors = batch_frame(payload, MILK_INPUT_FIELDS)
+    features = milk_feature_frame(frame['feed_kg'], frame['temp_c'],
+                                  frame['humidity'], frame['milking_time'])
+
+    # e.g. humidity of -1 makes temp_humidity_ratio infinite
+    usable = np.isfinite(features.to_numpy()).all(axis=1)
+    for i in np.flatnonzero(~usable):
+        errors.setdefault(int(i), 'inputs produce a non-finite temp_humidity_ratio')
+    valid = np.flatnonzero(usable)
+
+    scored = []
+    if valid.size:
+        predictions = registry.predict('milk', features.iloc[valid])
+        scored = [{'predicted_milk': round(float(p), 2)} for p in predictions]
+
+    result = {
+        'success': True,
+        'count': len(frame),
+        'errors': len(errors),
+        'model_version': registry.version('milk'),
+        'results': _assemble(len(frame), ids, errors, valid, scored),
+    }
+    if explain and valid.size:
+        _add_explanations(result, farm.explainer, 'milk', features.iloc[valid], scored)
+    return result
+
+
+def score_disease_batch(payload, explain=False, farm=None, engine=None):
+    """Mastitis probability for every valid row with a single classifier call
+
+    If the model uses rolling features, rows also need cow_id and day (and
+    optionally previous_mastitis). Batches are usually historical exports, so
+    their rolling features come from the rows themselves on a throwaway engine
+    (or `engine`, to carry one upload across chunks) and the live herd state is
+    left alone. With explain=True every scored row also gets its per-feature
+    contributions. farm (default: the default farm) picks the models.
+    """
+    farm = farm or tenants.default
+    registry = farm.registry
+    rolling = uses_rolling_features(registry.features('disease'))
+    fields = DISEASE_INPUT_FIELDS + (HISTORY_FIELDS if rolling else [])
+    frame, ids, errors = batch_frame(payload, fields, defaults=dict(DISEASE_DEFAULTS, **HISTORY_DEFAULTS))
+    if rolling:
+        for i, cow_id in enumerate(ids):
+            if cow_id is None or (isinstance(cow_id, float) and np.isnan(cow_id)):
+                errors.setdefault(i, 'cow_id is required for rolling features')
+    valid = np.setdiff1d(np.arange(len(frame)), list(errors)).astype(int)
+
+    scored = []
+    if valid.size:
+        values = frame[DISEASE_INPUT_FIELDS].iloc[valid].to_numpy()
+        features = pd.DataFrame(values, columns=DISEASE_FEATURES)
+        if rolling:
+            history = frame.iloc[valid]
+            engine = engine or RollingFeatureEngine()
+            features = engine.frame(features, [ids[i] for i in valid], history['day'], history['previous_mastitis'])
+        probability = registry.predict_proba('disease', features)
+        derived = udder_features(values[:, :8])
+        risk = np.select([probability >= HIGH_RISK_THRESHOLD, probability >= MEDIUM_RISK_THRESHOLD],
+                         ['high', 'medium'], default='low')
+
+        scored = [
+            {
+                'probability': round(float(p), 3),
+                'risk_level': str(level),
+                'avg_all_sensors': round(float(avg), 2),
+                'max_diff': round(float(diff), 2),
+            }
+            for p, level, avg, diff in zip(probability, risk, derived['avg_all_sensors'], derived['max_diff'])
+        ]
+
+    result = {
+        'success': True,
+        'count': len(frame),
+        'errors': len(errors),
+        'model_version': registry.version('disease'),
+        'results': _assemble(len(frame), ids, errors, valid, scored),
+    }
+    if explain and valid.size:
+        _add_explanations(result, farm.explainer, 'disease', features, scored)
+    return result
+
+
+SCORERS = {
+    'milk': score_milk_batch,
+    'disease': score_disease_batch,
+}
+
+# Columns appended to each row of a scored CSV, in order; every chunk writes all of them
+# (blank where a row has no value) so they stay under the header the first chunk wrote
+SCORE_COLUMNS = {
+    'milk': ['predicted_milk', 'error'],
+    'disease': ['probability', 'risk_level', 'avg_all_sensors', 'max_diff', 'error'],
+}
+
+
+def stream_scored_csv(stream, model, output_format='csv', chunk_rows=UPLOAD_CHUNK_ROWS, farm=None):
+    """Score an uploaded herd CSV chunk by chunk, returning a generator of output text
+
+    Only one chunk of input and output is held in memory at a time, so memory
+    stays flat regardless of file size. CSV output echoes the input columns
+    with the scores appended; NDJSON output yields one result object per row.
+    """
+    if model not in SCORERS:
+        raise ValueError(f"unknown model '{model}', expected one of {sorted(SCORERS)}")
+    if output_format not in ('csv', 'ndjson'):
+        raise ValueError("format must be 'csv' or 'ndjson'")
+    chunk_rows = max(1, min(int(chunk_rows), MAX_BATCH_ROWS))
+    return _scored_chunks(stream, SCORERS[model], SCORE_COLUMNS[model], output_format, chunk_rows, farm)
+
+
+def _scored_chunks(stream, score, columns, output_format, chunk_rows, farm=None):
+    offset = 0
+    # One upload is one history: its chunks share a rolling engine
+    options = {'engine': RollingFeatureEngine()} if score is score_disease_batch else {}
+    try:
+        for chunk in pd.read_csv(stream, chunksize=chunk_rows):
+            results = score(chunk, farm=farm, **options)['results']
+            for result in results:
+                result['index'] += offset
+
+            if output_format == 'ndjson':
+                yield ''.join(json.dumps(result) + '\n' for result in results)
+            else:
+                scores = pd.DataFrame(results).reindex(columns=columns)
+                out = chunk.reset_index(drop=True).join(scores, rsuffix='_scored')
+                yield out.to_csv(index=False, header=offset == 0)
+            offset += len(chunk)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        if output_format == 'ndjson':
+            yield json.dumps({'error': str(e), 'rows_scored': offset}) + '\n'
+        else:
+            yield f'# error after {offset} rows: {e}\n'
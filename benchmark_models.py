@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Training and inference benchmarks for the Smart Dairy Farm Management System
+Sweeps model family, dataset size, n_estimators and n_jobs over synthetic herds
+scaled up from the bundled CSVs and writes JSON results that can be compared
+between commits
+
+Usage:
+    python train_models.py --benchmark --scales 1,10 --estimators 50,100 --jobs 1,-1
+    python train_models.py --benchmark --families forest,hgb,lightgbm --jobs -1
+    python benchmark_models.py --compare benchmarks/old.json benchmarks/new.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.metrics import r2_score, accuracy_score
+from sklearn.model_selection import train_test_split
+
+import train_models
+
+# Columns perturbed when resampling rows into a larger synthetic herd
+JITTER_COLUMNS = {
+    'milk': ['Feed_kg', 'Temp_C', 'Humidity', 'Milking_Time_min', 'Milk_Liters'],
+    'disease': ['IUFL', 'EUFL', 'IUFR', 'EUFR', 'IURL', 'EURL', 'IURR', 'EURR', 'Temperature'],
+}
+
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 1000
+
+# Metrics compared by --compare; a ratio above the threshold is a regression
+COMPARED_METRICS = ['fit_seconds', 'single_row_ms_p50', 'serving_row_ms', 'batch_ms', 'model_bytes', 'peak_rss_mb']
+
+
+def synthesize_herd(df, n_rows, jitter_cols, seed=42):
+    """Resample rows with small Gaussian jitter, giving each copy of the herd new cow IDs"""
+    rng = np.random.default_rng(seed)
+    out = df.iloc[rng.integers(0, len(df), n_rows)].reset_index(drop=True)
+    for col in jitter_cols:
+        out[col] = out[col] + rng.normal(0, 0.05 * df[col].std(), n_rows)
+    out['Cow_ID'] = out['Cow_ID'].astype(str) + '_' + (np.arange(n_rows) // len(df)).astype(str)
+    return out
+
+
+def _rss_mb():
+    """Current resident set size, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def benchmark_one(model, scale, n_estimators, n_jobs, family='forest'):
+    """Train and time one configuration; runs in a fresh process so peak RSS is its own"""
+    if model == 'milk':
+        source, prepare, build, score = train_models.MILK_DATA, train_models.prepare_milk_data, train_models.build_milk_pipeline, r2_score
+    else:
+        source, prepare, build, score = train_models.DISEASE_DATA, train_models.prepare_disease_data, train_models.build_disease_pipeline, accuracy_score
+
+    base = pd.read_csv(source)
+    df = synthesize_herd(base, int(len(base) * scale), JITTER_COLUMNS[model]) if scale != 1 else base
+    X, y = prepare(df)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    pipeline = build(n_estimators=n_estimators, n_jobs=n_jobs, family=family)
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+    peak = _peak_rss_mb()
+
+    # Serving-shaped calls: one-row DataFrame, then a herd-sized batch
+    row = X_test.iloc[:1]
+    pipeline.predict(row)
+    timings = []
+    for _ in range(SINGLE_ROW_REPEATS):
+        started = time.perf_counter()
+        pipeline.predict(row)
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+
+    # How the registry would serve it: flat export for forests, the pipeline otherwise
+    serving_ms = train_models.serving_latency_ms(pipeline, X_test, model == 'disease', SINGLE_ROW_REPEATS)
+
+    batch = X_test.iloc[np.arange(BATCH_ROWS) % len(X_test)]
+    started = time.perf_counter()
+    pipeline.predict(batch)
+    batch_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        'model': model,
+        'family': family,
+        'rows': len(df),
+        'n_estimators': n_estimators,
+        'n_jobs': n_jobs,
+        'fit_seconds': round(fit_seconds, 4),
+        'score': round(float(score(y_test, pipeline.predict(X_test))), 4),
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        'fit_rss_delta_mb': round(peak - rss_before, 1) if peak is not None and rss_before is not None else None,
+        'model_bytes': len(pickle.dumps(pipeline)),
+        'single_row_ms_p50': round(float(np.percentile(timings, 50)), 4),
+        'single_row_ms_p95': round(float(np.percentile(timings, 95)), 4),
+        'serving_row_ms': round(serving_ms, 4),
+        'batch_rows': BATCH_ROWS,
+        'batch_ms': round(batch_ms, 3),
+        'batch_us_per_row': round(batch_ms * 1000 / BATCH_ROWS, 3),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=(1, 10), estimators=(50, 100), jobs=(1, -1), models=('milk', 'disease'), output='benchmarks',
+                   families=('forest',)):
+    """Run the full sweep and write one JSON file; returns its path"""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for model in models:
+        for family in families:
+            for scale in scales:
+                for n_estimators in estimators:
+                    for n_jobs in jobs:
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                            result = pool.submit(benchmark_one, model, scale, n_estimators, n_jobs, family).result()
+                        results.append(result)
+                        print(f"⏱️  {model:7s} {family:8s} rows={result['rows']:>8d} trees={n_estimators:>4d} "
+                              f"jobs={n_jobs:>3d} fit={result['fit_seconds']:.2f}s "
+                              f"single={result['single_row_ms_p50']:.2f}ms serving={result['serving_row_ms']:.3f}ms "
+                              f"batch={result['batch_us_per_row']:.1f}us/row size={result['model_bytes'] / 1e6:.1f}MB")
+
+    commit = _commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📁 Benchmark results written to {path}")
+    return path
+
+
+def compare(old_path, new_path, threshold=1.5):
+    """Print new/old ratios per configuration; returns True if any metric regressed past the threshold"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def key(r):
+        # Results written before the family sweep were all forests
+        return r['model'], r.get('family', 'forest'), r['rows'], r['n_estimators'], r['n_jobs']
+
+    baseline = {key(r): r for r in old['results']}
+    regressed = False
+    print(f"Comparing {old.get('commit')} -> {new.get('commit')}")
+    for result in new['results']:
+        before = baseline.get(key(result))
+        if before is None:
+            continue
+        ratios = []
+        for metric in COMPARED_METRICS:
+            if before.get(metric) and result.get(metric) is not None:
+                ratio = result[metric] / before[metric]
+                flag = ' ❌' if ratio > threshold else ''
+                regressed = regressed or ratio > threshold
+                ratios.append(f"{metric}={ratio:.2f}x{flag}")
+        print(f"  {result['model']:7s} {result.get('family', 'forest'):8s} rows={result['rows']:>8d} "
+              f"trees={result['n_estimators']:>4d} jobs={result['n_jobs']:>3d}  " + '  '.join(ratios))
+    return regressed
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+
+def add_benchmark_arguments(parser):
+    parser.add_argument('--scales', type=_float_list, default=[1, 10],
+                        help='dataset size multipliers of the bundled CSVs (default: 1,10)')
+    parser.add_argument('--estimators', type=_int_list, default=[50, 100],
+                        help='n_estimators values to sweep (default: 50,100)')
+    parser.add_argument('--jobs', type=_int_list, default=[1, -1],
+                        help='n_jobs values to sweep (default: 1,-1)')
+    parser.add_argument('--models', default='milk,disease', help='models to benchmark (default: milk,disease)')
+    parser.add_argument('--families', default='forest',
+                        help='model families to compare: forest, hgb, xgboost, lightgbm (default: forest)')
+    parser.add_argument('--output', default='benchmarks', help='directory for JSON results')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark model training and inference')
+    add_benchmark_arguments(parser)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=1.5, help='regression ratio for --compare')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, threshold=args.threshold) else 0
+    run_benchmarks(args.scales, args.estimators, args.jobs, args.models.split(','), args.output,
+                   args.families.split(','))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Shared test setup: every store (prediction history, analytics, sensors, herd
+state, reports and farms) points at a temporary directory before any module
+opens it, so the farm's own data is left untouched. Farms north and south get
+API keys in a generated farms.json.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+DATA_DIR = tempfile.mkdtemp(prefix='cattle_test_')
+API_KEYS = {'north': 'north-test-key', 'south': 'south-test-key'}
+
+os.environ.update({
+    'CATTLE_HISTORY_DB': os.path.join(DATA_DIR, 'prediction_history.db'),
+    'CATTLE_ANALYTICS_DB': os.path.join(DATA_DIR, 'farm_analytics.db'),
+    'CATTLE_SENSOR_DIR': os.path.join(DATA_DIR, 'sensor_data'),
+    'CATTLE_HERD_STATE': os.path.join(DATA_DIR, 'herd_state.npz'),
+    'CATTLE_HERD_STATE_DB': os.path.join(DATA_DIR, 'herd_state.db'),
+    'CATTLE_REPORT_DIR': os.path.join(DATA_DIR, 'report_cache'),
+    'CATTLE_FARMS_DIR': os.path.join(DATA_DIR, 'farms'),
+    'CATTLE_FARMS_FILE': os.path.join(DATA_DIR, 'farms.json'),
+})
+
+# tenancy.py reads farms.json on import, so the digests are made here (see tenancy.hash_api_key)
+with open(os.environ['CATTLE_FARMS_FILE'], 'w') as f:
+    json.dump({'farms': {farm_id: {'name': farm_id.title(), 'api_keys': {'tests': hashlib.sha256(key.encode()).hexdigest()}}
+                         for farm_id, key in API_KEYS.items()}}, f)
+for farm_id in API_KEYS:
+    os.makedirs(os.path.join(DATA_DIR, 'farms', farm_id))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Model explanations for the Smart Dairy Farm Management System
+Per-feature contributions to a milk or mastitis prediction: exact TreeSHAP when
+shap is installed, otherwise path attribution over the flat forest (every split
+on a row's path credits its change in the node mean to the split feature, so
+the contributions plus the base value add up to the prediction). Single rows are
+explained on a background thread pool and cached by model version and rounded
+features; a scored batch is explained in one vectorized walk.
+"""
+
+import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from flat_forest import FlatForest, WALK_BLOCK_ROWS, flatten_pipeline, model_family
+from model_registry import MODEL_FILES, ModelValidationError, registry
+from prediction_cache import PredictionCache, CACHE_DECIMALS, cache_key
+
+# 'auto' uses shap when installed, 'path' never does, 'shap' requires it
+EXPLAIN_METHOD = os.environ.get('CATTLE_EXPLAIN_METHOD', 'auto')
+
+# Background threads computing single-row explanations, and the queue length past
+# which predictions stop prefetching them (a poll still queues one on demand)
+EXPLAIN_WORKERS = int(os.environ.get('CATTLE_EXPLAIN_WORKERS', 2))
+MAX_PENDING = 100
+
+# Explanations only change with the model, so they are kept longer than predictions
+EXPLAIN_CACHE_SIZE = int(os.environ.get('CATTLE_EXPLAIN_CACHE_SIZE', 2000))
+EXPLAIN_CACHE_TTL = float(os.environ.get('CATTLE_EXPLAIN_CACHE_TTL', 3600))
+
+
+def path_contributions(forest, X, output=0):
+    """(base value, contributions of shape (n_rows, n_features)) from a FlatForest
+
+    All (row, tree) paths advance one level per step; each step's change in the
+    node value is summed into (row, split feature) with one bincount. Leaves loop
+    on themselves, so steps past a leaf add nothing.
+    """
+    X = forest.transform(X).astype(np.float64)
+    n_rows, n_features = X.shape
+    n_trees = len(forest.roots)
+    values = forest.value[output]
+    next_nodes = forest.children.ravel()
+    flat_X = X.ravel()
+    contributions = np.zeros(n_rows * n_features)
+    for start in range(0, n_rows, WALK_BLOCK_ROWS):
+        block = min(WALK_BLOCK_ROWS, n_rows - start)
+        nodes = np.tile(forest.roots.astype(np.int64), block)
+        offsets = np.repeat(np.arange(start, start + block, dtype=np.int64) * n_features, n_trees)
+        for _ in range(forest.depth):
+            slots = offsets + forest.feature.take(nodes)
+            children = next_nodes.take(2 * nodes + (flat_X.take(slots) <= forest.threshold.take(nodes)))
+            contributions += np.bincount(slots, weights=values.take(children) - values.take(nodes),
+                                         minlength=n_rows * n_features)
+            nodes = children
+    base = float(values.take(forest.roots).mean())
+    return base, contributions.reshape(n_rows, n_features) / n_trees
+
+
+def shap_contributions(explainer, preprocess, columns, X, output=-1):
+    """(base value, contributions) from a shap.TreeExplainer on the pipeline's final model"""
+    values = explainer.shap_values(preprocess.transform(pd.DataFrame(X, columns=columns)))
+    base = np.ravel(explainer.expected_value)
+    # Classifiers give one array per class (a list, or a trailing axis in newer shap)
+    if isinstance(values, list):
+        values, base = values[output], base[output]
+    elif np.ndim(values) == 3:
+        values, base = values[:, :, output], base[output]
+    else:
+        base = base[0]
+    return float(base), np.asarray(values)
+
+
+_pool = None
+_pool_pid = None
+
+
+def _executor(workers=EXPLAIN_WORKERS):
+    """The process's explanation thread pool, shared by every farm's Explainer"""
+    global _pool, _pool_pid
+    # Threads do not survive serve.py's fork, so each worker process starts its own pool
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='explain')
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def explanation_id(name, version, row, decimals=CACHE_DECIMALS):
+    """Self-contained ID for one row's explanation: any worker can decode and compute it"""
+    values = np.round(np.asarray(row, dtype=np.float64).ravel(), decimals) + 0.0
+    token = base64.urlsafe_b64encode(values.tobytes()).decode().rstrip('=')
+    return f"{name}.{hashlib.sha1(str(version).encode()).hexdigest()[:8]}.{token}"
+
+
+class Explainer:
+    """Computes and caches explanations for the models held by a ModelRegistry"""
+
+    def __init__(self, registry, method=EXPLAIN_METHOD, workers=EXPLAIN_WORKERS):
+        self.registry = registry
+        self.method = method
+        self.workers = workers
+        self.cache = PredictionCache(EXPLAIN_CACHE_SIZE, EXPLAIN_CACHE_TTL)
+        self._backends = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        return _executor(self.workers)
+
+    def _use_shap(self):
+        if self.method == 'path':
+            return False
+        try:
+            import shap  # noqa: F401
+            return True
+        except ImportError:
+            if self.method == 'shap':
+                raise ModelValidationError("CATTLE_EXPLAIN_METHOD=shap but shap is not installed")
+            return False
+
+    def _build(self, name):
+        model = self.registry.get(name)
+        if model is None:
+            raise ModelValidationError(f"{name} model is not loaded")
+        columns = self.registry.features(name)
+        is_classifier = hasattr(model, 'classes_')
+        family = model_family(model)
+        if is_classifier:
+            scale = 'probability' if family == 'forest' else 'log_odds'
+        else:
+            scale = 'litres'
+
+        if self._use_shap():
+            import shap
+            # TreeSHAP needs the sklearn estimator, so read the pickle behind a flat export
+            pipeline = self.registry.pipeline(name)
+            explainer = shap.TreeExplainer(pipeline.steps[-1][1])
+            return 'shap', scale, lambda X: shap_contributions(explainer, pipeline[:-1], columns, X)
+
+        if family != 'forest':
+            raise ModelValidationError(f"{name} model is {family}; install shap to explain it")
+        forest = model if isinstance(model, FlatForest) else FlatForest(*flatten_pipeline(model))
+        output = 1 if is_classifier else 0
+        return 'path', scale, lambda X: path_contributions(forest, X, output)
+
+    def _backend(self, name):
+        version = self.registry.version(name)
+        with self._lock:
+            backend = self._backends.get(name)
+            if backend is None or backend[0] != version:
+                backend = self._backends[name] = (version, *self._build(name))
+        return backend[1:]
+
+    def explain_batch(self, name, X):
+        """Explanations for many rows of one model from a single vectorized pass"""
+        columns = self.registry.features(name)
+        if isinstance(X, pd.DataFrame):
+            X = X[columns].to_numpy()
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(columns))
+        method, scale, contributions = self._backend(name)
+        base, values = contributions(X)
+        version = self.registry.version(name)
+        explanations = []
+        for row in values:
+            order = np.argsort(-np.abs(row), kind='stable')
+            explanations.append({
+                'model': name,
+                'model_version': version,
+                'method': method,
+                'scale': scale,
+                'base_value': round(base, 4),
+                'prediction': round(base + float(row.sum()), 4),
+                'contributions': {columns[i]: round(float(row[i]), 4) for i in order},
+                # Largest effect first (JSON encoders may sort the contributions' keys)
+                'top_features': [columns[i] for i in order],
+            })
+        return explanations
+
+    def _run(self, key, name, row):
+        try:
+            self.cache.put(key, self.explain_batch(name, [row])[0])
+        except Exception as e:
+            self.cache.put(key, {'error': str(e)})
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _queue(self, key, name, row, prefetch):
+        with self._lock:
+            if key in self._pending or (prefetch and len(self._pending) >= MAX_PENDING):
+                return
+            self._pending.add(key)
+        self._executor().submit(self._run, key, name, row)
+
+    def submit(self, name, row):
+        """Start explaining a just-predicted row in the background and return its explanation ID"""
+        version = self.registry.version(name)
+        key = cache_key(name, version, row)
+        if self.cache.get(key) is None:
+            self._queue(key, name, row, prefetch=True)
+        return explanation_id(name, version, row)
+
+    def lookup(self, explanation):
+        """Status of an explanation ID: done (with the explanation), pending, failed or unknown"""
+        try:
+            name, version_hash, token = explanation.split('.', 2)
+            row = np.frombuffer(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)), dtype=np.float64)
+        except ValueError:
+            return {'status': 'unknown', 'error': 'malformed explanation id'}
+        if name not in MODEL_FILES or not self.registry.is_loaded(name) or len(row) != len(self.registry.features(name)):
+            return {'status': 'unknown', 'error': 'no such model or feature count'}
+        version = self.registry.version(name)
+        if hashlib.sha1(str(version).encode()).hexdigest()[:8] != version_hash:
+            return {'status': 'unknown', 'error': 'the model has been replaced since this prediction'}
+
+        key = cache_key(name, version, row)
+        cached = self.cache.get(key)
+        if cached is None:
+            self._queue(key, name, row, prefetch=False)
+            return {'status': 'pending'}
+        if 'error' in cached:
+            return {'status': 'failed', 'error': cached['error']}
+        return {'status': 'done', 'explanation': cached}
+
+    def stats(self, name=None):
+        with self._lock:
+            pending = len(self._pending)
+            methods = {model: backend[1] for model, backend in self._backends.items()}
+        return {
+            **self.cache.stats(name),
+            'pending': pending,
+            'workers': self.workers,
+            'method': methods.get(name) if name is not None else methods,
+        }
+
+
+# One explainer per worker process; its pool starts on first use
+explainer = Explainer(registry)
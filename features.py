@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Feature engineering shared by training and serving
+Everything here works on whole columns so a herd is processed in one pass
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+# Feature order the pipelines are fitted with
+MILK_FEATURES = ['Feed_kg', 'Milking_Time_min', 'temp_humidity_ratio']
+DISEASE_FEATURES = ['IUFL', 'EUFL', 'IUFR', 'EUFR', 'IURL', 'EURL', 'IURR', 'EURR',
+                    'Temperature', 'Hardness', 'Pain', 'Milk_visibility']
+
+# Internal (I*) and external (E*) readings per udder quarter: front/rear, left/right
+QUARTER_SENSORS = {
+    'fl': ('IUFL', 'EUFL'),
+    'fr': ('IUFR', 'EUFR'),
+    'rl': ('IURL', 'EURL'),
+    'rr': ('IURR', 'EURR'),
+}
+SENSOR_COLUMNS = DISEASE_FEATURES[:8]
+
+
+def temp_humidity_ratio(temp_c, humidity):
+    """Heat-stress feature from the notebook, for scalars or arrays"""
+    return temp_c / (humidity + 1)
+
+
+def milk_feature_frame(feed_kg, temp_c, humidity, milking_time):
+    """Build the milk model's input frame from raw columns"""
+    # Bad rows (e.g. humidity of -1) become inf/NaN and are rejected by the caller
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = temp_humidity_ratio(np.asarray(temp_c, dtype=float), np.asarray(humidity, dtype=float))
+    return pd.DataFrame({
+        'Feed_kg': np.asarray(feed_kg, dtype=float),
+        'Milking_Time_min': np.asarray(milking_time, dtype=float),
+        'temp_humidity_ratio': ratio,
+    }, columns=MILK_FEATURES)
+
+
+def udder_features(sensors):
+    """Derived inflammation indicators from the notebook for an (n, 8) sensor array
+
+    Columns must follow SENSOR_COLUMNS. Returns avg_all_sensors, the four
+    internal-minus-external quarter deltas and the largest absolute delta.
+    """
+    sensors = np.asarray(sensors, dtype=float).reshape(-1, len(SENSOR_COLUMNS))
+    internal = sensors[:, 0::2]
+    external = sensors[:, 1::2]
+    diffs = internal - external
+    derived = {'avg_all_sensors': sensors.mean(axis=1)}
+    for j, quarter in enumerate(QUARTER_SENSORS):
+        derived[f'diff_{quarter}'] = diffs[:, j]
+    derived['max_diff'] = np.abs(diffs).max(axis=1)
+    return derived
+
+
+class IQRClipper(BaseEstimator, TransformerMixin):
+    """Clip each column to [q1 - k*iqr, q3 + k*iqr] learned at fit time
+
+    Used as the first pipeline step so the training bounds are pickled with the
+    model and applied to serving batches in a single vectorized np.clip.
+    """
+
+    def __init__(self, whisker=1.5):
+        self.whisker = whisker
+
+    def fit(self, X, y=None):
+        if hasattr(X, 'columns'):
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        values = np.asarray(X, dtype=float)
+        self.n_features_in_ = values.shape[1]
+        q1, q3 = np.nanpercentile(values, [25, 75], axis=0)
+        iqr = q3 - q1
+        self.lower_ = q1 - self.whisker * iqr
+        self.upper_ = q3 + self.whisker * iqr
+        return self
+
+    def transform(self, X):
+        return np.clip(np.asarray(X, dtype=float), self.lower_, self.upper_)
+
+    def get_feature_names_out(self, input_features=None):
+        if input_features is not None:
+            return np.asarray(input_features, dtype=object)
+        return getattr(self, 'feature_names_in_', None)
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Flat, memory-mappable tree ensembles for the Smart Dairy Farm Management System
+A trained forest pipeline is exported as contiguous NumPy node tables (feature,
+threshold, children, leaf values) that every worker maps from the page cache,
+and scored by walking all trees for a whole batch with array operations
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, ExtraTreesClassifier, ExtraTreesRegressor
+from sklearn.preprocessing import StandardScaler
+
+from features import IQRClipper
+
+FLAT_DIR = 'flat_models'
+META_FILE = 'meta.json'
+ARRAYS = ['feature', 'threshold', 'children', 'leaf', 'value', 'roots', 'clip_lower', 'clip_upper', 'mean', 'scale']
+
+# Rows walked together; bounds the (rows x trees) temporaries and keeps them in cache
+WALK_BLOCK_ROWS = 1024
+
+# Single rows compare every node at once when there are at most this many nodes per
+# level of depth; past that, walking only the visited nodes is cheaper
+ALL_NODES_PER_LEVEL = 1000
+
+SUPPORTED_FORESTS = (RandomForestClassifier, RandomForestRegressor, ExtraTreesClassifier, ExtraTreesRegressor)
+
+
+def model_family(model):
+    """'forest', 'hgb', 'xgboost', 'lightgbm' or the class name, for a pipeline, estimator or FlatForest"""
+    if hasattr(model, 'steps'):
+        model = model.steps[-1][1]
+    if isinstance(model, SUPPORTED_FORESTS + (FlatForest,)):
+        return 'forest'
+    name = type(model).__name__
+    if name.startswith('HistGradientBoosting'):
+        return 'hgb'
+    module = type(model).__module__.split('.')[0]
+    return module if module in ('xgboost', 'lightgbm') else name
+
+
+def _preprocessing(steps, n_features):
+    """Collapse IQRClipper / StandardScaler steps into clip bounds plus mean/scale arrays"""
+    clip_lower = np.full(n_features, -np.inf)
+    clip_upper = np.full(n_features, np.inf)
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    scaled = False
+    for name, step in steps:
+        if isinstance(step, IQRClipper) and not scaled:
+            clip_lower, clip_upper = np.asarray(step.lower_, float), np.asarray(step.upper_, float)
+        elif isinstance(step, StandardScaler) and not scaled:
+            if step.mean_ is not None:
+                mean = np.asarray(step.mean_, float)
+            if step.scale_ is not None:
+                scale = np.asarray(step.scale_, float)
+            scaled = True
+        else:
+            raise ValueError(f"cannot flatten pipeline step '{name}' ({type(step).__name__})")
+    return clip_lower, clip_upper, mean, scale
+
+
+def flatten_pipeline(pipeline):
+    """Node tables and metadata for a [IQRClipper] -> [StandardScaler] -> forest pipeline"""
+    steps = list(pipeline.steps) if hasattr(pipeline, 'steps') else [('model', pipeline)]
+    forest = steps[-1][1]
+    if not isinstance(forest, SUPPORTED_FORESTS):
+        raise ValueError(f"cannot flatten {type(forest).__name__}; only forests are supported")
+    if getattr(forest, 'n_outputs_', 1) != 1:
+        raise ValueError("multi-output forests are not supported")
+
+    is_classifier = hasattr(forest, 'classes_')
+    features, thresholds, children, leaves, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        leaf = tree.children_left < 0
+        node_ids = np.arange(n) + offset
+        # Children are stored as [right, left] so the x <= threshold bit indexes the next node;
+        # leaves point at themselves, so extra walk steps past a leaf are no-ops
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        children.append(np.stack([np.where(leaf, node_ids, tree.children_right + offset),
+                                  np.where(leaf, node_ids, tree.children_left + offset)], axis=1).astype(np.int32))
+        leaves.append(leaf)
+        value = tree.value[:, 0, :]
+        if is_classifier:
+            # Older sklearn stores class counts, newer stores fractions; normalize both
+            value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-300)
+        values.append(value)
+        roots.append(offset)
+        offset += n
+
+    n_features = forest.n_features_in_
+    clip_lower, clip_upper, mean, scale = _preprocessing(steps[:-1], n_features)
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'children': np.concatenate(children),
+        'leaf': np.concatenate(leaves),
+        # One contiguous row of node values per class (a single row for regressors)
+        'value': np.ascontiguousarray(np.concatenate(values).T),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'clip_lower': clip_lower,
+        'clip_upper': clip_upper,
+        'mean': mean,
+        'scale': scale,
+    }
+    names = getattr(pipeline, 'feature_names_in_', None)
+    meta = {
+        'kind': 'classifier' if is_classifier else 'regressor',
+        'n_trees': len(forest.estimators_),
+        'n_nodes': int(offset),
+        'n_features': int(n_features),
+        'max_depth': int(max(e.tree_.max_depth for e in forest.estimators_)),
+        'feature_names': [str(n) for n in names] if names is not None else None,
+        'classes': [c.item() if hasattr(c, 'item') else c for c in forest.classes_] if is_classifier else None,
+    }
+    return arrays, meta
+
+
+def export_pipeline(pipeline, directory, version=None):
+    """Write a pipeline's node tables as .npy files plus meta.json
+
+    Array files carry a unique tag and meta.json is replaced last, so workers
+    that already mapped the previous export keep a consistent set of files.
+    """
+    arrays, meta = flatten_pipeline(pipeline)
+    os.makedirs(directory, exist_ok=True)
+    tag = f"{int(time.time() * 1000):x}{os.getpid():x}"
+    meta['version'] = version
+    meta['files'] = {}
+    for name, array in arrays.items():
+        filename = f'{name}-{tag}.npy'
+        np.save(os.path.join(directory, filename), array)
+        meta['files'][name] = filename
+
+    meta_path = os.path.join(directory, META_FILE)
+    previous = set()
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            previous = set(json.load(f).get('files', {}).values())
+    partial = f'{meta_path}.{os.getpid()}.partial'
+    with open(partial, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(partial, meta_path)
+
+    # Unlinking keeps existing mappings valid on POSIX; Windows refuses while mapped
+    for filename in previous - set(meta['files'].values()):
+        try:
+            os.remove(os.path.join(directory, filename))
+        except OSError:
+            pass
+    return meta
+
+
+def remove_export(directory):
+    """Delete a flat export so the registry serves the pickled model instead"""
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        files = json.load(f).get('files', {}).values()
+    # meta.json goes first so no worker maps a half-deleted export
+    os.remove(meta_path)
+    for filename in files:
+        try:
+            os.remove(os.path.join(directory, filename))
+        except OSError:
+            pass
+    return True
+
+
+def export_flat_models(bundle, model_dir='.'):
+    """Export both pipelines of an ensemble bundle; unsupported models are skipped"""
+    exported = {}
+    for name in ('milk', 'disease'):
+        directory = os.path.join(model_dir, FLAT_DIR, name)
+        model = bundle[f'{name}_model']
+        if model_family(model) != 'forest':
+            # Boosted models are served from the pickle; drop any forest export they replace
+            remove_export(directory)
+            print(f"ℹ️  {name} model is {model_family(model)}; it is served from the pickle")
+            exported[name] = False
+            continue
+        try:
+            export_pipeline(model, directory, version=bundle.get('trained_date') or bundle.get('version'))
+            exported[name] = True
+        except ValueError as e:
+            print(f"⚠️  {name} model not exported as a flat forest: {e}")
+            exported[name] = False
+    return exported
+
+
+class FlatForest:
+    """Batch inference over exported node tables, with the predict/predict_proba API of the pipeline"""
+
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        # Plain ndarray views of the maps: same shared pages, cheaper fancy indexing than np.memmap
+        for name in ARRAYS:
+            setattr(self, name, np.asarray(arrays[name]))
+        self._next = self.children.ravel()
+        if meta.get('feature_names'):
+            self.feature_names_in_ = np.asarray(meta['feature_names'], dtype=object)
+        self.n_features_in_ = meta['n_features']
+        if meta['kind'] == 'classifier':
+            self.classes_ = np.asarray(meta['classes'])
+        # Leaves point at themselves, so max_depth steps finish every tree
+        self.depth = meta['max_depth']
+        self._all_nodes = meta['n_nodes'] <= ALL_NODES_PER_LEVEL * max(self.depth, 1)
+        if self._all_nodes:
+            self._step_base = np.arange(meta['n_nodes'], dtype=np.int32) * 2
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Map the node tables read-only; pages are shared between worker processes"""
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, filename), mmap_mode='r' if mmap else None)
+                  for name, filename in meta['files'].items()}
+        return cls(arrays, meta)
+
+    def transform(self, X):
+        """Apply the exported clip and scale steps, then cast like sklearn trees do"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features_in_)
+        X = (np.clip(X, self.clip_lower, self.clip_upper) - self.mean) / self.scale
+        return X.astype(np.float32)
+
+    def leaves(self, X):
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)"""
+        X = self.transform(X)
+        if len(X) == 1:
+            return self._row_leaves(X[0])[None, :].astype(np.int64)
+        return self._block_leaves(X)
+
+    def _row_leaves(self, x):
+        """Leaf index per tree for one transformed row
+
+        Every tree takes exactly max_depth steps (finished paths loop on their leaf),
+        which for one row costs fewer NumPy calls than dropping finished paths.
+        Small forests first resolve every node's branch in one comparison, leaving
+        one lookup per level.
+        """
+        # Compare in float64 on the float32-rounded inputs, as sklearn does
+        x = x.astype(np.float64)
+        nodes = self.roots
+        if self._all_nodes:
+            step = self._next.take(self._step_base + (x.take(self.feature) <= self.threshold))
+            for _ in range(self.depth):
+                nodes = step.take(nodes)
+            return nodes
+        for _ in range(self.depth):
+            go_left = x.take(self.feature.take(nodes)) <= self.threshold.take(nodes)
+            nodes = self._next.take(nodes + nodes + go_left)
+        return nodes
+
+    def _block_leaves(self, X):
+        """Leaves for many transformed rows
+
+        All (row, tree) paths of a block advance one level per step; paths that
+        reach a leaf are written out and dropped, so work follows the actual
+        path lengths rather than the deepest tree.
+        """
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        flat_X = X.ravel()
+        out = np.empty(n_rows * n_trees, dtype=np.int64)
+        for start in range(0, n_rows, WALK_BLOCK_ROWS):
+            block = min(WALK_BLOCK_ROWS, n_rows - start)
+            nodes = np.tile(self.roots.astype(np.int64), block)
+            offsets = np.repeat(np.arange(start, start + block, dtype=np.int64) * n_features, n_trees)
+            slots = np.arange(start * n_trees, (start + block) * n_trees)
+            while slots.size:
+                go_left = flat_X.take(offsets + self.feature.take(nodes)) <= self.threshold.take(nodes)
+                nodes = self._next.take(2 * nodes + go_left)
+                walking = ~self.leaf.take(nodes)
+                if not walking.all():
+                    out[slots[~walking]] = nodes[~walking]
+                    slots, nodes, offsets = slots[walking], nodes[walking], offsets[walking]
+        return out.reshape(n_rows, n_trees)
+
+    def _tree_mean(self, X):
+        X = self.transform(X)
+        if len(X) == 1:
+            # Interactive single-row calls: no block bookkeeping, no temporaries per level
+            leaves = self._row_leaves(X[0])
+            return np.array([[row.take(leaves).sum() / len(leaves) for row in self.value]])
+        leaves = self._block_leaves(X)
+        return np.stack([row.take(leaves).mean(axis=1) for row in self.value], axis=1)
+
+    def predict(self, X):
+        mean = self._tree_mean(X)
+        if self.meta['kind'] == 'classifier':
+            return self.classes_[mean.argmax(axis=1)]
+        return mean[:, 0]
+
+    def predict_proba(self, X):
+        if self.meta['kind'] != 'classifier':
+            raise AttributeError("regressor has no predict_proba")
+        return self._tree_mean(X)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Milk yield forecasting for the Smart Dairy Farm Management System
+Every cow carries a damped-trend (Holt) level of its weather-adjusted daily yield
+and the sums for its own heat-stress slope against temp_humidity_ratio, shrunk
+towards the herd's. The state lives in flat per-cow arrays fed from the
+herd_analytics rollups: a new day is one vectorized step for the whole herd, and
+a 1-30 day forecast for every cow is one array expression over (cows, days).
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from herd_analytics import herd_analytics
+
+DEFAULT_HORIZON = 7
+MAX_HORIZON = 30
+
+# Holt smoothing: weight of a new day in the level, in the trend, and the per-day trend damping
+LEVEL_ALPHA = 0.3
+TREND_BETA = 0.05
+DAMPING = 0.9
+
+# Weight of a new one-step error in each cow's error variance
+VARIANCE_ALPHA = 0.1
+
+# A cow's heat slope counts as this many days of herd-average weather spread until it has its own
+SHRINK_DAYS = 14
+
+# Weight of a new day in the recent herd weather used when no forecast is posted
+RECENT_WEATHER_ALPHA = 0.25
+
+# Cows with no record in this many days before the latest day are left out (sold, dry, culled)
+ACTIVE_DAYS = 14
+
+# z for the 80% forecast band
+INTERVAL_Z = 1.2816
+
+# Rendered forecasts kept per process; any ingest (in any worker) invalidates them
+FORECAST_CACHE_SIZE = 32
+
+STATE_ARRAYS = ['level', 'trend', 'variance', 'errors', 'last_day', 'n', 'sx', 'sy', 'sxx', 'sxy']
+
+
+def _ordinal(day):
+    return datetime.strptime(day, '%Y-%m-%d').toordinal()
+
+
+def damped_steps(steps, damping=DAMPING):
+    """Trend multiplier after `steps` days: damping + damping**2 + ... + damping**steps"""
+    return damping * (1 - damping ** np.asarray(steps, dtype=np.float64)) / (1 - damping)
+
+
+def weather_ratios(weather):
+    """temp_humidity_ratio per forecast day from [{'temp_c': .., 'humidity': ..}, ...]"""
+    ratios = []
+    for i, day in enumerate(weather or []):
+        values = {str(k).strip().lower(): v for k, v in dict(day).items()}
+        temp = values.get('temp_c', values.get('temperature'))
+        if temp is None or values.get('humidity') is None:
+            raise ValueError(f"weather day {i} needs temp_c and humidity")
+        ratios.append(float(temp) / (float(values['humidity']) + 1))
+    return tuple(ratios)
+
+
+class ForecastState:
+    """Per-cow forecast state in flat arrays (one slot per cow, grown by doubling)"""
+
+    def __init__(self, capacity=1024):
+        self.slots = {}
+        self.cow_ids = []
+        self.herd = np.zeros(5)  # n, sum x, sum y, sum xx, sum xy over every cow-day
+        self.recent_x = None
+        self.day = None
+        self._capacity = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        for name in STATE_ARRAYS:
+            array = np.zeros(capacity, np.int64 if name in ('errors', 'last_day', 'n') else np.float64)
+            if self._capacity:
+                array[:self._capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self._capacity = capacity
+
+    def _slots_for(self, cow_ids):
+        slots = np.empty(len(cow_ids), np.int64)
+        for i, cow_id in enumerate(cow_ids):
+            slot = self.slots.get(cow_id)
+            if slot is None:
+                slot = self.slots[cow_id] = len(self.slots)
+                self.cow_ids.append(cow_id)
+            slots[i] = slot
+        if len(self.slots) > self._capacity:
+            self._grow(max(len(self.slots), 2 * self._capacity))
+        return slots
+
+    def copy(self):
+        state = ForecastState.__new__(ForecastState)
+        state.__dict__.update(self.__dict__)
+        state.slots, state.cow_ids, state.herd = dict(self.slots), list(self.cow_ids), self.herd.copy()
+        for name in STATE_ARRAYS:
+            setattr(state, name, getattr(self, name).copy())
+        return state
+
+    def herd_slope(self):
+        """Herd (liters per unit temp_humidity_ratio, variance of the ratio) over all cow-days"""
+        n, sx, sy, sxx, sxy = self.herd
+        vx = n * sxx - sx * sx
+        return (float((n * sxy - sx * sy) / vx) if vx > 0 else 0.0), (float(vx / (n * n)) if n else 0.0)
+
+    def heat_slopes(self, slots):
+        """Each cow's heat slope (ridge-shrunk towards the herd's) and mean ratio"""
+        herd, spread = self.herd_slope()
+        n = np.maximum(self.n[slots], 1)
+        sx, sy = self.sx[slots], self.sy[slots]
+        shrink = SHRINK_DAYS * spread
+        cxx = self.sxx[slots] - sx * sx / n + shrink
+        cxy = self.sxy[slots] - sx * sy / n + shrink * herd
+        slope = np.divide(cxy, cxx, out=np.full(len(slots), herd), where=cxx > 0)
+        return slope, sx / n
+
+    def fold(self, day, cow_ids, liters, x):
+        """Advance the cows recorded on one day (each at most once) by that day's yield"""
+        slots = self._slots_for(cow_ids)
+        slope, mean_x = self.heat_slopes(slots)
+        adjusted = liters - slope * (x - mean_x)
+
+        new = self.n[slots] == 0
+        gap = np.maximum(day - self.last_day[slots], 1)
+        level, trend = self.level[slots], self.trend[slots]
+        carried = level + trend * damped_steps(gap)
+        error = adjusted - carried
+        fitted = np.where(new, adjusted, carried + LEVEL_ALPHA * error)
+        self.trend[slots] = np.where(
+            new, 0.0, TREND_BETA * (fitted - level) / gap + (1 - TREND_BETA) * DAMPING ** gap * trend)
+        self.level[slots] = fitted
+        errors = self.errors[slots]
+        self.variance[slots] = np.where(
+            new, self.variance[slots],
+            np.where(errors == 0, error * error, (1 - VARIANCE_ALPHA) * self.variance[slots] + VARIANCE_ALPHA * error * error))
+        self.errors[slots] = errors + ~new
+        self.last_day[slots] = day
+
+        self.n[slots] += 1
+        self.sx[slots] += x
+        self.sy[slots] += liters
+        self.sxx[slots] += x * x
+        self.sxy[slots] += x * liters
+        self.herd += (len(slots), x * len(slots), liters.sum(), x * x * len(slots), x * liters.sum())
+        self.recent_x = x if self.recent_x is None else (1 - RECENT_WEATHER_ALPHA) * self.recent_x + RECENT_WEATHER_ALPHA * x
+        self.day = day if self.day is None else max(self.day, day)
+
+    def forecast(self, horizon, ratios=()):
+        """(cow slots, day ratios, mean, standard deviation), the last two shaped (cows, horizon)"""
+        slots = np.flatnonzero((self.n[:len(self.slots)] > 0)
+                               & (self.last_day[:len(self.slots)] > self.day - ACTIVE_DAYS))
+        x = np.full(horizon, self.recent_x if self.recent_x is not None else 0.0)
+        x[:len(ratios)] = ratios[:horizon]
+        slope, mean_x = self.heat_slopes(slots)
+        steps = (self.day + 1 + np.arange(horizon))[None, :] - self.last_day[slots, None]
+        mean = (self.level[slots, None] + self.trend[slots, None] * damped_steps(steps)
+                + slope[:, None] * (x[None, :] - mean_x[:, None]))
+        spread = np.sqrt(self.variance[slots, None] * (1 + (steps - 1) * LEVEL_ALPHA ** 2))
+        return slots, x, np.maximum(mean, 0.0), spread
+
+
+class MilkForecaster:
+    """Keeps a ForecastState in step with the production rollups and caches rendered forecasts
+
+    Days before the latest recorded one are folded in once; the latest day may
+    still be receiving rows, so it is re-applied to a copy whenever the rollups
+    change. An ingest that backfills or corrects a day already folded in makes
+    the next refresh fold the whole history again, so every worker agrees with
+    a freshly started one.
+    """
+
+    def __init__(self, analytics=herd_analytics):
+        self.analytics = analytics
+        self._lock = threading.Lock()
+        self._forecasts = OrderedDict()
+        self.rebuild()
+
+    def rebuild(self):
+        """Drop the state so the next forecast folds the whole history again"""
+        with self._lock:
+            self._state = ForecastState()
+            self._committed = None
+            self._live = None
+            self._version = None
+            self._forecasts.clear()
+
+    def _fold(self, state, rows):
+        days = np.array([row[0] for row in rows])
+        cows = [row[1] for row in rows]
+        liters = np.array([row[2] for row in rows], dtype=np.float64)
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(rows)]):
+            state.fold(_ordinal(days[start]), cows[start:end], liters[start:end], float(rows[start][3]))
+
+    def _refresh(self):
+        version = self.analytics.version()
+        if version == self._version:
+            return self._live
+        if self._version is not None and version < self._version:
+            # A smaller version means the rollup database was replaced
+            self._state, self._committed = ForecastState(), None
+        elif self._committed is not None:
+            earliest = self.analytics.changed_since(self._version)
+            if earliest is not None and earliest <= self._committed:
+                self._state, self._committed = ForecastState(), None
+        rows = self.analytics.cow_days(self._committed)
+        latest = rows[-1][0] if rows else None
+        complete = [row for row in rows if row[0] != latest]
+        if complete:
+            self._fold(self._state, complete)
+            self._committed = complete[-1][0]
+        self._live = self._state.copy()
+        self._fold(self._live, [row for row in rows if row[0] == latest])
+        self._version = version
+        self._forecasts.clear()
+        return self._live
+
+    def forecast(self, horizon=DEFAULT_HORIZON, weather=None, cow_id=None):
+        """Daily yield forecasts for every active cow (or one) and the herd total
+
+        weather lists the coming days' temp_c and humidity; days it does not cover
+        use the recent herd average.
+        """
+        horizon = int(horizon)
+        if not 1 <= horizon <= MAX_HORIZON:
+            raise ValueError(f"horizon must be between 1 and {MAX_HORIZON} days")
+        ratios = weather_ratios(weather)
+        if len(ratios) > horizon:
+            raise ValueError(f"weather covers {len(ratios)} days but the horizon is {horizon}")
+
+        with self._lock:
+            state = self._refresh()
+            key = (horizon, ratios)
+            result = self._forecasts.get(key)
+            if result is not None:
+                self._forecasts.move_to_end(key)
+            else:
+                result = self._forecasts[key] = self._render(state, horizon, ratios)
+                while len(self._forecasts) > FORECAST_CACHE_SIZE:
+                    self._forecasts.popitem(last=False)
+
+        if cow_id is not None:
+            cows = [entry for entry in result['cows'] if entry['cow_id'] == str(cow_id)]
+            if not cows:
+                raise KeyError(f"no recent production records for cow {cow_id}")
+            result = dict(result, cows=cows)
+        return result
+
+    @staticmethod
+    def _render(state, horizon, ratios):
+        if state.day is None:
+            return {'last_recorded_day': None, 'horizon': horizon, 'dates': [], 'herd': [], 'cows': []}
+        slots, x, mean, spread = state.forecast(horizon, ratios)
+        first = datetime.fromordinal(state.day + 1)
+        herd_mean, herd_spread = mean.sum(axis=0), np.sqrt((spread ** 2).sum(axis=0))
+        slopes = state.heat_slopes(slots)[0]
+        liters, lower, upper = (np.round(a, 2).tolist() for a in
+                                (mean, np.maximum(mean - INTERVAL_Z * spread, 0.0), mean + INTERVAL_Z * spread))
+        return {
+            'last_recorded_day': datetime.fromordinal(state.day).strftime('%Y-%m-%d'),
+            'horizon': horizon,
+            'dates': [(first + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(horizon)],
+            'temp_humidity_ratio': np.round(x, 4).tolist(),
+            'weather_days': len(ratios),
+            'herd': [{
+                'date': (first + timedelta(days=i)).strftime('%Y-%m-%d'),
+                'liters': round(float(m), 2),
+                'lower': round(float(max(m - INTERVAL_Z * s, 0.0)), 2),
+                'upper': round(float(m + INTERVAL_Z * s), 2),
+            } for i, (m, s) in enumerate(zip(herd_mean, herd_spread))],
+            'cows': [{
+                'cow_id': state.cow_ids[slot],
+                'liters': liters[i],
+                'lower': lower[i],
+                'upper': upper[i],
+                'trend_per_day': round(float(state.trend[slot]), 3),
+                'liters_per_unit_ratio': round(float(slopes[i]), 3),
+            } for i, slot in enumerate(slots)],
+        }
+
+
+# One forecaster per process; its state follows the shared rollup database
+milk_forecaster = MilkForecaster()
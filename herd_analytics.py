@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Herd analytics for the Smart Dairy Farm Management System
+Milk production records (farm_milk_production.csv and anything posted to
+/api/production) are folded into per-cow daily and weekly rollups and per-day
+herd totals as they arrive, so dashboard queries only read pre-aggregated rows
+"""
+
+import io
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from anomaly import SIGNAL_DAYS, YieldMonitor
+
+ANALYTICS_DB = os.environ.get('CATTLE_ANALYTICS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'farm_analytics.db'))
+SEED_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'farm_milk_production.csv')
+
+# Production record columns, and the names accepted for them in posted rows / CSVs
+PRODUCTION_COLUMNS = {
+    'date': ['date', 'day'],
+    'cow_id': ['cow_id'],
+    'feed_kg': ['feed_kg'],
+    'temp_c': ['temp_c', 'temperature'],
+    'humidity': ['humidity'],
+    'milking_time': ['milking_time_min', 'milking_time'],
+    'milk_liters': ['milk_liters', 'liters'],
+}
+
+# temp_humidity_ratio bands for the heat-stress yield curve
+HEAT_BAND_WIDTH = 0.05
+
+DEFAULT_WINDOW_DAYS = 30
+TOP_COWS = 5
+
+# Rendered summaries kept per process; any ingest (in any worker) invalidates them
+SUMMARY_CACHE_SIZE = 64
+
+# Stored per record; a cow has one record per day
+RECORD_VALUES = ['feed_kg', 'temp_c', 'humidity', 'milking_time', 'milk_liters']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS production_records (
+    cow_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    feed_kg REAL NOT NULL,
+    temp_c REAL NOT NULL,
+    humidity REAL NOT NULL,
+    milking_time REAL NOT NULL,
+    milk_liters REAL NOT NULL,
+    UNIQUE (cow_id, day)
+);
+CREATE TABLE IF NOT EXISTS cow_daily (
+    cow_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    liters REAL NOT NULL,
+    feed_kg REAL NOT NULL,
+    PRIMARY KEY (cow_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_cow_daily_day ON cow_daily (day, cow_id, liters, feed_kg);
+CREATE TABLE IF NOT EXISTS cow_weekly (
+    cow_id TEXT NOT NULL,
+    week TEXT NOT NULL,
+    days INTEGER NOT NULL DEFAULT 0,
+    records INTEGER NOT NULL,
+    liters REAL NOT NULL,
+    feed_kg REAL NOT NULL,
+    PRIMARY KEY (cow_id, week)
+);
+CREATE INDEX IF NOT EXISTS idx_cow_weekly_week ON cow_weekly (week, cow_id, days, liters, feed_kg);
+CREATE TABLE IF NOT EXISTS herd_daily (
+    day TEXT PRIMARY KEY,
+    cows INTEGER NOT NULL DEFAULT 0,
+    records INTEGER NOT NULL,
+    liters REAL NOT NULL,
+    feed_kg REAL NOT NULL,
+    sum_x REAL NOT NULL,
+    sum_xx REAL NOT NULL,
+    sum_yy REAL NOT NULL,
+    sum_xy REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS herd_heat (
+    day TEXT NOT NULL,
+    band REAL NOT NULL,
+    records INTEGER NOT NULL,
+    liters REAL NOT NULL,
+    PRIMARY KEY (day, band)
+);
+CREATE TABLE IF NOT EXISTS analytics_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingest_log (
+    version INTEGER PRIMARY KEY,
+    earliest_day TEXT NOT NULL
+);
+'''
+
+
+def _upsert(table, keys, values):
+    """INSERT that adds the new values onto an existing rollup row"""
+    columns = keys + values
+    updates = ', '.join(f'{v} = {v} + excluded.{v}' for v in values)
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}")
+
+
+def _replace(table, keys, values):
+    """INSERT that overwrites the values of an existing row with the same keys"""
+    columns = keys + values
+    updates = ', '.join(f'{v} = excluded.{v}' for v in values)
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}")
+
+
+def _date(day):
+    return datetime.strptime(day, '%Y-%m-%d')
+
+
+def _week_start(day):
+    """Monday of the week containing a datetime"""
+    return day - timedelta(days=day.weekday())
+
+
+def normalize_production(df):
+    """Map a production frame's columns onto PRODUCTION_COLUMNS; raises ValueError if any is missing"""
+    lookup = {str(c).strip().lower(): c for c in df.columns}
+    renamed = {}
+    for column, names in PRODUCTION_COLUMNS.items():
+        found = next((lookup[n] for n in names if n in lookup), None)
+        if found is None:
+            raise ValueError(f"production rows need a {column} column (one of {names})")
+        renamed[column] = df[found]
+    out = pd.DataFrame(renamed)
+    for column in PRODUCTION_COLUMNS:
+        missing = np.flatnonzero(out[column].isna().to_numpy())
+        if missing.size:
+            raise ValueError(f"production rows are missing {column} (row {int(missing[0])})")
+    out['date'] = pd.to_datetime(out['date']).dt.strftime('%Y-%m-%d')
+    out['cow_id'] = out['cow_id'].astype(str)
+    for column in RECORD_VALUES:
+        out[column] = pd.to_numeric(out[column], errors='raise').astype(float)
+        bad = np.flatnonzero(~np.isfinite(out[column].to_numpy()))
+        if bad.size:
+            raise ValueError(f"production rows need a finite {column} (row {int(bad[0])})")
+    return out
+
+
+def parse_production(payload):
+    """Production rows from a JSON list of objects, a columnar dict or CSV text"""
+    if isinstance(payload, (str, bytes)):
+        text = payload.decode('utf-8') if isinstance(payload, bytes) else payload
+        return normalize_production(pd.read_csv(io.StringIO(text)))
+    if isinstance(payload, dict) and 'rows' in payload:
+        payload = payload['rows']
+    return normalize_production(pd.DataFrame(payload))
+
+
+class HerdAnalytics:
+    """Incrementally maintained production rollups in SQLite, shared by all worker processes"""
+
+    def __init__(self, path=ANALYTICS_DB, seed=SEED_DATA):
+        self.path = path
+        self.seed = seed
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready = False
+        self._summaries = OrderedDict()
+        self.monitor = YieldMonitor()
+        self._connections = []
+        self._generation = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _conn(self):
+        """One connection per thread (and per process after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if (conn is None or getattr(self._local, 'pid', None) != os.getpid()
+                or self._local.generation != self._generation):
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.generation = self._generation
+            with self._lock:
+                self._connections.append((os.getpid(), conn))
+        if not self._ready:
+            self._prepare(conn)
+        return conn
+
+    def _prepare(self, conn):
+        with self._lock:
+            if self._ready:
+                return
+            conn.executescript(SCHEMA)
+            self.monitor.prepare(conn)
+            # The bundled CSV is folded in once per database, not on every start
+            if self.seed and os.path.exists(self.seed):
+                if conn.execute("SELECT 1 FROM analytics_meta WHERE key = 'seeded'").fetchone() is None:
+                    self._ingest(conn, normalize_production(pd.read_csv(self.seed)), seed=True)
+                elif conn.execute('SELECT 1 FROM production_records LIMIT 1').fetchone() is None:
+                    # Seeded before records were kept: note the seed's records, so sending them again is a no-op
+                    with conn:
+                        conn.executemany(
+                            'INSERT OR IGNORE INTO production_records (cow_id, day, ' + ', '.join(RECORD_VALUES)
+                            + ') VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            self._dedupe(normalize_production(pd.read_csv(self.seed)))[
+                                ['cow_id', 'date'] + RECORD_VALUES].itertuples(index=False, name=None))
+            self._ready = True
+
+    @staticmethod
+    def _dedupe(rows):
+        """One row per cow-day; a later row for the same cow and day replaces an earlier one"""
+        return rows.drop_duplicates(['cow_id', 'date'], keep='last').reset_index(drop=True)
+
+    @staticmethod
+    def _stored(conn, rows):
+        """The stored records for the batch's cow-days, as a normalized frame"""
+        stored = conn.execute(
+            'SELECT cow_id, day, ' + ', '.join(RECORD_VALUES) + ' FROM production_records '
+            'WHERE cow_id IN (SELECT value FROM json_each(?)) AND day IN (SELECT value FROM json_each(?))',
+            (json.dumps(rows['cow_id'].unique().tolist()), json.dumps(rows['date'].unique().tolist()))).fetchall()
+        stored = pd.DataFrame([tuple(row) for row in stored], columns=['cow_id', 'date'] + RECORD_VALUES)
+        return stored.merge(rows[['cow_id', 'date']], on=['cow_id', 'date'])
+
+    def _ingest(self, conn, rows, seed=False):
+        rows = self._dedupe(rows)
+        with conn:
+            # IMMEDIATE takes the write lock up front, so concurrent workers apply batches one at a time
+            conn.execute('BEGIN IMMEDIATE')
+            if seed and conn.execute("SELECT 1 FROM analytics_meta WHERE key = 'seeded'").fetchone():
+                return 0
+
+            # A record sent again changes nothing; a corrected one takes its old values back out of the rollups
+            old = self._stored(conn, rows)
+            same = rows.merge(old, on=['cow_id', 'date'] + RECORD_VALUES, how='left', indicator=True)['_merge']
+            rows = rows[(same == 'left_only').to_numpy()].reset_index(drop=True)
+            if not len(rows):
+                return 0
+            old = old.merge(rows[['cow_id', 'date']], on=['cow_id', 'date'])
+            self._fold(conn, pd.concat([rows.assign(sign=1), old.assign(sign=-1)], ignore_index=True))
+            conn.executemany(_replace('production_records', ['cow_id', 'day'], RECORD_VALUES),
+                             rows[['cow_id', 'date'] + RECORD_VALUES].itertuples(index=False, name=None))
+            # Each record is scored against its cow's expected yield before it updates it
+            self.monitor.update(conn, rows)
+            conn.execute("INSERT INTO analytics_meta (key, value) VALUES ('version', '1') "
+                         "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+            # The earliest day each version touched, so readers can tell a backfill from a new day
+            conn.execute("INSERT INTO ingest_log (version, earliest_day) SELECT CAST(value AS INTEGER), ? "
+                         "FROM analytics_meta WHERE key = 'version'", (rows['date'].min(),))
+            if seed:
+                conn.execute("INSERT OR REPLACE INTO analytics_meta (key, value) VALUES ('seeded', ?)",
+                             (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        return len(rows)
+
+    @staticmethod
+    def _fold(conn, rows):
+        """Add (sign 1) or take out (sign -1) each row's contribution to the rollups"""
+        sign = rows['sign'].to_numpy()
+        x = (rows['temp_c'] / (rows['humidity'] + 1)).to_numpy()
+        y = rows['milk_liters'].to_numpy()
+        rows = rows.assign(records=sign, liters=sign * y, feed=sign * rows['feed_kg'].to_numpy(),
+                           x=sign * x, xx=sign * x * x, yy=sign * y * y, xy=sign * x * y,
+                           week=(pd.to_datetime(rows['date']) - pd.to_timedelta(
+                               pd.to_datetime(rows['date']).dt.weekday, unit='D')).dt.strftime('%Y-%m-%d'),
+                           band=np.floor(x / HEAT_BAND_WIDTH) * HEAT_BAND_WIDTH)
+
+        def sums(keys, columns):
+            grouped = rows.groupby(keys, sort=False)[['records'] + columns].sum()
+            return list(grouped.reset_index().itertuples(index=False, name=None))
+
+        feed = ['liters', 'feed']
+        cow_daily = sums(['cow_id', 'date'], feed)
+        cow_weekly = sums(['cow_id', 'week'], feed)
+        herd_daily = sums(['date'], feed + ['x', 'xx', 'yy', 'xy'])
+        herd_heat = [(day, round(band, 4), n, liters) for day, band, n, liters
+                     in sums(['date', 'band'], ['liters'])]
+        days = [(day,) for day in rows['date'].unique()]
+
+        conn.executemany(_upsert('cow_daily', ['cow_id', 'day'], ['records', 'liters', 'feed_kg']), cow_daily)
+        conn.executemany(_upsert('cow_weekly', ['cow_id', 'week'], ['records', 'liters', 'feed_kg']), cow_weekly)
+        conn.executemany("UPDATE cow_weekly SET days = (SELECT COUNT(*) FROM cow_daily "
+                         "WHERE cow_daily.cow_id = cow_weekly.cow_id AND cow_daily.day >= cow_weekly.week "
+                         "AND cow_daily.day <= date(cow_weekly.week, '+6 days')) WHERE cow_id = ? AND week = ?",
+                         [(cow_id, week) for cow_id, week, *_ in cow_weekly])
+        conn.executemany(
+            _upsert('herd_daily', ['day'], ['records', 'liters', 'feed_kg', 'sum_x', 'sum_xx', 'sum_yy', 'sum_xy']),
+            herd_daily)
+        conn.executemany(_upsert('herd_heat', ['day', 'band'], ['records', 'liters']), herd_heat)
+        # A corrected record can leave its old heat band with nothing in it
+        conn.executemany('DELETE FROM herd_heat WHERE day = ? AND records <= 0', days)
+        # Distinct cows per day, recounted only for the days this batch touched
+        conn.executemany('UPDATE herd_daily SET cows = (SELECT COUNT(*) FROM cow_daily '
+                         'WHERE cow_daily.day = herd_daily.day) WHERE day = ?', days)
+
+    def ingest(self, rows):
+        """Fold normalized production rows (see parse_production) into the rollups"""
+        if not len(rows):
+            return 0
+        return self._ingest(self._conn(), rows)
+
+    def _version(self, conn):
+        row = conn.execute("SELECT value FROM analytics_meta WHERE key = 'version'").fetchone()
+        return row[0] if row else '0'
+
+    def yield_anomalies(self, days=SIGNAL_DAYS, since=None, cow_id=None, kinds=None):
+        """Production records flagged against their cow's expected yield (default: the last few days)"""
+        conn = self._conn()
+        if since is None:
+            latest = conn.execute('SELECT MAX(day) FROM herd_daily').fetchone()[0] or datetime.now().strftime('%Y-%m-%d')
+            since = (_date(latest) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        return self.monitor.anomalies(conn, since, cow_id=cow_id, kinds=kinds)
+
+    def yield_signal(self, cow_id):
+        """The cow's latest recent yield drop, or None; read alongside its mastitis risk"""
+        conn = self._conn()
+        with self._lock:
+            return self.monitor.signal(conn, self._version(conn), cow_id)
+
+    def close(self):
+        """Close this process's connections; the next call opens new ones"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for pid, conn in connections:
+            if pid == os.getpid():
+                conn.close()
+
+    def version(self):
+        """Rollup version, bumped by every ingest in any worker"""
+        return int(self._version(self._conn()))
+
+    def changed_since(self, version):
+        """Earliest day touched by any ingest after a rollup version, or None"""
+        return self._conn().execute('SELECT MIN(earliest_day) FROM ingest_log WHERE version > ?',
+                                    (int(version),)).fetchone()[0]
+
+    def cow_days(self, after=None):
+        """(day, cow_id, liters, herd mean temp_humidity_ratio) per cow-day after a day, oldest first"""
+        return self._conn().execute(
+            'SELECT c.day, c.cow_id, c.liters, h.sum_x / h.records FROM cow_daily c JOIN herd_daily h ON h.day = c.day '
+            'WHERE c.day > ? ORDER BY c.day', (after or '',)).fetchall()
+
+    def summary(self, days=DEFAULT_WINDOW_DAYS, since=None, until=None, cow_id=None, top=TOP_COWS):
+        """Dashboard aggregates for a window ending at `until` (default: the latest recorded day)"""
+        conn = self._conn()
+        key = (days, since, until, cow_id, top, self._version(conn))
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+
+        result = self._summary(conn, days, since, until, cow_id, top)
+        with self._lock:
+            self._summaries[key] = result
+            while len(self._summaries) > SUMMARY_CACHE_SIZE:
+                self._summaries.popitem(last=False)
+        return result
+
+    def _summary(self, conn, days, since, until, cow_id, top):
+        if until is None:
+            until = conn.execute('SELECT MAX(day) FROM herd_daily').fetchone()[0] or datetime.now().strftime('%Y-%m-%d')
+        if since is None:
+            since = (_date(until) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+        daily = [dict(row) for row in conn.execute(
+            'SELECT day, cows, records, liters, feed_kg, sum_x, sum_xx, sum_yy, sum_xy FROM herd_daily '
+            'WHERE day >= ? AND day <= ? ORDER BY day', (since, until))]
+        cows = self._cow_totals(conn, since, until)
+        bands = conn.execute(
+            'SELECT band, SUM(records) AS records, SUM(liters) AS liters FROM herd_heat '
+            'WHERE day >= ? AND day <= ? GROUP BY band ORDER BY band', (since, until)).fetchall()
+
+        total = sum(d['liters'] for d in daily)
+        feed = sum(d['feed_kg'] for d in daily)
+        weekly = OrderedDict()
+        for d in daily:
+            week = _week_start(_date(d['day'])).strftime('%Y-%m-%d')
+            entry = weekly.setdefault(week, {'week': week, 'liters': 0.0, 'feed_kg': 0.0, 'days': 0})
+            entry['liters'] += d['liters']
+            entry['feed_kg'] += d['feed_kg']
+            entry['days'] += 1
+
+        result = {
+            'since': since,
+            'until': until,
+            'total_milk_production': round(total, 2),
+            'average_daily_production': round(total / len(daily), 2) if daily else 0.0,
+            'active_cows': len(cows),
+            'feed_efficiency': round(total / feed, 3) if feed else None,
+            'daily_production': [{
+                'date': d['day'],
+                'liters': round(d['liters'], 2),
+                'cows': d['cows'],
+                'liters_per_cow': round(d['liters'] / d['cows'], 2) if d['cows'] else None,
+                'feed_efficiency': round(d['liters'] / d['feed_kg'], 3) if d['feed_kg'] else None,
+            } for d in daily],
+            'weekly_production': [{
+                'week': w['week'],
+                'liters': round(w['liters'], 2),
+                'average_daily_liters': round(w['liters'] / w['days'], 2),
+                'feed_efficiency': round(w['liters'] / w['feed_kg'], 3) if w['feed_kg'] else None,
+            } for w in weekly.values()],
+            'top_performing_cows': [self._cow_entry(row) for row in cows[:top]],
+            'lowest_feed_efficiency': [self._cow_entry(row) for row in sorted(
+                (row for row in cows if row['feed_kg']), key=lambda row: row['liters'] / row['feed_kg'])[:top]],
+            'heat_stress': self._heat_stress(daily, bands),
+        }
+        if cow_id is not None:
+            result['cow'] = self.cow(conn, str(cow_id), since, until)
+        return result
+
+    @staticmethod
+    def _cow_totals(conn, since, until):
+        """Per-cow totals over the window: weekly rollups for whole weeks, daily rows only at the edges"""
+        first = _week_start(_date(since) + timedelta(days=6))
+        last = _week_start(_date(until) - timedelta(days=6))
+        parts, params = [], []
+        if first <= last:
+            parts.append('SELECT cow_id, days, liters, feed_kg FROM cow_weekly WHERE week >= ? AND week <= ?')
+            params += [first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')]
+            edges = [(since, (first - timedelta(days=1)).strftime('%Y-%m-%d')),
+                     ((last + timedelta(days=7)).strftime('%Y-%m-%d'), until)]
+        else:
+            edges = [(since, until)]
+        for start, end in edges:
+            if start <= end:
+                parts.append('SELECT cow_id, 1 AS days, liters, feed_kg FROM cow_daily WHERE day >= ? AND day <= ?')
+                params += [start, end]
+        return conn.execute(
+            'SELECT cow_id, SUM(days) AS days, SUM(liters) AS liters, SUM(feed_kg) AS feed_kg FROM ('
+            + ' UNION ALL '.join(parts) + ') GROUP BY cow_id ORDER BY liters DESC', params).fetchall()
+
+    @staticmethod
+    def _cow_entry(row):
+        return {
+            'cow_id': row['cow_id'],
+            'liters': round(row['liters'], 2),
+            'average_daily_liters': round(row['liters'] / row['days'], 2),
+            'feed_efficiency': round(row['liters'] / row['feed_kg'], 3) if row['feed_kg'] else None,
+        }
+
+    @staticmethod
+    def _heat_stress(daily, bands):
+        """Pearson correlation and slope of yield against temp_humidity_ratio from the daily sums"""
+        n = sum(d['records'] for d in daily)
+        sx, sy = sum(d['sum_x'] for d in daily), sum(d['liters'] for d in daily)
+        sxx, syy, sxy = (sum(d[c] for d in daily) for c in ('sum_xx', 'sum_yy', 'sum_xy'))
+        vx, vy, cov = n * sxx - sx * sx, n * syy - sy * sy, n * sxy - sx * sy
+        return {
+            'records': n,
+            'correlation': round(cov / np.sqrt(vx * vy), 4) if n > 1 and vx > 0 and vy > 0 else None,
+            'liters_per_unit_ratio': round(cov / vx, 3) if n > 1 and vx > 0 else None,
+            'bands': [{
+                'temp_humidity_ratio': round(b['band'], 4),
+                'records': b['records'],
+                'average_liters': round(b['liters'] / b['records'], 2),
+            } for b in bands],
+        }
+
+    def cow(self, conn, cow_id, since, until):
+        """One cow's daily yield over the window, and weekly yield for the weeks overlapping it"""
+        first_week = _week_start(_date(since)).strftime('%Y-%m-%d')
+        daily = conn.execute(
+            'SELECT day, records, liters, feed_kg FROM cow_daily WHERE cow_id = ? AND day >= ? AND day <= ? '
+            'ORDER BY day', (cow_id, since, until)).fetchall()
+        weekly = conn.execute(
+            'SELECT week, records, liters, feed_kg FROM cow_weekly WHERE cow_id = ? AND week >= ? AND week <= ? '
+            'ORDER BY week', (cow_id, first_week, until)).fetchall()
+        return {
+            'cow_id': cow_id,
+            'daily': [{'date': r['day'], 'liters': round(r['liters'], 2),
+                       'feed_efficiency': round(r['liters'] / r['feed_kg'], 3) if r['feed_kg'] else None}
+                      for r in daily],
+            'weekly': [{'week': r['week'], 'liters': round(r['liters'], 2), 'milkings': r['records'],
+                        'feed_efficiency': round(r['liters'] / r['feed_kg'], 3) if r['feed_kg'] else None}
+                       for r in weekly],
+        }
+
+
+# One connection set per process; the rollup database is shared by all of them
+herd_analytics = HerdAnalytics()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Load test for the Smart Dairy Farm Management System
+Replays parlour-style traffic built from the bundled CSVs against the Flask app
+and the FastAPI backend, started in-process on a free local port (or against a
+running server with --url), and reports throughput, latency percentiles and
+error rates. Results are written as JSON that --compare checks for regressions.
+
+Usage:
+    python load_test.py --backend both --concurrency 8 --duration 20
+    python load_test.py --backend flask --rate 200 --requests 5000
+    python load_test.py --url http://localhost:5000 --concurrency 16   # e.g. serve.py
+    python load_test.py --compare benchmarks/<old>.json benchmarks/<new>.json
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from benchmark_models import JITTER_COLUMNS, synthesize_herd, _commit
+from train_models import MILK_DATA, DISEASE_DATA
+
+ENDPOINTS = {
+    'milk': '/predict_milk',
+    'disease': '/predict_disease',
+}
+
+# Distinct payloads replayed in a cycle; requests repeat (and hit the prediction cache) once it wraps
+POOL_SIZE = 5000
+
+# Requests sent before measuring, so model loading and connection setup are not timed
+WARMUP_REQUESTS = 50
+
+# Metrics compared by --compare: latencies regress upwards, throughput downwards
+LATENCY_METRICS = ['p50_ms', 'p95_ms', 'p99_ms']
+
+REQUEST_TIMEOUT = 30
+
+
+def milk_payload(row):
+    return {'cow_id': row['Cow_ID'], 'feed_kg': row['Feed_kg'], 'temp_c': row['Temp_C'],
+            'humidity': row['Humidity'], 'milking_time': row['Milking_Time_min']}
+
+
+def disease_payload(row):
+    payload = {'cow_id': row['Cow_ID'], 'day': int(row['Day']), 'breed': row['Breed'],
+               'months_after_birth': int(row['Months after giving birth']),
+               'previous_mastitis': int(row['Previous_Mastits_status']),
+               'temperature': row['Temperature'], 'hardness': row['Hardness'], 'pain': row['Pain'],
+               'milk_visibility': row['Milk_visibility']}
+    for column in ['IUFL', 'EUFL', 'IUFR', 'EUFR', 'IURL', 'EURL', 'IURR', 'EURR']:
+        payload[column.lower()] = row[column]
+    return payload
+
+
+def build_schedule(milk_share=0.5, pool_size=POOL_SIZE, seed=42):
+    """(path, JSON body) pairs: CSV rows resampled with jitter, interleaved at the given mix"""
+    rng = np.random.default_rng(seed)
+    kinds = np.where(rng.random(pool_size) < milk_share, 'milk', 'disease')
+    bodies = {}
+    for kind, source, to_payload in (('milk', MILK_DATA, milk_payload), ('disease', DISEASE_DATA, disease_payload)):
+        count = int((kinds == kind).sum())
+        if not count:
+            continue
+        herd = synthesize_herd(pd.read_csv(source), count, JITTER_COLUMNS[kind], seed=seed)
+        # Replay each synthetic cow's days in order, as a parlour would send them
+        herd = herd.sort_values('Day', kind='stable') if 'Day' in herd else herd
+        bodies[kind] = iter([json.dumps(to_payload(row)).encode() for row in herd.to_dict('records')])
+    return [(ENDPOINTS[kind], next(bodies[kind])) for kind in kinds]
+
+
+def _free_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    return sock
+
+
+def _isolate_state():
+    # Keep load-test predictions and readings out of the farm's history
+    if 'CATTLE_HISTORY_DB' in os.environ and 'CATTLE_SENSOR_DIR' in os.environ:
+        return
+    scratch = tempfile.mkdtemp(prefix='cattle_load_')
+    os.environ.setdefault('CATTLE_HISTORY_DB', os.path.join(scratch, 'prediction_history.db'))
+    os.environ.setdefault('CATTLE_SENSOR_DIR', os.path.join(scratch, 'sensor_data'))
+
+
+def start_flask():
+    """Serve app.py from a thread; returns (url, stop)"""
+    _isolate_state()
+    from werkzeug.serving import make_server
+    import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    sock = _free_socket()
+    server = make_server(*sock.getsockname()[:2], app.app, threaded=True, fd=sock.fileno())
+    thread = threading.Thread(target=server.serve_forever, name='flask-server', daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    return 'http://%s:%d' % sock.getsockname()[:2], stop
+
+
+def start_fastapi():
+    """Serve backend.py with uvicorn from a thread; returns (url, stop)"""
+    _isolate_state()
+    import uvicorn
+    import backend
+
+    sock = _free_socket()
+    server = uvicorn.Server(uvicorn.Config(backend.app, log_level='warning', access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, name='uvicorn-server', daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return 'http://%s:%d' % sock.getsockname()[:2], stop
+
+
+SERVERS = {
+    'flask': start_flask,
+    'fastapi': start_fastapi,
+}
+
+
+class Client:
+    """One keep-alive connection, reopened after a failure"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.conn = None
+
+    def post(self, path, body):
+        """Returns (status, error kind or None)"""
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        try:
+            self.conn.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = self.conn.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            self.conn = None
+            return None, type(e).__name__
+        if response.status != 200:
+            return response.status, f'HTTP {response.status}'
+        # app.py reports failures as {"success": false} with status 200
+        if b'"success": false' in content or b'"success":false' in content:
+            return response.status, 'success=false'
+        return response.status, None
+
+
+def run_load(url, schedule, concurrency=8, rate=0, duration=10, requests=None, warmup=WARMUP_REQUESTS):
+    """Drive the server with `concurrency` client threads; returns per-request samples
+
+    With a target rate, request i is due at start + i / rate and its latency is
+    measured from that due time, so a stalled server is not hidden by clients
+    that simply send less (coordinated omission).
+    """
+    warm = Client(url)
+    for i in range(min(warmup, len(schedule))):
+        warm.post(*schedule[i])
+
+    sequence = itertools.count()
+    samples = []
+    started = time.perf_counter()
+    deadline = started + duration if requests is None else float('inf')
+
+    def client_loop():
+        client = Client(url)
+        local = []
+        while True:
+            i = next(sequence)
+            if requests is not None and i >= requests:
+                break
+            due = started + i / rate if rate else time.perf_counter()
+            if due >= deadline:
+                break
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            path, body = schedule[i % len(schedule)]
+            sent = due if rate else time.perf_counter()
+            status, error = client.post(path, body)
+            local.append((path, time.perf_counter() - sent, error))
+        samples.extend(local)
+
+    threads = [threading.Thread(target=client_loop, name=f'load-client-{n}') for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    def stats(group):
+        latencies = np.array([latency for _, latency, _ in group]) * 1000
+        errors = Counter(error for _, _, error in group if error)
+        return {
+            'requests': len(group),
+            'throughput_rps': round(len(group) / elapsed, 1),
+            'error_rate': round(sum(errors.values()) / len(group), 4),
+            'errors': dict(errors),
+            'mean_ms': round(float(latencies.mean()), 3),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p90_ms': round(float(np.percentile(latencies, 90)), 3),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            'max_ms': round(float(latencies.max()), 3),
+        }
+
+    if not samples:
+        return {'overall': None, 'endpoints': {}}
+    by_path = {}
+    for sample in samples:
+        by_path.setdefault(sample[0], []).append(sample)
+    return {'overall': stats(samples), 'endpoints': {path: stats(group) for path, group in sorted(by_path.items())}}
+
+
+def _print_summary(label, summary):
+    rows = [('all', summary['overall'])] + list(summary['endpoints'].items())
+    print(f"📈 {label}")
+    for name, s in rows:
+        if s is None:
+            continue
+        print(f"   {name:18s} {s['requests']:>7d} req {s['throughput_rps']:>8.1f}/s  "
+              f"p50={s['p50_ms']:.2f}ms p95={s['p95_ms']:.2f}ms p99={s['p99_ms']:.2f}ms max={s['max_ms']:.1f}ms  "
+              f"errors={s['error_rate']:.2%}")
+    if summary['overall'] and summary['overall']['errors']:
+        print(f"   errors: {summary['overall']['errors']}")
+
+
+def run_load_tests(backends=('flask', 'fastapi'), url=None, concurrency=8, rate=0, duration=10, requests=None,
+                   milk_share=0.5, pool_size=POOL_SIZE, output='benchmarks'):
+    """Load-test each backend in turn and write one JSON file; returns its path"""
+    schedule = build_schedule(milk_share, pool_size)
+    results = []
+    for backend in backends:
+        stop = None
+        target = url
+        if target is None:
+            target, stop = SERVERS[backend]()
+        try:
+            samples, elapsed = run_load(target, schedule, concurrency, rate, duration, requests)
+        finally:
+            if stop is not None:
+                stop()
+        summary = summarize(samples, elapsed)
+        _print_summary(f"{backend} @ {target} concurrency={concurrency} rate={rate or 'max'}", summary)
+        results.append({'backend': backend, 'url': target if url else 'in-process',
+                        'concurrency': concurrency, 'rate': rate, 'seconds': round(elapsed, 2), **summary})
+
+    commit = _commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'cpu_count': os.cpu_count(),
+        'milk_share': milk_share,
+        'pool_size': pool_size,
+        'results': results,
+    }
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📁 Load test results written to {path}")
+    return path
+
+
+def compare(old_path, new_path, threshold=1.5, max_error_increase=0.01):
+    """Print new/old ratios per backend and endpoint; returns True if anything regressed"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    baseline = {(r['backend'], r['concurrency'], r['rate']): r for r in old['results']}
+    regressed = False
+    print(f"Comparing {old.get('commit')} -> {new.get('commit')}")
+    for result in new['results']:
+        before = baseline.get((result['backend'], result['concurrency'], result['rate']))
+        if before is None:
+            continue
+        for name in ['overall'] + sorted(result['endpoints']):
+            now = result['overall'] if name == 'overall' else result['endpoints'][name]
+            then = before['overall'] if name == 'overall' else before['endpoints'].get(name)
+            if not now or not then:
+                continue
+            ratios = []
+            for metric in LATENCY_METRICS:
+                ratio = now[metric] / then[metric] if then[metric] else 1.0
+                ratios.append((metric, ratio, ratio > threshold))
+            # Fewer requests per second is the regression for throughput
+            ratio = now['throughput_rps'] / then['throughput_rps'] if then['throughput_rps'] else 1.0
+            ratios.append(('throughput', ratio, ratio * threshold < 1))
+            error_flag = now['error_rate'] - then['error_rate'] > max_error_increase
+            regressed = regressed or error_flag or any(flag for _, _, flag in ratios)
+            print(f"  {result['backend']:8s} {name:18s} " + '  '.join(
+                f"{metric}={ratio:.2f}x{' ❌' if flag else ''}" for metric, ratio, flag in ratios)
+                + f"  errors={then['error_rate']:.2%}->{now['error_rate']:.2%}{' ❌' if error_flag else ''}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the prediction endpoints')
+    parser.add_argument('--backend', default='both', choices=['flask', 'fastapi', 'both'])
+    parser.add_argument('--url', help='test a running server instead of starting one in-process')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads (default: 8)')
+    parser.add_argument('--rate', type=float, default=0, help='target requests/s across all clients (default: as fast as possible)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per backend (default: 10)')
+    parser.add_argument('--requests', type=int, help='stop after this many requests instead of --duration')
+    parser.add_argument('--milk-share', type=float, default=0.5, help='fraction of /predict_milk requests (default: 0.5)')
+    parser.add_argument('--pool', type=int, default=POOL_SIZE, help=f'distinct payloads before repeating (default: {POOL_SIZE})')
+    parser.add_argument('--output', default='benchmarks', help='directory for JSON results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=1.5, help='regression ratio for --compare')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, threshold=args.threshold) else 0
+    backends = ['flask', 'fastapi'] if args.backend == 'both' else [args.backend]
+    run_load_tests(backends, args.url, max(1, args.concurrency), args.rate, args.duration, args.requests,
+                   args.milk_share, max(1, args.pool), args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Request and model metrics for the Smart Dairy Farm Management System
+Counters, gauges and histograms kept in plain per-process dicts and rendered in
+the Prometheus text exposition format for a /metrics scrape. Recording a value
+is one bisect and one dict update under a lock, so the hot paths stay cheap.
+
+Under serve.py each worker also writes its counters and histograms to
+<directory>/<pid>-<start>.json every FLUSH_INTERVAL seconds, and a scrape answered by
+any worker sums every file. Files of exited workers are kept, so their counts
+never go backwards; gauges describe the answering worker alone.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) for request, stage and inference latencies
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds for rows per model call (single rows, micro-batches and herd uploads)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+# Seconds between a worker's metric file writes; other workers' counts lag by at most this
+FLUSH_INTERVAL = 1.0
+
+METRICS = []
+
+# Directory shared by every serve.py worker, or None when serving from one process
+_directory = None
+# This worker's file in it; the start time keeps a recycled pid from overwriting a dead worker's counts
+_file = None
+_flush_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+    # Whether other workers' values are added in (gauges are per-process facts)
+    shared = True
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def _copy(self, value):
+        return value
+
+    def _samples(self, key, value):
+        yield self.name, _labels(self.labels, key), value
+
+    def snapshot(self):
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._series.items()}
+
+    def _add(self, total, value):
+        return total + value
+
+    def merge(self, series, others):
+        """series plus each other worker's snapshot, as JSON-decoded [labels, value] pairs"""
+        for pairs in others:
+            for key, value in pairs:
+                key = tuple(key)
+                series[key] = self._add(series[key], value) if key in series else value
+        return series
+
+    def render(self, others=()):
+        series = sorted(self.merge(self.snapshot(), others).items(), key=lambda item: item[0])
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for key, value in series:
+            lines.extend(f'{name}{labels} {_number(sample)}' for name, labels, sample in self._samples(key, value))
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+    shared = False
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # bisect_left puts a value equal to a bound in that bucket (Prometheus "le")
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _copy(self, value):
+        return list(value[0]), value[1]
+
+    def _add(self, total, value):
+        counts, value_sum = value
+        if len(counts) != len(total[0]):
+            raise ValueError(f'{self.name} bucket layouts differ between workers')
+        return [a + b for a, b in zip(total[0], counts)], total[1] + value_sum
+
+    def _samples(self, key, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield f'{self.name}_bucket', _labels(self.labels, key, f'le="{_number(bound)}"'), cumulative
+        yield f'{self.name}_sum', _labels(self.labels, key), total
+        yield f'{self.name}_count', _labels(self.labels, key), cumulative
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'cattle_http_request_duration_seconds', 'Time from request start to response, by route',
+    ['route', 'method', 'status'])
+REQUEST_STAGE_SECONDS = Histogram(
+    'cattle_request_stage_duration_seconds', 'Time spent in each stage of a prediction request',
+    ['route', 'stage'])
+MODEL_INFERENCE_SECONDS = Histogram(
+    'cattle_model_inference_duration_seconds', 'Time inside the model call alone, excluding feature preparation',
+    ['model', 'method'])
+MODEL_BATCH_ROWS = Histogram(
+    'cattle_model_batch_rows', 'Rows scored per model call', ['model'], buckets=BATCH_BUCKETS)
+ERRORS = Counter(
+    'cattle_errors_total', 'Requests that failed, by route and exception type', ['route', 'exception'])
+MODEL_INFO = Gauge(
+    'cattle_model_info', 'Resident model versions (value is always 1)', ['model', 'version', 'format', 'family'])
+
+
+class StageTimer:
+    """Splits one request's time into named stages; call mark(stage) as each one ends"""
+
+    __slots__ = ('route', 'last')
+
+    def __init__(self, route):
+        self.route = route
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        REQUEST_STAGE_SECONDS.observe(now - self.last, route=self.route, stage=stage)
+        self.last = now
+
+
+def count_error(route, error):
+    ERRORS.inc(route=route, exception=type(error).__name__)
+
+
+def flush():
+    """Write this worker's counters and histograms to the shared directory"""
+    path = _file
+    if path is None:
+        return
+    values = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+              for metric in METRICS if metric.shared}
+    with _flush_lock:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(values, f)
+        os.replace(path + '.tmp', path)
+
+
+def _flush_loop(directory):
+    while _directory == directory:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def share(directory):
+    """Called first thing in each forked worker: start counting from zero and
+    publish to directory, so any worker's scrape covers them all (None stops)"""
+    global _directory, _file
+    _directory = directory
+    _file = None if directory is None else os.path.join(directory, f'{os.getpid()}-{time.time_ns()}.json')
+    if directory is None:
+        return
+    # Values recorded by the master before the fork belong to no worker
+    for metric in METRICS:
+        metric.clear()
+    flush()
+    threading.Thread(target=_flush_loop, args=(directory,), name='metrics-flush', daemon=True).start()
+
+
+def _other_workers():
+    """Every other worker's last flush, live or exited, by metric name"""
+    others = {}
+    for path in glob.glob(os.path.join(_directory, '*.json')):
+        if path == _file:
+            continue
+        try:
+            with open(path) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            continue  # replaced or removed while we read it
+        for name, pairs in values.items():
+            others.setdefault(name, []).append(pairs)
+    return others
+
+
+def render(metadata=None):
+    """Text exposition of every metric; metadata is the registry's per-model load info"""
+    if metadata is not None:
+        MODEL_INFO.clear()
+        for name, meta in metadata.items():
+            MODEL_INFO.set(1, model=name, version=meta.get('version'), format=meta.get('format'),
+                           family=meta.get('family'))
+    others = _other_workers() if _directory is not None else {}
+    return '\n'.join(metric.render(others.get(metric.name, ()) if metric.shared else ())
+                     for metric in METRICS) + '\n'
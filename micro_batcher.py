@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Async micro-batching for single-cow predictions
+Concurrent requests are queued for a few milliseconds, merged into one
+vectorized model call, and each request's future is resolved with its own row
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+# A batch is sent as soon as it is full or its oldest request has waited this long
+MAX_BATCH_SIZE = int(os.environ.get('CATTLE_BATCH_MAX_SIZE', 64))
+MAX_WAIT_MS = float(os.environ.get('CATTLE_BATCH_MAX_WAIT_MS', 5))
+
+# Recent batches kept for the size / queue-wait statistics
+STATS_WINDOW = 1000
+
+
+class MicroBatcher:
+    """Collects feature rows from concurrent coroutines into batched predict calls
+
+    ``predict`` takes an (n, n_features) array and returns n results; it runs
+    in the default thread pool so the event loop keeps accepting requests while
+    a batch is scored, and the next batch fills up in the meantime.
+    """
+
+    def __init__(self, predict, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name='batcher'):
+        self.predict = predict
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self._sizes = deque(maxlen=STATS_WINDOW)
+        self._waits = deque(maxlen=STATS_WINDOW)
+        self._pending = deque()
+        self._arrived = None
+        self._full = None
+        self._task = None
+        self._loop = None
+
+    def _ensure_running(self):
+        # Events and tasks belong to one event loop; start (or restart) on the current one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            if self._loop is not loop:
+                self._pending = deque()
+            self._arrived = asyncio.Event()
+            self._full = asyncio.Event()
+            self._loop = loop
+            self._task = loop.create_task(self._run(), name=f'{self.name}-micro-batcher')
+
+    async def submit(self, row):
+        """Queue one feature row and wait for its prediction"""
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._pending.append((np.asarray(row, dtype=float), future, time.perf_counter()))
+        self._arrived.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def _collect(self):
+        # Waiting on events rather than queue.get() means a timeout can never drop a request
+        await self._arrived.wait()
+        remaining = self._pending[0][2] + self.max_wait - time.perf_counter()
+        if len(self._pending) < self.max_batch_size and remaining > 0:
+            try:
+                await asyncio.wait_for(self._full.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        batch = [self._pending.popleft() for _ in range(min(self.max_batch_size, len(self._pending)))]
+        if not self._pending:
+            self._arrived.clear()
+        if len(self._pending) < self.max_batch_size:
+            self._full.clear()
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests cancelled while queued (client went away) are skipped
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(None, self.predict, np.vstack([row for row, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.rows += len(batch)
+            self._sizes.append(len(batch))
+            self._waits.extend(started - queued for _, _, queued in batch)
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self):
+        sizes = np.array(self._sizes)
+        waits = np.array(self._waits) * 1000
+        stats = {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'rows': self.rows,
+            'pending': len(self._pending),
+        }
+        if sizes.size:
+            stats['mean_batch_size'] = round(float(sizes.mean()), 2)
+            stats['queue_wait_ms'] = {
+                'p50': round(float(np.percentile(waits, 50)), 3),
+                'p99': round(float(np.percentile(waits, 99)), 3),
+            }
+        return stats
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Model registry for the Smart Dairy Farm Management System
+Loads the pipelines written by train_models.py once per worker and keeps them resident,
+preferring the flat memory-mapped forests so workers share one page-cached copy
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from features import MILK_FEATURES, DISEASE_FEATURES
+from flat_forest import FLAT_DIR, META_FILE, FlatForest, model_family
+from metrics import MODEL_INFERENCE_SECONDS, MODEL_BATCH_ROWS
+from prediction_cache import prediction_cache
+from rolling_features import ROLLING_FEATURES
+
+MODEL_DIR = os.environ.get('CATTLE_MODEL_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# Artifacts written by train_models.py
+MODEL_FILES = {
+    'milk': 'milk_production_model.pkl',
+    'disease': 'cattle_disease_detector.pkl',
+}
+ENSEMBLE_FILE = 'complete_detector.pkl'
+
+# 'auto' serves flat forests when an up-to-date export exists, 'pickle' never does
+MODEL_FORMAT = os.environ.get('CATTLE_MODEL_FORMAT', 'auto')
+
+# Input columns each model was fitted with
+MODEL_FEATURES = {
+    'milk': MILK_FEATURES,
+    'disease': DISEASE_FEATURES,
+}
+
+# Optional extra columns a model may be trained with (train_models.py --rolling-features)
+OPTIONAL_FEATURES = {
+    'disease': ROLLING_FEATURES,
+}
+
+# Number of recent predictions kept per model for latency percentiles
+LATENCY_WINDOW = 1000
+
+# Mastitis probability cut-offs, matching the rule-based risk levels in app.py
+HIGH_RISK_THRESHOLD = 0.7
+MEDIUM_RISK_THRESHOLD = 0.4
+
+
+def risk_level_for(probability):
+    """Map a mastitis probability onto the 'high'/'medium'/'low' recommendation levels"""
+    if probability >= HIGH_RISK_THRESHOLD:
+        return 'high'
+    if probability >= MEDIUM_RISK_THRESHOLD:
+        return 'medium'
+    return 'low'
+
+
+class ModelValidationError(Exception):
+    """Raised when a loaded artifact is not a usable pipeline"""
+
+
+class ModelRegistry:
+    """Holds the trained pipelines in memory and times every call into them
+
+    A farm's registry (see tenancy.py) reads its own model directory and serves
+    the fallback registry's model for any name it has no artifact for.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, cache=prediction_cache, fallback=None):
+        self.model_dir = model_dir
+        self.cache = cache
+        self.fallback = fallback
+        self.models = {}
+        self.metadata = {}
+        self.errors = {}
+        self._latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in MODEL_FILES}
+        self._counts = {name: 0 for name in MODEL_FILES}
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        return os.path.join(self.model_dir, filename)
+
+    def _read_pickle(self, filename):
+        with open(self._path(filename), 'rb') as f:
+            return pickle.load(f)
+
+    def _read_flat(self, name):
+        """Map a flat export, or return None if there is none or it predates the pickles"""
+        directory = self._path(os.path.join(FLAT_DIR, name))
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        pickles = [self._path(f) for f in (ENSEMBLE_FILE, MODEL_FILES[name]) if os.path.exists(self._path(f))]
+        if any(os.path.getmtime(p) > os.path.getmtime(meta_path) for p in pickles):
+            print(f"⚠️  Ignoring stale flat export of the {name} model; run train_models.py --export-flat")
+            return None
+        return FlatForest.load(directory)
+
+    def _validate(self, name, model):
+        """Check that a model exposes the expected API and features and can score a row"""
+        if not hasattr(model, 'predict'):
+            raise ModelValidationError(f"{name} model has no predict()")
+        if name == 'disease' and not hasattr(model, 'predict_proba'):
+            raise ModelValidationError("disease model has no predict_proba()")
+
+        expected = MODEL_FEATURES[name]
+        fitted = getattr(model, 'feature_names_in_', None)
+        if fitted is not None and list(fitted) not in (expected, expected + OPTIONAL_FEATURES.get(name, [])):
+            raise ModelValidationError(
+                f"{name} model was fitted on {list(fitted)}, expected {expected}")
+        expected = list(fitted) if fitted is not None else expected
+
+        # Smoke prediction so a broken pickle fails at startup rather than on a request
+        probe = pd.DataFrame(np.zeros((1, len(expected))), columns=expected)
+        model.predict(probe)
+
+    def load(self):
+        """Load every available artifact from disk, replacing any resident models"""
+        models, metadata, errors = {}, {}, {}
+
+        flat = {}
+        if MODEL_FORMAT != 'pickle':
+            for name in MODEL_FILES:
+                try:
+                    started = time.perf_counter()
+                    model = self._read_flat(name)
+                    if model is not None:
+                        flat[name] = (model, time.perf_counter() - started)
+                except Exception as e:
+                    errors[f'{name}_flat'] = str(e)
+
+        ensemble = None
+        ensemble_path = self._path(ENSEMBLE_FILE)
+        if len(flat) < len(MODEL_FILES) and os.path.exists(ensemble_path):
+            try:
+                started = time.perf_counter()
+                ensemble = self._read_pickle(ENSEMBLE_FILE)
+                ensemble_seconds = time.perf_counter() - started
+            except Exception as e:
+                errors['ensemble'] = str(e)
+
+        for name, filename in MODEL_FILES.items():
+            path = self._path(filename)
+            try:
+                if name in flat:
+                    model, load_seconds = flat[name]
+                    source = os.path.join(FLAT_DIR, name)
+                    size = sum(os.path.getsize(self._path(os.path.join(source, f)))
+                               for f in list(model.meta['files'].values()) + [META_FILE])
+                    version = model.meta.get('version') or datetime.fromtimestamp(
+                        os.path.getmtime(self._path(os.path.join(source, META_FILE)))).strftime('%Y-%m-%d %H:%M:%S')
+                elif ensemble is not None and f'{name}_model' in ensemble:
+                    # The ensemble bundle already holds both pipelines, so avoid a second copy
+                    model = ensemble[f'{name}_model']
+                    source = ENSEMBLE_FILE
+                    size = os.path.getsize(ensemble_path)
+                    load_seconds = ensemble_seconds
+                    version = ensemble.get('trained_date') or ensemble.get('version')
+                elif os.path.exists(path):
+                    started = time.perf_counter()
+                    model = self._read_pickle(filename)
+                    load_seconds = time.perf_counter() - started
+                    source = filename
+                    size = os.path.getsize(path)
+                    version = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
+                elif self.fallback is not None and self.fallback.is_loaded(name):
+                    # Already validated, and shared rather than copied
+                    models[name] = self.fallback.get(name)
+                    metadata[name] = dict(self.fallback.metadata[name], shared=True)
+                    continue
+                else:
+                    errors[name] = f"{filename} not found"
+                    continue
+
+                self._validate(name, model)
+                models[name] = model
+                metadata[name] = {
+                    'source': source,
+                    'version': str(version),
+                    'format': 'flat' if name in flat else 'pickle',
+                    # Chosen by train_models.py; only forests have a flat export
+                    'family': model_family(model),
+                    'size_bytes': size,
+                    'features': list(getattr(model, 'feature_names_in_', MODEL_FEATURES[name])),
+                    'load_seconds': round(load_seconds, 4),
+                    'loaded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                }
+            except Exception as e:
+                errors[name] = str(e)
+
+        with self._lock:
+            self.models = models
+            self.metadata = metadata
+            self.errors = errors
+            for name in MODEL_FILES:
+                self._latencies[name].clear()
+                self._counts[name] = 0
+        # Cached results belong to the models just replaced
+        self.cache.clear()
+
+        for name, meta in metadata.items():
+            print(f"✅ Loaded {name} model from {meta['source']} in {meta['load_seconds'] * 1000:.1f} ms")
+        for name, error in errors.items():
+            print(f"⚠️  Could not load {name} model: {error}")
+
+        return models
+
+    def get(self, name):
+        return self.models.get(name)
+
+    def is_loaded(self, name):
+        return name in self.models
+
+    def resident_bytes(self):
+        """Artifact bytes of the models this registry loaded itself (not shared ones)"""
+        return sum(meta['size_bytes'] for meta in self.metadata.values() if not meta.get('shared'))
+
+    def version(self, name):
+        return self.metadata.get(name, {}).get('version')
+
+    def pipeline(self, name):
+        """The sklearn pipeline behind a model, read from its pickle when the flat export is served"""
+        model = self.models.get(name)
+        if model is None:
+            raise ModelValidationError(f"{name} model is not loaded")
+        if not isinstance(model, FlatForest):
+            return model
+        if self.metadata.get(name, {}).get('shared'):
+            # A shared model's pickle lives with the registry it came from
+            return self.fallback.pipeline(name)
+        ensemble = self._read_pickle(ENSEMBLE_FILE) if os.path.exists(self._path(ENSEMBLE_FILE)) else {}
+        return ensemble.get(f'{name}_model') or self._read_pickle(MODEL_FILES[name])
+
+    def features(self, name):
+        """Columns the resident model expects, including any optional ones it was trained with"""
+        fitted = getattr(self.models.get(name), 'feature_names_in_', None)
+        return list(fitted) if fitted is not None else MODEL_FEATURES[name]
+
+    def _frame(self, name, X):
+        columns = self.features(name)
+        if isinstance(X, pd.DataFrame):
+            return X[columns]
+        if isinstance(self.models.get(name), FlatForest):
+            # Rows already in feature order go straight to the node tables, without a
+            # DataFrame or sklearn's input validation
+            return np.asarray(X, dtype=np.float64).reshape(-1, len(columns))
+        return pd.DataFrame(np.asarray(X, dtype=float).reshape(-1, len(columns)), columns=columns)
+
+    def _timed(self, name, method, X):
+        model = self.models.get(name)
+        if model is None:
+            raise ModelValidationError(f"{name} model is not loaded")
+        frame = self._frame(name, X)
+        started = time.perf_counter()
+        result = getattr(model, method)(frame)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies[name].append(elapsed)
+            self._counts[name] += 1
+        MODEL_INFERENCE_SECONDS.observe(elapsed, model=name, method=method)
+        MODEL_BATCH_ROWS.observe(len(frame), model=name)
+        return result
+
+    def predict(self, name, X):
+        """Run the resident pipeline's predict on a frame or array of feature rows"""
+        return self._timed(name, 'predict', X)
+
+    def predict_proba(self, name, X):
+        """Positive-class probability from the resident classifier"""
+        return self._timed(name, 'predict_proba', X)[:, 1]
+
+    def stats(self):
+        """Load metadata plus per-model latency percentiles in milliseconds"""
+        with self._lock:
+            latencies = {name: np.array(values) * 1000 for name, values in self._latencies.items()}
+            counts = dict(self._counts)
+
+        stats = {}
+        for name in MODEL_FILES:
+            entry = dict(self.metadata.get(name, {}))
+            entry['loaded'] = name in self.models
+            if name in self.errors:
+                entry['error'] = self.errors[name]
+            entry['predictions'] = counts[name]
+            entry['cache'] = self.cache.stats(name)
+            samples = latencies[name]
+            if samples.size:
+                entry['latency_ms'] = {
+                    'mean': round(float(samples.mean()), 3),
+                    'p50': round(float(np.percentile(samples, 50)), 3),
+                    'p95': round(float(np.percentile(samples, 95)), 3),
+                    'p99': round(float(np.percentile(samples, 99)), 3),
+                    'max': round(float(samples.max()), 3),
+                }
+            stats[name] = entry
+        return stats
+
+
+# One registry per worker process
+registry = ModelRegistry()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Versioned model snapshots for the Smart Dairy Farm Management System
+Every full or incremental training run is kept as a numbered snapshot; the
+active one is copied to the artifact paths the model registry loads from,
+including its flat memory-mappable export and the rolling herd state it was
+trained against
+"""
+
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+from flat_forest import export_flat_models
+from rolling_features import HERD_STATE_FILE
+
+SNAPSHOT_DIR = os.environ.get('CATTLE_SNAPSHOT_DIR', 'model_snapshots')
+CURRENT_FILE = 'CURRENT'
+BUNDLE_FILE = 'complete_detector.pkl'
+MANIFEST_FILE = 'manifest.json'
+HERD_STATE_SNAPSHOT = 'herd_state.npz'
+
+# Live artifacts written on activation (see model_registry.MODEL_FILES / ENSEMBLE_FILE)
+LIVE_FILES = {
+    'milk_model': 'milk_production_model.pkl',
+    'disease_model': 'cattle_disease_detector.pkl',
+}
+LIVE_BUNDLE = 'complete_detector.pkl'
+
+
+def _atomic_pickle(obj, path):
+    partial = f'{path}.{os.getpid()}.partial'
+    with open(partial, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(partial, path)
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    """Manifests of all snapshots, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def current_version(directory=SNAPSHOT_DIR):
+    path = os.path.join(directory, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+def set_current(version, directory=SNAPSHOT_DIR):
+    with open(os.path.join(directory, CURRENT_FILE), 'w') as f:
+        f.write(version)
+
+
+def save_snapshot(milk_model, disease_model, info, selection=None, directory=SNAPSHOT_DIR, herd_state=None):
+    """Store a new numbered snapshot and return (version, bundle)
+
+    selection is train_models' per-task model choice, kept in the bundle so the
+    registry can report it after activation. herd_state is the RollingFeatureEngine
+    that goes live with a rolling-feature disease model.
+    """
+    os.makedirs(directory, exist_ok=True)
+    existing = [m['version'] for m in list_snapshots(directory)]
+    version = f"v{len(existing) + 1:04d}"
+    while version in existing or os.path.exists(os.path.join(directory, version)):
+        version = f"v{int(version[1:]) + 1:04d}"
+
+    created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    bundle = {
+        'milk_model': milk_model,
+        'disease_model': disease_model,
+        'version': version,
+        'trained_date': created,
+        'model_selection': selection or {},
+    }
+    snapshot_dir = os.path.join(directory, version)
+    os.makedirs(snapshot_dir)
+    _atomic_pickle(bundle, os.path.join(snapshot_dir, BUNDLE_FILE))
+    if herd_state is not None:
+        herd_state.save(os.path.join(snapshot_dir, HERD_STATE_SNAPSHOT))
+
+    manifest = dict(info, version=version, created_at=created, parent=current_version(directory))
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return version, bundle
+
+
+def load_snapshot(version, directory=SNAPSHOT_DIR):
+    with open(os.path.join(directory, version, BUNDLE_FILE), 'rb') as f:
+        return pickle.load(f)
+
+
+def activate(version, directory=SNAPSHOT_DIR, model_dir='.', herd_state_file=HERD_STATE_FILE):
+    """Make a snapshot the live model set (also used for rollback)"""
+    source = os.path.join(directory, version, BUNDLE_FILE)
+    if not os.path.exists(source):
+        raise ValueError(f"no snapshot {version} in {directory}")
+    bundle = load_snapshot(version, directory)
+    for key, filename in LIVE_FILES.items():
+        _atomic_pickle(bundle[key], os.path.join(model_dir, filename))
+    partial = os.path.join(model_dir, f'{LIVE_BUNDLE}.{os.getpid()}.partial')
+    shutil.copyfile(source, partial)
+    os.replace(partial, os.path.join(model_dir, LIVE_BUNDLE))
+    export_flat_models(bundle, model_dir)
+    herd_state = os.path.join(directory, version, HERD_STATE_SNAPSHOT)
+    if os.path.exists(herd_state):
+        # The serving apps reseed their shared herd state when this file changes
+        partial = f'{herd_state_file}.{os.getpid()}.partial'
+        shutil.copyfile(herd_state, partial)
+        os.replace(partial, herd_state_file)
+
+    set_current(version, directory)
+    return bundle
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Prediction cache for the Smart Dairy Farm Management System
+Parlour terminals and the dashboard resend the same inputs many times a day, so
+single-row predictions are kept in a bounded LRU with a time-to-live, keyed on
+the model, its version and the rounded feature vector
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+# Entries kept (0 disables the cache) and how long each stays valid
+CACHE_SIZE = int(os.environ.get('CATTLE_CACHE_SIZE', 10000))
+CACHE_TTL = float(os.environ.get('CATTLE_CACHE_TTL', 300))
+
+# Feature values are rounded to this many decimals before keying, so e.g. 12.5 and
+# 12.5000001 share an entry
+CACHE_DECIMALS = int(os.environ.get('CATTLE_CACHE_DECIMALS', 3))
+
+COUNTERS = ['hits', 'misses', 'evictions', 'expirations']
+
+
+def cache_key(name, version, row, decimals=CACHE_DECIMALS):
+    """Canonical key for one feature row: model name, model version and rounded values"""
+    # Adding 0.0 turns -0.0 into 0.0 so both round to the same bytes
+    values = np.round(np.asarray(row, dtype=np.float64).ravel(), decimals) + 0.0
+    return (name, str(version), values.tobytes())
+
+
+class PredictionCache:
+    """Thread-safe LRU of prediction results with per-entry expiry
+
+    Each worker process holds its own cache; a model reload clears it, and the
+    model version in every key keeps results from different models apart.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max(0, int(max_size))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._counts = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached result for a key from cache_key(), or None"""
+        if not self.max_size:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            counts = self._counts[key[0]]
+            entry = self._entries.get(key)
+            if entry is None:
+                counts['misses'] += 1
+                return None
+            value, expires = entry
+            if expires <= now:
+                del self._entries[key]
+                counts['expirations'] += 1
+                counts['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            counts['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._counts[evicted[0]]['evictions'] += 1
+
+    def clear(self):
+        """Drop every entry (called when new models are loaded)"""
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self, name=None):
+        """Counters for one model (or all of them) plus the shared size limits"""
+        with self._lock:
+            if name is None:
+                counts = dict.fromkeys(COUNTERS, 0)
+                for model_counts in self._counts.values():
+                    for counter in COUNTERS:
+                        counts[counter] += model_counts[counter]
+                entries = len(self._entries)
+            else:
+                counts = dict(self._counts[name])
+                entries = sum(1 for key in self._entries if key[0] == name)
+            invalidations = self._invalidations
+
+        lookups = counts['hits'] + counts['misses']
+        return {
+            **counts,
+            'hit_rate': round(counts['hits'] / lookups, 4) if lookups else None,
+            'entries': entries,
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'invalidations': invalidations,
+        }
+
+
+# One cache per worker process
+prediction_cache = PredictionCache()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Persistent prediction history for the Smart Dairy Farm Management System
+Every prediction is appended to a file-backed SQLite log (WAL mode) by a
+background writer, so logging never adds latency to the prediction routes
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+DB_PATH = os.environ.get('CATTLE_HISTORY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prediction_history.db'))
+
+# Writer batching: flush after this many rows or this many seconds, whichever first
+WRITE_BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+
+# Queued writes (a single prediction or a whole batch); when full new rows are dropped and counted
+MAX_PENDING = 100000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    cow_id TEXT,
+    predicted_milk REAL,
+    probability REAL,
+    risk_level TEXT,
+    model_version TEXT,
+    inputs TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_cow_day ON predictions (cow_id, day);
+CREATE INDEX IF NOT EXISTS idx_predictions_day_risk ON predictions (day, risk_level);
+CREATE INDEX IF NOT EXISTS idx_predictions_risk_day ON predictions (risk_level, day);
+'''
+
+COLUMNS = ['created_at', 'day', 'kind', 'cow_id', 'predicted_milk', 'probability',
+           'risk_level', 'model_version', 'inputs']
+
+
+class PredictionStore:
+    """Append-only prediction log with indexed per-cow, per-day and per-risk queries"""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._local = threading.local()
+        self._writer = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._connections = []
+        self._generation = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    conn = self._connect()
+                    conn.executescript(SCHEMA)
+                    conn.close()
+                    self._schema_ready = True
+
+    def _reader(self):
+        """One read connection per thread (and per process after a fork)"""
+        self._ensure_schema()
+        conn = getattr(self._local, 'conn', None)
+        if (conn is None or getattr(self._local, 'pid', None) != os.getpid()
+                or self._local.generation != self._generation):
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.generation = self._generation
+            with self._lock:
+                self._connections.append((os.getpid(), conn))
+        return conn
+
+    def _ensure_writer(self):
+        # Threads do not survive fork(), so each worker process starts its own writer
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer_pid != os.getpid() or not self._writer.is_alive():
+                self._queue = queue.Queue(maxsize=MAX_PENDING)
+                self._writer = threading.Thread(target=self._write_loop, name='prediction-store-writer', daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    def _write_loop(self):
+        self._ensure_schema()
+        conn = self._connect()
+        pending = self._queue
+        while True:
+            # Each queued item is a list of rows: one for single predictions, many for batches.
+            # None (queued by close()) stops the writer after what came before it is written.
+            items = [pending.get()]
+            rows = list(items[0] or [])
+            try:
+                while items[-1] is not None and len(rows) < WRITE_BATCH_SIZE:
+                    items.append(pending.get(timeout=FLUSH_INTERVAL))
+                    rows.extend(items[-1] or [])
+            except queue.Empty:
+                pass
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany(
+                            f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                            rows)
+                    self.written += len(rows)
+            except sqlite3.Error as e:
+                print(f"⚠️  Could not write {len(rows)} predictions: {e}")
+            for _ in items:
+                pending.task_done()
+            if items[-1] is None:
+                conn.close()
+                return
+
+    def _enqueue(self, rows):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            self.dropped += len(rows)
+
+    def record(self, kind, cow_id=None, predicted_milk=None, probability=None,
+               risk_level=None, model_version=None, inputs=None, timestamp=None):
+        """Queue one prediction for the background writer; never blocks"""
+        timestamp = timestamp or datetime.now()
+        self._enqueue([(
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            timestamp.strftime('%Y-%m-%d'),
+            kind,
+            None if cow_id is None else str(cow_id),
+            predicted_milk,
+            probability,
+            risk_level,
+            model_version,
+            json.dumps(inputs) if inputs is not None else None,
+        )])
+
+    def record_batch(self, kind, results, model_version=None):
+        """Queue every scored row of a batch response"""
+        timestamp = datetime.now()
+        created_at, day = timestamp.strftime('%Y-%m-%d %H:%M:%S'), timestamp.strftime('%Y-%m-%d')
+        rows = [
+            (created_at, day, kind, None if result.get('cow_id') is None else str(result['cow_id']),
+             result.get('predicted_milk'), result.get('probability'), result.get('risk_level'),
+             model_version, None)
+            for result in results if 'error' not in result
+        ]
+        if rows:
+            self._enqueue(rows)
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Write what is queued, stop this process's writer and close its connections
+
+        The store stays usable: the next record or query opens them again.
+        """
+        with self._lock:
+            if self._writer_pid == os.getpid() and self._writer.is_alive():
+                self._queue.put(None)
+                self._writer.join()
+            self._writer_pid = None
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for pid, conn in connections:
+            if pid == os.getpid():
+                conn.close()
+
+    def _where(self, cow_id=None, kind=None, risk_levels=None, since=None, until=None):
+        clauses, params = [], []
+        if cow_id is not None:
+            clauses.append('cow_id = ?')
+            params.append(str(cow_id))
+        if since is not None:
+            clauses.append('day >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('day <= ?')
+            params.append(until)
+        if risk_levels:
+            clauses.append(f"risk_level IN ({', '.join('?' * len(risk_levels))})")
+            params.extend(risk_levels)
+        if kind is not None:
+            clauses.append('kind = ?')
+            params.append(kind)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def history(self, cow_id=None, days=None, kind=None, risk_levels=None, limit=100):
+        """Most recent predictions, optionally for one cow over the last N days"""
+        since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d') if days else None
+        where, params = self._where(cow_id, kind, risk_levels, since)
+        conn = self._reader()
+        rows = conn.execute(
+            f'SELECT * FROM predictions{where} ORDER BY id DESC LIMIT ?',
+            params + [int(limit)]).fetchall()
+        total = conn.execute(f'SELECT COUNT(*) FROM predictions{where}', params).fetchone()[0]
+        return [dict(row) for row in rows], total
+
+    def cows_at_risk(self, day=None, risk_levels=('high',)):
+        """Cows whose latest mastitis score of the day is at one of the levels, e.g. all high-risk cows today
+
+        A cow scored high in the morning and low later that day is not listed.
+        """
+        day = day or datetime.now().strftime('%Y-%m-%d')
+        where, params = self._where(kind='disease', since=day, until=day)
+        rows = self._reader().execute(
+            f'SELECT * FROM predictions WHERE id IN (SELECT MAX(id) FROM predictions{where} GROUP BY cow_id) '
+            f"AND risk_level IN ({', '.join('?' * len(risk_levels))}) ORDER BY probability DESC",
+            params + list(risk_levels)).fetchall()
+        return [dict(row) for row in rows]
+
+    def max_id(self):
+        """Highest row id written so far; changes whenever new predictions land"""
+        return self._reader().execute('SELECT MAX(id) FROM predictions').fetchone()[0] or 0
+
+    def flagged_between(self, after_id, upto_id, risk_levels=('high', 'medium')):
+        """Disease scores at the given risk levels with after_id < id <= upto_id, oldest first"""
+        rows = self._reader().execute(
+            f"SELECT * FROM predictions WHERE id > ? AND id <= ? AND kind = 'disease' "
+            f"AND risk_level IN ({', '.join('?' * len(risk_levels))}) ORDER BY id",
+            (after_id, upto_id, *risk_levels)).fetchall()
+        return [dict(row) for row in rows]
+
+    def daily_yield(self, since, until):
+        """Mean predicted litres per cow per day over a window"""
+        rows = self._reader().execute(
+            "SELECT cow_id, day, AVG(predicted_milk) AS liters, COUNT(*) AS n FROM predictions "
+            "WHERE day >= ? AND day <= ? AND kind = 'milk' AND cow_id IS NOT NULL "
+            "GROUP BY cow_id, day ORDER BY cow_id, day",
+            (since, until)).fetchall()
+        return [dict(row) for row in rows]
+
+    def risk_summary(self, since, until, risk_levels=('high', 'medium')):
+        """Per-cow count and peak probability of flagged mastitis scores over a window"""
+        rows = self._reader().execute(
+            f"SELECT cow_id, COUNT(*) AS alerts, MAX(probability) AS peak_probability, "
+            f"MAX(day) AS last_day, SUM(risk_level = 'high') AS high_alerts FROM predictions "
+            f"WHERE day >= ? AND day <= ? AND risk_level IN ({', '.join('?' * len(risk_levels))}) "
+            f"AND kind = 'disease' GROUP BY cow_id ORDER BY high_alerts DESC, peak_probability DESC",
+            (since, until, *risk_levels)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'pending': self._queue.qsize()}
+
+
+# One store per process; the writer thread starts on first use
+store = PredictionStore()
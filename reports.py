@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Farm report generation for the Smart Dairy Farm Management System
+Reports are built from the prediction history and rendered in a background
+process pool; rendered files double as a cache keyed by farm, window and data
+"""
+
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from prediction_store import PredictionStore, DB_PATH
+
+REPORT_DIR = os.environ.get('CATTLE_REPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_cache'))
+REPORT_WORKERS = 2
+
+# Rendered reports are reused for this long; a pending job older than the timeout is failed
+REPORT_MAX_AGE = 7 * 24 * 3600
+REPORT_TIMEOUT = 10 * 60
+
+# Days at the start and end of the window compared for the per-cow trend
+TREND_DAYS = 7
+
+JOB_ID = re.compile(r'^[0-9a-f]{20}_(csv|pdf)$')
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+
+def build_report_data(db_path, since, until):
+    """Per-cow yield trends and mastitis alerts for a window of the prediction history"""
+    history = PredictionStore(db_path)
+    daily = pd.DataFrame(history.daily_yield(since, until), columns=['cow_id', 'day', 'liters', 'n'])
+    alerts = history.risk_summary(since, until)
+
+    cows = []
+    if not daily.empty:
+        for cow_id, rows in daily.groupby('cow_id', sort=True):
+            liters = rows['liters'].to_numpy()
+            window = min(TREND_DAYS, max(1, len(liters) // 2))
+            cows.append({
+                'cow_id': cow_id,
+                'days': len(liters),
+                'mean_liters': round(float(liters.mean()), 2),
+                'trend_liters': round(float(liters[-window:].mean() - liters[:window].mean()), 2),
+                'last_liters': round(float(liters[-1]), 2),
+            })
+
+    return {
+        'cows': cows,
+        'alerts': alerts,
+        'total_liters': round(float(daily['liters'].sum()), 1) if not daily.empty else 0.0,
+        'high_risk_cows': sum(1 for a in alerts if a['high_alerts']),
+    }
+
+
+def render_csv(data, meta, path):
+    rows = [
+        ['Report Type', 'Generated Date', 'Farm Name', 'User', 'From', 'To'],
+        ['Cattle Monitoring Report', meta['generated'], meta['farm_name'], meta['user'], meta['since'], meta['until']],
+        [],
+        ['Cow ID', 'Days Recorded', 'Mean Predicted Liters', f'Trend (last vs first {TREND_DAYS} days)', 'Last Liters'],
+    ]
+    rows += [[c['cow_id'], c['days'], c['mean_liters'], c['trend_liters'], c['last_liters']] for c in data['cows']]
+    rows += [[], ['Cow ID', 'Mastitis Alerts', 'High Risk Alerts', 'Peak Probability', 'Last Alert Day']]
+    rows += [[a['cow_id'], a['alerts'], a['high_alerts'], round(a['peak_probability'] or 0, 3), a['last_day']]
+             for a in data['alerts']]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def render_pdf(data, meta, path):
+    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(path, pagesize=letter)
+    story = [
+        Paragraph("Cattle Monitoring Report", styles['Title']),
+        Spacer(1, 12),
+        Paragraph(f"Generated: {meta['generated']}", styles['Normal']),
+        Paragraph(f"Farm: {meta['farm_name']}", styles['Normal']),
+        Paragraph(f"User: {meta['user']}", styles['Normal']),
+        Paragraph(f"Period: {meta['since']} to {meta['until']}", styles['Normal']),
+        Spacer(1, 20),
+    ]
+
+    summary = [
+        ['Cows with yield data', 'Total predicted liters', 'Cows with alerts', 'High risk cows'],
+        [len(data['cows']), data['total_liters'], len(data['alerts']), data['high_risk_cows']],
+    ]
+    models = [['Model', 'Version']] + [[name, version or 'not loaded'] for name, version in meta['models'].items()]
+    for table_rows in (summary, models):
+        table = Table(table_rows)
+        table.setStyle(TABLE_STYLE)
+        story += [table, Spacer(1, 20)]
+
+    story.append(Paragraph("Mastitis Alerts", styles['Heading2']))
+    if data['alerts']:
+        rows = [['Cow ID', 'Alerts', 'High Risk', 'Peak Probability', 'Last Alert']]
+        rows += [[a['cow_id'], a['alerts'], a['high_alerts'], f"{(a['peak_probability'] or 0) * 100:.0f}%", a['last_day']]
+                 for a in data['alerts']]
+        table = Table(rows, repeatRows=1)
+        table.setStyle(TABLE_STYLE)
+        story.append(table)
+    else:
+        story.append(Paragraph("No high or medium risk scores in this period.", styles['Normal']))
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("Per-Cow Yield Trend", styles['Heading2']))
+    if data['cows']:
+        rows = [['Cow ID', 'Days', 'Mean Liters', 'Trend', 'Last Liters']]
+        rows += [[c['cow_id'], c['days'], c['mean_liters'], f"{c['trend_liters']:+.2f}", c['last_liters']]
+                 for c in data['cows']]
+        table = Table(rows, repeatRows=1)
+        table.setStyle(TABLE_STYLE)
+        story.append(table)
+    else:
+        story.append(Paragraph("No milk yield predictions in this period.", styles['Normal']))
+
+    doc.build(story)
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'pdf': render_pdf,
+}
+
+
+def render_report(db_path, meta, fmt, path):
+    """Worker-process entry point: build and render one report, then clear its pending marker"""
+    try:
+        data = build_report_data(db_path, meta['since'], meta['until'])
+        partial = f'{path}.partial'
+        RENDERERS[fmt](data, meta, partial)
+        os.replace(partial, path)
+    except Exception as e:
+        with open(f'{path}.error', 'w') as f:
+            f.write(str(e))
+    finally:
+        if os.path.exists(f'{path}.pending'):
+            os.remove(f'{path}.pending')
+    return path
+
+
+class ReportJobs:
+    """Submits report renders to a process pool and tracks them through marker files
+
+    Job state lives next to the rendered file (.pending / .error, and .owner for
+    the user and farm that asked for it), so any worker process can answer a
+    status poll or serve the download.
+    """
+
+    def __init__(self, directory=REPORT_DIR, db_path=DB_PATH, workers=REPORT_WORKERS):
+        self.directory = directory
+        self.db_path = db_path
+        self.workers = workers
+        self._pool = None
+        self._pool_pid = None
+
+    def _executor(self):
+        # Pools are per process; spawn avoids forking the web server's threads
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.{job_id.rsplit('_', 1)[1]}")
+
+    def job_id(self, farm_name, user, since, until, fmt, watermark, models, db_path=None):
+        # The user and model versions are printed in the report, so a reload or another user renders anew
+        versions = ','.join(f'{name}={version}' for name, version in sorted(models.items()))
+        key = '|'.join(str(part) for part in (farm_name, user, since, until, fmt, watermark, versions,
+                                              db_path or self.db_path))
+        return f"{hashlib.sha1(key.encode()).hexdigest()[:20]}_{fmt}"
+
+    def _cleanup(self):
+        cutoff = time.time() - REPORT_MAX_AGE
+        for name in os.listdir(self.directory):
+            full = os.path.join(self.directory, name)
+            if os.path.getmtime(full) < cutoff:
+                os.remove(full)
+
+    def owner(self, job_id):
+        """{'user', 'farm_id'} a job was submitted for, or None"""
+        try:
+            with open(f'{self.path(job_id)}.owner') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def submit(self, farm_name, user, since, until, fmt, watermark, models, db_path=None, farm_id=None):
+        """Start rendering unless an identical report is cached or already in progress
+
+        db_path picks the farm's prediction history (default: the shared one);
+        user and farm_id are recorded as the job's owner (see status).
+        """
+        if fmt not in RENDERERS:
+            raise ValueError(f"format must be one of {sorted(RENDERERS)}")
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = self.job_id(farm_name, user, since, until, fmt, watermark, models, db_path)
+        path = self.path(job_id)
+        # The job ID covers the user and history, so the owner is the same whoever writes it
+        partial = f'{path}.{os.getpid()}.owner.partial'
+        with open(partial, 'w') as f:
+            json.dump({'user': user, 'farm_id': farm_id}, f)
+        os.replace(partial, f'{path}.owner')
+        if self.status(job_id)['status'] in ('done', 'pending'):
+            return job_id
+
+        self._cleanup()
+        if os.path.exists(f'{path}.error'):
+            os.remove(f'{path}.error')
+        open(f'{path}.pending', 'w').close()
+        meta = {
+            'farm_name': farm_name,
+            'user': user,
+            'since': since,
+            'until': until,
+            'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'models': models,
+        }
+        self._executor().submit(render_report, db_path or self.db_path, meta, fmt, path)
+        return job_id
+
+    def status(self, job_id, owner=None):
+        """A job's state; with owner ({'user', 'farm_id'}), another user's or farm's job is 'unknown'"""
+        if not JOB_ID.match(job_id) or (owner is not None and self.owner(job_id) != owner):
+            return {'job_id': job_id, 'status': 'unknown'}
+        path = self.path(job_id)
+        if os.path.exists(path):
+            return {'job_id': job_id, 'status': 'done'}
+        if os.path.exists(f'{path}.error'):
+            with open(f'{path}.error') as f:
+                return {'job_id': job_id, 'status': 'failed', 'error': f.read()}
+        if os.path.exists(f'{path}.pending'):
+            if time.time() - os.path.getmtime(f'{path}.pending') > REPORT_TIMEOUT:
+                return {'job_id': job_id, 'status': 'failed', 'error': 'report rendering timed out'}
+            return {'job_id': job_id, 'status': 'pending'}
+        return {'job_id': job_id, 'status': 'unknown'}
+
+
+# One job tracker per process; the pool starts on first submit
+report_jobs = ReportJobs()
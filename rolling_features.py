@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Rolling per-cow features for the mastitis model
+Each cow keeps a small ring of recent daily sensor readings, an exponentially
+weighted baseline and its mastitis history; a new day updates them in O(1).
+Training, batch scoring and single-cow scoring all go through transform(), so
+offline and online features come from the same code. The live serving state is
+kept in SQLite, one row per cow, so every worker process continues the same
+history; batch and upload scoring use a throwaway engine and leave it alone.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from features import SENSOR_COLUMNS, udder_features
+
+HERD_STATE_FILE = os.environ.get('CATTLE_HERD_STATE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'herd_state.npz'))
+
+# Live per-cow state shared by the serving workers, seeded from HERD_STATE_FILE
+HERD_STATE_DB = os.environ.get('CATTLE_HERD_STATE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'herd_state.db'))
+
+# Days averaged for the rolling means and the asymmetry trend
+ROLLING_WINDOW_DAYS = 3
+
+# Weight of a new day in each cow's sensor baseline
+BASELINE_ALPHA = 0.2
+
+# days_since_mastitis for cows never flagged with Previous_Mastits_status
+NO_MASTITIS_HISTORY = -1
+
+ROLLING_FEATURES = (
+    [f'{c.lower()}_roll_mean' for c in SENSOR_COLUMNS]
+    + [f'{c.lower()}_baseline_delta' for c in SENSOR_COLUMNS]
+    + ['asymmetry', 'asymmetry_trend', 'days_since_mastitis']
+)
+
+STATE_ARRAYS = ['days_seen', 'count', 'pos', 'last_day', 'ring', 'asym_ring', 'sums', 'asym_sum',
+                'baseline', 'base_prev', 'has_mastitis', 'mastitis_day']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cow_rolling_state (
+    cow_id TEXT PRIMARY KEY,
+    state BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS herd_state_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+def uses_rolling_features(columns):
+    """True if a model was fitted with the rolling feature columns"""
+    return columns is not None and set(ROLLING_FEATURES) <= set(columns)
+
+
+class RollingFeatureEngine:
+    """Per-cow rolling state in flat arrays (one slot per cow, grown by doubling)
+
+    About 0.5 KB per cow, so a 10,000-cow herd fits in ~5 MB. A second reading
+    for a cow's latest day replaces that day instead of adding another.
+    """
+
+    def __init__(self, window=ROLLING_WINDOW_DAYS, alpha=BASELINE_ALPHA, capacity=1024):
+        self.window = window
+        self.alpha = alpha
+        self.slots = {}
+        self._lock = threading.Lock()
+        self._capacity = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        n, w, s = capacity, self.window, len(SENSOR_COLUMNS)
+        fresh = {
+            'days_seen': np.zeros(n, np.int64),
+            'count': np.zeros(n, np.int64),
+            'pos': np.zeros(n, np.int64),
+            'last_day': np.zeros(n, np.int64),
+            'ring': np.zeros((n, w, s)),
+            'asym_ring': np.zeros((n, w)),
+            'sums': np.zeros((n, s)),
+            'asym_sum': np.zeros(n),
+            'baseline': np.zeros((n, s)),
+            'base_prev': np.zeros((n, s)),
+            'has_mastitis': np.zeros(n, bool),
+            'mastitis_day': np.zeros(n, np.int64),
+        }
+        for name, array in fresh.items():
+            if self._capacity:
+                array[:self._capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self._capacity = capacity
+
+    def _slots_for(self, cow_ids):
+        slots = np.empty(len(cow_ids), np.int64)
+        for i, cow_id in enumerate(cow_ids):
+            slot = self.slots.get(cow_id)
+            if slot is None:
+                slot = self.slots[cow_id] = len(self.slots)
+            slots[i] = slot
+        if len(self.slots) > self._capacity:
+            self._grow(max(len(self.slots), 2 * self._capacity))
+        return slots
+
+    def _update(self, slots, days, sensors, previous_mastitis):
+        """Advance each cow (unique within the call) by one day and return its features"""
+        w, a = self.window, self.alpha
+        same = (self.days_seen[slots] > 0) & (self.last_day[slots] == days)
+
+        # Same day again: take the day's previous contribution back out
+        revised = slots[same]
+        revised_pos = (self.pos[revised] - 1) % w
+        self.sums[revised] -= self.ring[revised, revised_pos]
+        self.asym_sum[revised] -= self.asym_ring[revised, revised_pos]
+        self.baseline[revised] = self.base_prev[revised]
+
+        # New day: evict the oldest day once the ring is full
+        added = slots[~same]
+        added_pos = self.pos[added]
+        full = self.count[added] == w
+        self.sums[added] -= np.where(full[:, None], self.ring[added, added_pos], 0.0)
+        self.asym_sum[added] -= np.where(full, self.asym_ring[added, added_pos], 0.0)
+        self.count[added] = np.minimum(self.count[added] + 1, w)
+        self.pos[added] = (added_pos + 1) % w
+        self.days_seen[added] += 1
+        self.base_prev[added] = self.baseline[added]
+
+        pos = np.empty(len(slots), np.int64)
+        pos[same], pos[~same] = revised_pos, added_pos
+        has_history = (self.days_seen[slots] > 1)[:, None]
+        earlier = self.count[slots] - 1
+
+        asymmetry = udder_features(sensors)['max_diff']
+        asymmetry_trend = np.where(earlier > 0, asymmetry - self.asym_sum[slots] / np.maximum(earlier, 1), 0.0)
+        delta = np.where(has_history, sensors - self.base_prev[slots], 0.0)
+
+        self.ring[slots, pos] = sensors
+        self.asym_ring[slots, pos] = asymmetry
+        self.sums[slots] += sensors
+        self.asym_sum[slots] += asymmetry
+        self.baseline[slots] = np.where(has_history, (1 - a) * self.base_prev[slots] + a * sensors, sensors)
+        self.last_day[slots] = days
+
+        flagged = (previous_mastitis > 0) & ~self.has_mastitis[slots]
+        self.mastitis_day[slots[flagged]] = days[flagged]
+        self.has_mastitis[slots[flagged]] = True
+        days_since = np.where(self.has_mastitis[slots], days - self.mastitis_day[slots], NO_MASTITIS_HISTORY)
+
+        roll_mean = self.sums[slots] / self.count[slots][:, None]
+        return np.column_stack([roll_mean, delta, asymmetry, asymmetry_trend, days_since])
+
+    def transform(self, cow_ids, days, sensors, previous_mastitis):
+        """Rolling features for readings in any order, returned in input order
+
+        Rows are applied per cow in day order; each round takes at most one row
+        per cow so the whole herd advances in a single vectorized update.
+        """
+        cow_ids = np.asarray([str(c) for c in cow_ids], dtype=object)
+        days = np.asarray(days, dtype=np.int64)
+        sensors = np.asarray(sensors, dtype=float).reshape(-1, len(SENSOR_COLUMNS))
+        previous_mastitis = np.asarray(previous_mastitis, dtype=float)
+        n = len(cow_ids)
+
+        order = np.lexsort((np.arange(n), days, cow_ids.astype(str)))
+        ordered = cow_ids[order]
+        starts = np.r_[True, ordered[1:] != ordered[:-1]] if n else np.zeros(0, bool)
+        rank = np.arange(n) - np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+
+        out = np.empty((n, len(ROLLING_FEATURES)))
+        with self._lock:
+            slots = np.empty(n, np.int64)
+            slots[order] = self._slots_for(ordered)
+            for r in range(int(rank.max()) + 1 if n else 0):
+                idx = order[rank == r]
+                out[idx] = self._update(slots[idx], days[idx], sensors[idx], previous_mastitis[idx])
+        return out
+
+    def frame(self, features, cow_ids, days, previous_mastitis):
+        """Append the rolling columns to a DISEASE_FEATURES frame"""
+        values = self.transform(cow_ids, days, features[SENSOR_COLUMNS].to_numpy(), previous_mastitis)
+        rolling = pd.DataFrame(values, columns=ROLLING_FEATURES, index=features.index)
+        return pd.concat([features, rolling], axis=1)
+
+    def export_rows(self, slots):
+        """Each slot's whole state as one float64 row (see import_rows)"""
+        return np.hstack([getattr(self, name)[slots].reshape(len(slots), -1).astype(np.float64)
+                          for name in STATE_ARRAYS])
+
+    def import_rows(self, slots, rows):
+        start = 0
+        for name in STATE_ARRAYS:
+            array = getattr(self, name)
+            width = int(np.prod(array.shape[1:]))
+            array[slots] = rows[:, start:start + width].reshape((len(slots),) + array.shape[1:]).astype(array.dtype)
+            start += width
+
+    def save(self, path=HERD_STATE_FILE):
+        with self._lock:
+            n = len(self.slots)
+            arrays = {name: getattr(self, name)[:n] for name in STATE_ARRAYS}
+            cows = np.array(sorted(self.slots, key=self.slots.get), dtype=str)
+            partial = f'{path}.{os.getpid()}.partial.npz'
+            np.savez(partial, cow_ids=cows, window=self.window, alpha=self.alpha, **arrays)
+            os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path=HERD_STATE_FILE):
+        with np.load(path) as state:
+            engine = cls(window=int(state['window']), alpha=float(state['alpha']),
+                         capacity=max(1024, len(state['cow_ids'])))
+            n = len(state['cow_ids'])
+            for name in STATE_ARRAYS:
+                getattr(engine, name)[:n] = state[name]
+            engine.slots = {str(cow_id): i for i, cow_id in enumerate(state['cow_ids'])}
+        return engine
+
+    def restore(self, path=HERD_STATE_FILE):
+        """Replace this engine's state with the saved one, if a file exists"""
+        if not os.path.exists(path):
+            return False
+        loaded = RollingFeatureEngine.load(path)
+        with self._lock:
+            self.window, self.alpha, self.slots = loaded.window, loaded.alpha, loaded.slots
+            self._capacity = loaded._capacity
+            for name in STATE_ARRAYS:
+                setattr(self, name, getattr(loaded, name))
+        return True
+
+
+class SharedHerdState:
+    """Live rolling state in SQLite, shared by every worker process
+
+    Each cow's state is one fixed-width row. Scoring reads the cows it needs into
+    a scratch engine, advances them and writes them back in one IMMEDIATE
+    transaction, so a cow's features do not depend on which worker scores it.
+    restore() seeds the table from the file train_models.py writes, and seeds it
+    again whenever training writes a new one.
+    """
+
+    def __init__(self, path=HERD_STATE_DB, seed=HERD_STATE_FILE):
+        self.path = path
+        self.seed = seed
+        self.window = ROLLING_WINDOW_DAYS
+        self.alpha = BASELINE_ALPHA
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+
+    def _conn(self):
+        """One connection per thread (and per process after a fork), in autocommit mode"""
+        conn = getattr(self._local, 'conn', None)
+        if (conn is None or getattr(self._local, 'pid', None) != os.getpid()
+                or self._local.generation != self._generation):
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.generation = self._generation
+            with self._lock:
+                self._connections.append((os.getpid(), conn))
+        return conn
+
+    def _meta(self, conn):
+        return dict(conn.execute('SELECT key, value FROM herd_state_meta').fetchall())
+
+    def restore(self):
+        """Load the saved herd state into the shared table if training wrote a new one"""
+        conn = self._conn()
+        mark = None
+        if os.path.exists(self.seed):
+            stat = os.stat(self.seed)
+            mark = f'{stat.st_mtime_ns}:{stat.st_size}'
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            meta = self._meta(conn)
+            seeded = mark is not None and meta.get('seed') != mark
+            if seeded:
+                engine = RollingFeatureEngine.load(self.seed)
+                cow_ids = sorted(engine.slots, key=engine.slots.get)
+                blob = engine.export_rows(np.arange(len(cow_ids))).tobytes()
+                width = len(blob) // max(len(cow_ids), 1)
+                conn.execute('DELETE FROM cow_rolling_state')
+                conn.executemany('INSERT INTO cow_rolling_state (cow_id, state) VALUES (?, ?)',
+                                 [(cow_id, blob[i * width:(i + 1) * width]) for i, cow_id in enumerate(cow_ids)])
+                meta = {'seed': mark, 'window': str(engine.window), 'alpha': repr(engine.alpha)}
+                conn.executemany('INSERT OR REPLACE INTO herd_state_meta (key, value) VALUES (?, ?)', meta.items())
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self.window = int(meta.get('window', ROLLING_WINDOW_DAYS))
+        self.alpha = float(meta.get('alpha', BASELINE_ALPHA))
+        return seeded
+
+    def transform(self, cow_ids, days, sensors, previous_mastitis):
+        """RollingFeatureEngine.transform against the shared state, which it advances"""
+        cow_ids = [str(c) for c in cow_ids]
+        unique = list(dict.fromkeys(cow_ids))
+        engine = RollingFeatureEngine(self.window, self.alpha, capacity=max(len(unique), 1))
+        if not unique:
+            return engine.transform(cow_ids, days, sensors, previous_mastitis)
+        slots = engine._slots_for(unique)
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # One query for every cow in the request: the IDs go in as a single JSON array parameter
+            stored = conn.execute('SELECT cow_id, state FROM cow_rolling_state WHERE cow_id IN '
+                                  '(SELECT value FROM json_each(?))', (json.dumps(unique),)).fetchall()
+            if stored:
+                found = np.fromiter((engine.slots[row[0]] for row in stored), np.int64, len(stored))
+                engine.import_rows(found, np.frombuffer(b''.join(row[1] for row in stored)).reshape(len(stored), -1))
+            out = engine.transform(cow_ids, days, sensors, previous_mastitis)
+            blob = engine.export_rows(slots).tobytes()
+            width = len(blob) // len(unique)
+            conn.executemany('INSERT OR REPLACE INTO cow_rolling_state (cow_id, state) VALUES (?, ?)',
+                             [(cow_id, blob[i * width:(i + 1) * width]) for i, cow_id in enumerate(unique)])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return out
+
+    def frame(self, features, cow_ids, days, previous_mastitis):
+        """Append the rolling columns to a DISEASE_FEATURES frame"""
+        values = self.transform(cow_ids, days, features[SENSOR_COLUMNS].to_numpy(), previous_mastitis)
+        rolling = pd.DataFrame(values, columns=ROLLING_FEATURES, index=features.index)
+        return pd.concat([features, rolling], axis=1)
+
+    def close(self):
+        """Close this process's connections; the next call opens new ones"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for pid, conn in connections:
+            if pid == os.getpid():
+                conn.close()
+
+
+# Live herd state for serving; seeded from the file written by train_models.py
+herd_state = SharedHerdState()
@@ -40,6 +40,9 @@ document.getElementById("milkForm").addEventListener("submit", async function(e)
         document.getElementById("milkConfidence").innerText = 
             "Confidence: " + confidencePercent.toFixed(2) + "%";
 
+        // Contributions arrive later; the prediction is not held up for them
+        showExplanation(result.explanation_id, "milkResult");
+
     } catch (err) {
         alert("Milk prediction failed: " + err);
     }
@@ -70,6 +73,8 @@ document.getElementById("diseaseForm").addEventListener("submit", async function
         // Fix confidence mismatch
         let confidencePercent = result.confidence > 1 ? result.confidence : result.confidence * 100;
 
+        showExplanation(result.explanation_id, "disease-section");
+
         // Show result + advice
         alert(
             "Disease Prediction: " + result.disease + 
@@ -81,3 +86,38 @@ document.getElementById("diseaseForm").addEventListener("submit", async function
         alert("Disease prediction failed: " + err);
     }
 });
+
+// ---------------- EXPLANATIONS ----------------
+// Polls /explain/<id> (202 while the backend computes it) and lists the features
+// that moved the prediction most
+async function showExplanation(explanationId, containerId) {
+    if (!explanationId) return;
+    try {
+        for (let attempt = 0; attempt < 20; attempt++) {
+            let res = await fetch("http://127.0.0.1:8000/explain/" + explanationId);
+            if (res.status === 202) {
+                await new Promise(resolve => setTimeout(resolve, 250));
+                continue;
+            }
+            if (!res.ok) return;
+
+            let explanation = (await res.json()).explanation;
+            let box = document.getElementById(containerId + "-explanation");
+            if (!box) {
+                box = document.createElement("div");
+                box.id = containerId + "-explanation";
+                box.className = "explanation";
+                document.getElementById(containerId).appendChild(box);
+            }
+            let lines = explanation.top_features.slice(0, 5).map(feature => {
+                let value = explanation.contributions[feature];
+                return feature + ": " + (value >= 0 ? "+" : "") + value.toFixed(3);
+            });
+            box.innerText = "Why (" + explanation.scale + ", baseline " + explanation.base_value.toFixed(2) + ")\n" +
+                lines.join("\n");
+            return;
+        }
+    } catch (err) {
+        console.warn("Explanation unavailable: " + err);
+    }
+}
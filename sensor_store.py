@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Udder quarter sensor time series for the Smart Dairy Farm Management System
+Parlour readings arrive as NDJSON or packed binary frames and are appended by a
+background writer to fixed-width record files partitioned by cow and (UTC) day
+"""
+
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from features import SENSOR_COLUMNS
+
+SENSOR_DIR = os.environ.get('CATTLE_SENSOR_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensor_data'))
+
+# One reading: epoch seconds plus the eight quarter sensors and body temperature (44 bytes)
+READING_COLUMNS = SENSOR_COLUMNS + ['Temperature']
+RECORD = np.dtype([('ts', '<f8')] + [(column, '<f4') for column in READING_COLUMNS])
+
+# Binary frame: magic, cow ID length, reading count, cow ID bytes, then packed RECORDs
+FRAME_MAGIC = b'SNS1'
+FRAME_HEADER = struct.Struct('<4sHI')
+
+COW_ID = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$')
+
+# Writer batching: flush after this many readings or this many seconds, whichever first
+WRITE_BATCH_READINGS = 20000
+FLUSH_INTERVAL = 0.5
+
+# Queued ingest requests; when full new readings are dropped and counted
+MAX_PENDING = 10000
+
+# Readings averaged for scoring: the last day, capped to the most recent N per cow
+WINDOW_SECONDS = 24 * 3600
+WINDOW_MAX_READINGS = 5000
+
+DAY_SECONDS = 86400
+
+
+def _timestamp(value, default):
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def parse_ndjson(lines, now=None):
+    """Group NDJSON readings by cow; returns ({cow_id: records}, errors)
+
+    Each line is an object with cow_id, optional ts (epoch seconds or ISO 8601)
+    and any of the sensor columns / temperature, matched case-insensitively.
+    """
+    now = time.time() if now is None else now
+    rows, errors = {}, []
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            reading = {str(k).lower(): v for k, v in json.loads(line).items()}
+            cow_id = str(reading['cow_id'])
+            if not COW_ID.match(cow_id):
+                raise ValueError(f"invalid cow_id {cow_id!r}")
+            values = [reading.get(column.lower()) for column in READING_COLUMNS]
+            row = (_timestamp(reading.get('ts'), now),) + tuple(np.nan if v is None else float(v) for v in values)
+            rows.setdefault(cow_id, []).append(row)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            errors.append({'line': i, 'error': f"missing field {e}" if isinstance(e, KeyError) else str(e)})
+    return {cow_id: np.array(readings, dtype=RECORD) for cow_id, readings in rows.items()}, errors
+
+
+def parse_frames(data):
+    """Decode concatenated binary frames into {cow_id: records}"""
+    data = memoryview(data)
+    batches = {}
+    offset = 0
+    while offset < len(data):
+        if len(data) - offset < FRAME_HEADER.size:
+            raise ValueError(f"truncated frame header at byte {offset}")
+        magic, id_length, count = FRAME_HEADER.unpack_from(data, offset)
+        if magic != FRAME_MAGIC:
+            raise ValueError(f"bad frame magic at byte {offset}")
+        offset += FRAME_HEADER.size
+        cow_id = bytes(data[offset:offset + id_length]).decode('utf-8')
+        if not COW_ID.match(cow_id):
+            raise ValueError(f"invalid cow_id {cow_id!r}")
+        offset += id_length
+        end = offset + count * RECORD.itemsize
+        if end > len(data):
+            raise ValueError(f"truncated frame for {cow_id}: expected {count} readings")
+        records = np.frombuffer(data, dtype=RECORD, count=count, offset=offset)
+        batches[cow_id] = np.concatenate([batches[cow_id], records]) if cow_id in batches else records
+        offset = end
+    return batches
+
+
+def pack_frame(cow_id, records):
+    """Encode one cow's readings as a binary frame (the format parlour clients send)"""
+    encoded = str(cow_id).encode('utf-8')
+    records = np.asarray(records, dtype=RECORD)
+    return FRAME_HEADER.pack(FRAME_MAGIC, len(encoded), len(records)) + encoded + records.tobytes()
+
+
+class SensorStore:
+    """Append-only per-cow, per-day reading files with windowed reads for scoring"""
+
+    def __init__(self, directory=SENSOR_DIR):
+        self.directory = directory
+        self.accepted = 0
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._writer = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+
+    def _partition(self, cow_id, day):
+        return os.path.join(self.directory, cow_id, f"{np.datetime64(int(day), 'D')}.bin")
+
+    def _ensure_writer(self):
+        # Threads do not survive fork(), so each worker process starts its own writer
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer_pid != os.getpid() or not self._writer.is_alive():
+                self._queue = queue.Queue(maxsize=MAX_PENDING)
+                self._writer = threading.Thread(target=self._write_loop, name='sensor-store-writer', daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    def _write_loop(self):
+        pending = self._queue
+        while True:
+            # Each queued item is one ingest request's {cow_id: records}.
+            # None (queued by close()) stops the writer after what came before it is written.
+            items = [pending.get()]
+            count = sum(len(r) for r in (items[0] or {}).values())
+            try:
+                while items[-1] is not None and count < WRITE_BATCH_READINGS:
+                    items.append(pending.get(timeout=FLUSH_INTERVAL))
+                    count += sum(len(r) for r in (items[-1] or {}).values())
+            except queue.Empty:
+                pass
+
+            partitions = {}
+            for batch in filter(None, items):
+                for cow_id, records in batch.items():
+                    days = (records['ts'] // DAY_SECONDS).astype(np.int64)
+                    for day in np.unique(days):
+                        partitions.setdefault((cow_id, day), []).append(records[days == day])
+            for (cow_id, day), parts in partitions.items():
+                path = self._partition(cow_id, day)
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # O_APPEND keeps whole-record writes from concurrent worker processes intact
+                    with open(path, 'ab') as f:
+                        f.write(np.concatenate(parts).tobytes())
+                    self.written += sum(len(p) for p in parts)
+                except OSError as e:
+                    print(f"⚠️  Could not write sensor readings for {cow_id}: {e}")
+            for _ in items:
+                pending.task_done()
+            if items[-1] is None:
+                return
+
+    def append(self, batches):
+        """Queue {cow_id: records} for the background writer; never blocks"""
+        count = sum(len(records) for records in batches.values())
+        if not count:
+            return 0
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(batches)
+        except queue.Full:
+            self.dropped += count
+            return 0
+        self.accepted += count
+        return count
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Write what is queued and stop this process's writer; the next append starts a new one"""
+        with self._lock:
+            if self._writer_pid == os.getpid() and self._writer.is_alive():
+                self._queue.put(None)
+                self._writer.join()
+            self._writer_pid = None
+
+    def _tail(self, path, limit):
+        """Last `limit` whole records of a partition file"""
+        size = os.path.getsize(path)
+        count = min(limit, size // RECORD.itemsize)
+        with open(path, 'rb') as f:
+            f.seek((size // RECORD.itemsize - count) * RECORD.itemsize)
+            return np.fromfile(f, dtype=RECORD, count=count)
+
+    def window(self, cow_id, seconds=WINDOW_SECONDS, max_readings=WINDOW_MAX_READINGS, now=None):
+        """Most recent readings of one cow within the window, oldest first"""
+        cow_id = str(cow_id)
+        if not COW_ID.match(cow_id):
+            return np.empty(0, dtype=RECORD)
+        now = time.time() if now is None else now
+        since = now - seconds
+        parts, remaining = [], max_readings
+        day = int(now // DAY_SECONDS)
+        while remaining > 0 and day >= since // DAY_SECONDS:
+            path = self._partition(cow_id, day)
+            if os.path.exists(path):
+                records = self._tail(path, remaining)
+                records = records[(records['ts'] >= since) & (records['ts'] <= now)]
+                parts.append(records)
+                remaining -= len(records)
+            day -= 1
+        if not parts:
+            return np.empty(0, dtype=RECORD)
+        records = np.concatenate(parts[::-1])
+        return records[np.argsort(records['ts'], kind='stable')][-max_readings:]
+
+    def window_features(self, cow_id, **kwargs):
+        """Mean of each reading column over the cow's latest window, or None without data"""
+        records = self.window(cow_id, **kwargs)
+        if not len(records):
+            return None
+        features = {}
+        for column in READING_COLUMNS:
+            values = records[column][~np.isnan(records[column])]
+            features[column] = float(values.mean()) if values.size else None
+        features['readings'] = len(records)
+        features['since'] = datetime.fromtimestamp(float(records['ts'][0])).strftime('%Y-%m-%d %H:%M:%S')
+        features['until'] = datetime.fromtimestamp(float(records['ts'][-1])).strftime('%Y-%m-%d %H:%M:%S')
+        return features
+
+    def stats(self):
+        return {'accepted': self.accepted, 'written': self.written, 'dropped': self.dropped,
+                'pending': self._queue.qsize()}
+
+
+# One store per process; the writer thread starts on first ingest
+sensor_store = SensorStore()
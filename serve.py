@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Production server for the Smart Dairy Farm Management System
+Loads the models once in a master process, then pre-forks worker processes that
+share the model memory (copy-on-write, and the page cache for flat exports) and
+accept connections on one inherited listening socket. Workers publish their
+metrics to one directory, so /metrics on any of them covers the whole server.
+
+Usage:
+    python serve.py --workers 4 --port 5000
+    kill -HUP <master pid>     # reload models retrained with train_models.py
+    kill -TERM <master pid>    # drain in-flight requests and stop
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+# Seconds a retired worker gets to finish in-flight requests before it is killed
+GRACEFUL_TIMEOUT = 30
+
+# Master wake-up interval for reaping and respawning workers
+POLL_INTERVAL = 0.2
+
+
+def listen(host, port, backlog=1024):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def metrics_directory(path=None):
+    """The workers' shared metrics directory, emptied so counts start at zero with the server"""
+    if path is None:
+        return tempfile.mkdtemp(prefix='cattle-metrics-')
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(('.json', '.json.tmp')):
+            os.remove(os.path.join(path, name))
+    return path
+
+
+def run_worker(app, sock, access_log=False, metrics_dir=None):
+    """Worker process body: serve until SIGTERM, then drain in-flight requests"""
+    from werkzeug.serving import make_server
+    import numpy as np
+    import metrics
+
+    # Forked workers would otherwise share the master's random state
+    np.random.seed()
+    metrics.share(metrics_dir)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    if not access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server(*sock.getsockname()[:2], app, threaded=True, fd=sock.fileno())
+    # Every worker wakes for each new connection; non-blocking accept lets the
+    # ones that lose the race go back to waiting instead of blocking in accept()
+    server.socket.setblocking(False)
+    # Non-daemon request threads are joined by server_close(), so requests finish before exit
+    server.daemon_threads = False
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+    server.server_close()
+
+    # Let every farm's background writers persist what this worker logged
+    from tenancy import tenants
+    tenants.flush()
+    metrics.flush()
+    os._exit(0)
+
+
+class Master:
+    """Forks and supervises workers; SIGHUP reloads models and replaces them"""
+
+    def __init__(self, app, load, sock, workers, access_log=False, metrics_dir=None):
+        self.app = app
+        self.access_log = access_log
+        self.metrics_dir = metrics_dir
+        self.load = load
+        self.sock = sock
+        self.size = workers
+        self.workers = set()
+        self.retiring = {}
+        self._reload = False
+        self._stop = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.app, self.sock, self.access_log, self.metrics_dir)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(1)
+        self.workers.add(pid)
+        return pid
+
+    def spawn_all(self):
+        # Move everything loaded so far out of the collector's view, so its
+        # reference-count updates don't copy the shared pages in every worker
+        gc.collect()
+        gc.freeze()
+        while len(self.workers) < self.size:
+            self.spawn()
+
+    def retire(self, pids):
+        for pid in pids:
+            self.workers.discard(pid)
+            self.retiring[pid] = time.monotonic() + GRACEFUL_TIMEOUT
+            self._signal(pid, signal.SIGTERM)
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reload(self):
+        """Load new artifacts in the master, start fresh workers, then drain the old ones"""
+        print("🔄 Reloading models...")
+        gc.unfreeze()
+        self.load()
+        old = set(self.workers)
+        self.workers.clear()
+        self.spawn_all()
+        self.retire(old)
+        print(f"✅ Reloaded; workers {sorted(self.workers)} replaced {sorted(old)}")
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                del self.retiring[pid]
+            elif pid in self.workers:
+                self.workers.discard(pid)
+                print(f"⚠️  Worker {pid} exited unexpectedly (status {status}); restarting")
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_reload', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_stop', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_stop', True))
+
+        self.spawn_all()
+        host, port = self.sock.getsockname()[:2]
+        print(f"🚀 Master {os.getpid()} serving http://{host}:{port} with {self.size} workers")
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                self.reload()
+            self.reap()
+            if not self._stop and len(self.workers) < self.size:
+                self.spawn_all()
+            for pid, deadline in list(self.retiring.items()):
+                if time.monotonic() > deadline:
+                    self._signal(pid, signal.SIGKILL)
+            time.sleep(POLL_INTERVAL)
+
+        print("⏹️  Stopping workers...")
+        self.retire(set(self.workers))
+        while self.retiring:
+            self.reap()
+            for pid, deadline in list(self.retiring.items()):
+                if time.monotonic() > deadline:
+                    self._signal(pid, signal.SIGKILL)
+            time.sleep(POLL_INTERVAL)
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-forking production server for app.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes (default: one per core)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--access-log', action='store_true', help='log every request (off by default)')
+    parser.add_argument('--metrics-dir', default=os.environ.get('CATTLE_METRICS_DIR'),
+                        help='directory the workers share metrics through (default: a new temporary one)')
+    args = parser.parse_args(argv)
+
+    # Importing app loads the models and herd state once, in the master
+    import app
+
+    if not hasattr(os, 'fork'):
+        print("⚠️  os.fork is unavailable on this platform; serving from a single process")
+        app.app.run(host=args.host, port=args.port, threaded=True)
+        return 0
+
+    sock = listen(args.host, args.port)
+    Master(app.app, app.load_models, sock, max(1, args.workers), args.access_log,
+           metrics_directory(args.metrics_dir)).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Multi-farm tenancy for the Smart Dairy Farm Management System
+Every farm gets its own partition under farms/<farm_id>/: prediction history,
+production rollups, sensor readings, rolling herd state and an optional set of
+fine-tuned model files (any model a farm has no file for is the shared one).
+Farm models are loaded on first use and kept in a per-process LRU bounded by a
+memory budget, each farm has its own prediction cache, and a cap on in-flight
+predictions per farm keeps one busy farm from taking every request thread.
+Farms nobody has asked for in a while have their stores closed (and their
+writer threads stopped) until the next request. The default farm is the
+original single-farm layout in the project directory.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from explain import Explainer, explainer
+from flat_forest import FLAT_DIR
+from forecasting import MilkForecaster, milk_forecaster
+from herd_analytics import HerdAnalytics, herd_analytics
+from model_registry import ENSEMBLE_FILE, MODEL_FILES, ModelRegistry, registry
+from prediction_cache import PredictionCache, prediction_cache
+from prediction_store import PredictionStore, store
+from rolling_features import HERD_STATE_FILE, SharedHerdState, herd_state
+from sensor_store import SensorStore, sensor_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FARMS_DIR = os.environ.get('CATTLE_FARMS_DIR', os.path.join(BASE_DIR, 'farms'))
+FARMS_FILE = os.environ.get('CATTLE_FARMS_FILE', os.path.join(BASE_DIR, 'farms.json'))
+
+DEFAULT_FARM = 'default'
+DEFAULT_FARM_NAME = 'Patel Dairy Farm'
+
+# Artifact bytes of farm-specific models kept resident per worker; least recently used farms go first
+MODEL_MEMORY_MB = float(os.environ.get('CATTLE_MODEL_MEMORY_MB', 512))
+
+# Prediction cache entries per farm (the default farm keeps CATTLE_CACHE_SIZE)
+FARM_CACHE_SIZE = int(os.environ.get('CATTLE_FARM_CACHE_SIZE', 2000))
+
+# Predictions one farm may have holding a request thread per worker before it gets 429s.
+# The default farm is not capped: it is the original single-farm deployment.
+FARM_MAX_INFLIGHT = int(os.environ.get('CATTLE_FARM_MAX_INFLIGHT', 8))
+
+# A farm's stores are closed after this long without a request, and the least recently used
+# farms past CATTLE_MAX_OPEN_FARMS once they have been idle for FARM_CLOSE_GRACE seconds
+FARM_IDLE_SECONDS = float(os.environ.get('CATTLE_FARM_IDLE_SECONDS', 600))
+MAX_OPEN_FARMS = int(os.environ.get('CATTLE_MAX_OPEN_FARMS', 64))
+FARM_CLOSE_GRACE = 60
+SWEEP_SECONDS = 30
+
+FARM_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class UnknownFarm(KeyError):
+    """Raised for a farm ID that is neither in farms.json nor a directory under farms/"""
+
+
+class FarmBusy(Exception):
+    """Raised when a farm already has FARM_MAX_INFLIGHT predictions running"""
+
+
+class FarmAuthRequired(Exception):
+    """Raised when a request names a farm (or the default farm is keyed) without a valid login or API key"""
+
+
+class FarmForbidden(Exception):
+    """Raised when a logged-in user or API key names a farm other than its own"""
+
+
+def hash_api_key(key):
+    """SHA-256 hex digest stored in farms.json for an API key; keys are random tokens, so no salt or stretching"""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class Farm:
+    """One farm's data partition; stores and models are opened on first use"""
+
+    def __init__(self, farm_id, name, directory, pool):
+        self.id = farm_id
+        self.name = name
+        self.directory = directory
+        self.cache = PredictionCache(FARM_CACHE_SIZE)
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._inflight = threading.BoundedSemaphore(FARM_MAX_INFLIGHT)
+        self._parts = {}
+        self._own_models = None
+        self.last_used = time.monotonic()
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _part(self, key, factory):
+        part = self._parts.get(key)
+        if part is None:
+            with self._lock:
+                part = self._parts.get(key)
+                if part is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    part = self._parts[key] = factory()
+        return part
+
+    def has_own_models(self):
+        # Checked once per worker, like the shared models; serve.py's SIGHUP starts fresh workers
+        if self._own_models is None:
+            self._own_models = any(os.path.exists(self._path(f))
+                                   for f in list(MODEL_FILES.values()) + [ENSEMBLE_FILE, FLAT_DIR])
+        return self._own_models
+
+    @property
+    def registry(self):
+        return self._pool.registry(self)
+
+    @property
+    def explainer(self):
+        return self._pool.explainer(self)
+
+    @property
+    def store(self):
+        return self._part('store', lambda: PredictionStore(self._path('prediction_history.db')))
+
+    @property
+    def analytics(self):
+        return self._part('analytics', lambda: HerdAnalytics(self._path('farm_analytics.db'), seed=None))
+
+    @property
+    def forecaster(self):
+        return self._part('forecaster', lambda: MilkForecaster(self.analytics))
+
+    @property
+    def sensor_store(self):
+        return self._part('sensor_store', lambda: SensorStore(self._path('sensor_data')))
+
+    @property
+    def herd_state(self):
+        def restore():
+            state = SharedHerdState(self._path('herd_state.db'), seed=self._path(os.path.basename(HERD_STATE_FILE)))
+            state.restore()
+            return state
+        return self._part('herd_state', restore)
+
+    def enter(self):
+        """Take one of the farm's in-flight prediction slots, or raise FarmBusy"""
+        if not self._inflight.acquire(blocking=False):
+            raise FarmBusy(f"farm {self.id} has {FARM_MAX_INFLIGHT} predictions in flight; retry shortly")
+
+    def leave(self):
+        self._inflight.release()
+
+    @contextmanager
+    def admit(self):
+        self.enter()
+        try:
+            yield self
+        finally:
+            self.leave()
+
+    def is_open(self):
+        return bool(self._parts)
+
+    def close(self):
+        """Flush and close the farm's stores and drop its cached predictions; they reopen on next use"""
+        with self._lock:
+            parts, self._parts = self._parts, {}
+        for part in parts.values():
+            close = getattr(part, 'close', None)
+            if close is not None:
+                close()
+        self.cache.clear()
+
+    def stats(self):
+        return {
+            'farm_id': self.id,
+            'name': self.name,
+            'open': self.is_open(),
+            'idle_seconds': round(time.monotonic() - self.last_used, 1),
+            'own_models': self.has_own_models(),
+            'models_resident': self._pool.is_resident(self.id),
+            'cache': self.cache.stats(),
+        }
+
+
+class DefaultFarm(Farm):
+    """The original single-farm layout, served by the process-wide singletons"""
+
+    def __init__(self, name, pool):
+        super().__init__(DEFAULT_FARM, name, BASE_DIR, pool)
+        self.cache = prediction_cache
+        self._parts = {'store': store, 'analytics': herd_analytics, 'forecaster': milk_forecaster,
+                       'sensor_store': sensor_store, 'herd_state': herd_state}
+
+    def has_own_models(self):
+        return False
+
+    def enter(self):
+        pass
+
+    def leave(self):
+        pass
+
+    @property
+    def registry(self):
+        return registry
+
+    @property
+    def explainer(self):
+        return explainer
+
+
+class ModelPool:
+    """Farm-specific model registries in an LRU bounded by MODEL_MEMORY_MB
+
+    A farm's registry is loaded outside the pool lock (under a per-farm lock), so
+    one farm's first request never stalls another farm's predictions.
+    """
+
+    def __init__(self, budget_bytes=MODEL_MEMORY_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.loads = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, farm_id):
+        with self._lock:
+            entry = self._entries.get(farm_id)
+            if entry is not None:
+                self._entries.move_to_end(farm_id)
+            return entry
+
+    def _entry(self, farm):
+        entry = self._cached(farm.id)
+        if entry is not None:
+            return entry
+        with self._lock:
+            loading = self._loading.setdefault(farm.id, threading.Lock())
+        with loading:
+            entry = self._cached(farm.id)
+            if entry is not None:
+                return entry
+            farm_registry = ModelRegistry(farm.directory, cache=farm.cache, fallback=registry)
+            farm_registry.load()
+            entry = {'registry': farm_registry, 'explainer': Explainer(farm_registry),
+                     'bytes': farm_registry.resident_bytes()}
+            with self._lock:
+                self._entries[farm.id] = entry
+                self.loads += 1
+                self._evict(keep=farm.id)
+        return entry
+
+    def _evict(self, keep):
+        used = sum(entry['bytes'] for entry in self._entries.values())
+        for farm_id in list(self._entries):
+            if used <= self.budget_bytes:
+                break
+            if farm_id == keep:
+                continue
+            used -= self._entries.pop(farm_id)['bytes']
+            self.evictions += 1
+
+    def registry(self, farm):
+        """The farm's registry: its own models loaded on demand, or the shared registry"""
+        if not farm.has_own_models():
+            return registry
+        return self._entry(farm)['registry']
+
+    def explainer(self, farm):
+        if not farm.has_own_models():
+            return explainer
+        return self._entry(farm)['explainer']
+
+    def is_resident(self, farm_id):
+        with self._lock:
+            return farm_id in self._entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resident_farms': list(self._entries),
+                'resident_bytes': sum(entry['bytes'] for entry in self._entries.values()),
+                'budget_bytes': int(self.budget_bytes),
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+
+class Tenants:
+    """Farms from farms.json plus any directory under farms/, opened on first lookup
+
+    Every lookup marks the farm as used; at most every SWEEP_SECONDS a lookup also
+    closes farms that have gone idle, so open stores and writer threads track the
+    farms actually being served rather than every farm seen since the worker started.
+    Each function in close_listeners is called with a farm just closed (from the
+    looking-up thread), so per-farm state held outside the Farm can be dropped too.
+    """
+
+    def __init__(self, farms_dir=FARMS_DIR, farms_file=FARMS_FILE):
+        self.farms_dir = farms_dir
+        self.config = {}
+        if os.path.exists(farms_file):
+            with open(farms_file) as f:
+                self.config = json.load(f).get('farms', {})
+        # API key digest -> farm ID
+        self.api_keys = {digest.lower(): farm_id for farm_id, farm in self.config.items()
+                         for digest in farm.get('api_keys', {}).values()}
+        self.models = ModelPool()
+        self._farms = {DEFAULT_FARM: DefaultFarm(self.config.get(DEFAULT_FARM, {}).get('name', DEFAULT_FARM_NAME),
+                                                 self.models)}
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        self.closed = 0
+        self.close_listeners = []
+
+    @property
+    def default(self):
+        return self._farms[DEFAULT_FARM]
+
+    def get(self, farm_id=None):
+        """The farm for an ID (default farm for None); UnknownFarm if it is not configured"""
+        if farm_id is None or farm_id == '':
+            farm = self.default
+        else:
+            farm = self._farms.get(farm_id) or self._add(farm_id)
+        farm.last_used = time.monotonic()
+        if farm.last_used - self._swept > SWEEP_SECONDS:
+            self._sweep(farm.last_used)
+        return farm
+
+    def authorize(self, farm_id=None, user_farm=None, api_key=None):
+        """The farm a request may use: its logged-in user's, or the one its API key belongs to
+
+        farm_id is the farm the request names (X-Farm-ID or ?farm_id=); naming a
+        farm other than the principal's raises FarmForbidden. A request with no
+        login or key only gets the default farm, and only while farms.json gives
+        that farm no API keys; anything else raises FarmAuthRequired.
+        """
+        if user_farm is not None:
+            principal = user_farm
+        elif api_key:
+            principal = self.api_keys.get(hash_api_key(api_key))
+            if principal is None:
+                raise FarmAuthRequired('invalid API key')
+        else:
+            if farm_id not in (None, '', DEFAULT_FARM) or self.config.get(DEFAULT_FARM, {}).get('api_keys'):
+                raise FarmAuthRequired('an API key (X-API-Key) is required for this farm')
+            return self.get(None)
+        if farm_id not in (None, '') and farm_id != principal:
+            raise FarmForbidden(f"not allowed to use farm {farm_id}")
+        return self.get(principal)
+
+    def _add(self, farm_id):
+        directory = os.path.join(self.farms_dir, str(farm_id))
+        if not FARM_ID.match(str(farm_id)) or (farm_id not in self.config and not os.path.isdir(directory)):
+            raise UnknownFarm(f"unknown farm {farm_id}")
+        with self._lock:
+            farm = self._farms.get(farm_id)
+            if farm is None:
+                name = self.config.get(farm_id, {}).get('name', farm_id)
+                farm = self._farms[farm_id] = Farm(farm_id, name, directory, self.models)
+        return farm
+
+    def users(self):
+        """Dashboard logins from farms.json: {username: {'password': hash, 'name', 'farm_name', 'farm_id'}}"""
+        users = {}
+        for farm_id, farm in self.config.items():
+            for username, user in farm.get('users', {}).items():
+                users[username] = {
+                    'password': user['password_hash'],
+                    'name': user.get('name', username),
+                    'farm_name': farm.get('name', farm_id),
+                    'farm_id': farm_id,
+                }
+        return users
+
+    def _sweep(self, now):
+        with self._lock:
+            if now - self._swept <= SWEEP_SECONDS:
+                return
+            self._swept = now
+            candidates = sorted((farm for farm in self._farms.values() if farm is not self.default and farm.is_open()),
+                                key=lambda farm: farm.last_used)
+        excess = len(candidates) - MAX_OPEN_FARMS
+        for i, farm in enumerate(candidates):
+            idle = now - farm.last_used
+            if idle > FARM_IDLE_SECONDS or (i < excess and idle > FARM_CLOSE_GRACE):
+                farm.close()
+                self.closed += 1
+                for listener in list(self.close_listeners):
+                    listener(farm)
+
+    def flush(self):
+        """Block until every opened farm's prediction and sensor writes are on disk"""
+        with self._lock:
+            farms = list(self._farms.values())
+        for farm in farms:
+            for key in ('store', 'sensor_store'):
+                if key in farm._parts:
+                    farm._parts[key].flush()
+
+    def stats(self):
+        with self._lock:
+            farms = list(self._farms.values())
+        return {'models': self.models.stats(), 'open_farms': sum(farm.is_open() for farm in farms),
+                'closed': self.closed, 'farms': [farm.stats() for farm in farms]}
+
+
+# One tenant table per worker process
+tenants = Tenants()
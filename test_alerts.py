@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for the real-time health alert stream
+Run with: python -m pytest
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from alerts import AlertBroker, AlertDeduper
+from prediction_store import PredictionStore
+
+START = datetime(2025, 6, 1, 8, 0, 0)
+
+
+def event(cow_id, risk_level, minutes, event_id=1):
+    return {'id': event_id, 'cow_id': cow_id, 'risk_level': risk_level,
+            'timestamp': (START + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PredictionStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def flag(store, cow_id, risk_level, minutes=0):
+    store.record('disease', cow_id=cow_id, probability=0.9 if risk_level == 'high' else 0.6,
+                 risk_level=risk_level, timestamp=START + timedelta(minutes=minutes))
+
+
+def test_repeats_are_suppressed_within_the_window():
+    deduper = AlertDeduper(window=3600)
+    assert deduper.admit(event('C001', 'medium', 0))
+    assert not deduper.admit(event('C001', 'medium', 30))
+    assert deduper.admit(event('C002', 'medium', 30))
+    # Escalation always gets through; a drop back to medium does not
+    assert deduper.admit(event('C001', 'high', 40))
+    assert not deduper.admit(event('C001', 'medium', 50))
+    assert not deduper.admit(event('C001', 'high', 90))
+    assert deduper.admit(event('C001', 'high', 101))
+    assert deduper.suppressed == 3
+
+
+async def read_events(stream, count):
+    """The first count health_alert events of an SSE stream, parsed"""
+    events = []
+    async for chunk in stream:
+        if chunk.startswith('id: '):
+            lines = chunk.strip().split('\n')
+            assert lines[1] == 'event: health_alert'
+            events.append(json.loads(lines[2][len('data: '):]))
+            if len(events) == count:
+                return events
+
+
+def test_new_flagged_scores_reach_matching_subscribers(store):
+    flag(store, 'C000', 'high')  # logged before the broker started: history, not an alert
+    store.flush()
+
+    async def scenario():
+        broker = AlertBroker(store, poll_interval=0.01)
+        broker.start()
+        await asyncio.sleep(0.05)
+        everything = broker.stream()
+        high_c001 = broker.stream(levels=['high'], cow_id='C001')
+        waiting = [asyncio.ensure_future(read_events(everything, 3)),
+                   asyncio.ensure_future(read_events(high_c001, 1))]
+        await asyncio.sleep(0.05)
+
+        store.record('milk', cow_id='C001', predicted_milk=20.0)
+        flag(store, 'C001', 'medium', 1)
+        flag(store, 'C001', 'medium', 2)  # repeat, suppressed
+        flag(store, 'C002', 'low', 3)
+        flag(store, 'C002', 'high', 4)
+        flag(store, 'C001', 'high', 5)
+        store.flush()
+        results = await asyncio.wait_for(asyncio.gather(*waiting), 5)
+        stats = broker.stats()
+        await everything.aclose()
+        await high_c001.aclose()
+        await broker.close()
+        return results, stats
+
+    (everything, high_c001), stats = asyncio.run(scenario())
+    assert [(e['cow_id'], e['risk_level']) for e in everything] == [('C001', 'medium'), ('C002', 'high'),
+                                                                    ('C001', 'high')]
+    assert everything[0]['type'] == 'medium_mastitis_risk' and everything[0]['probability'] == 0.6
+    assert [(e['cow_id'], e['risk_level']) for e in high_c001] == [('C001', 'high')]
+    assert stats['published'] == 3 and stats['suppressed'] == 1
+
+
+def test_reconnecting_client_replays_after_last_event_id(store):
+    async def scenario():
+        broker = AlertBroker(store)
+        for i, cow_id in enumerate(['C001', 'C002', 'C003']):
+            broker.publish({**event(cow_id, 'high', i, event_id=i + 1), 'probability': 0.9})
+        stream = broker.stream(last_event_id=1)
+        assert await stream.__anext__() == 'retry: 3000\n\n'
+        replayed = await read_events(stream, 2)
+        await stream.aclose()
+        return replayed
+
+    assert [e['id'] for e in asyncio.run(scenario())] == [2, 3]
+
+
+def test_idle_broker_stops_polling_and_resumes_from_new_scores(store):
+    async def scenario():
+        broker = AlertBroker(store, poll_interval=0.01, idle_seconds=0.05)
+        broker.start()
+        await asyncio.wait_for(broker._task, 2)
+        stopped = broker.last_id
+
+        # Scores logged while stopped are history once polling resumes
+        flag(store, 'C001', 'high')
+        store.flush()
+        stream = broker.stream()
+        waiting = asyncio.ensure_future(read_events(stream, 1))
+        await asyncio.sleep(0.05)
+        flag(store, 'C002', 'high', 1)
+        store.flush()
+        events = await asyncio.wait_for(waiting, 5)
+        running = not broker._task.done()
+        await stream.aclose()
+        await broker.close()
+        return stopped, events, running
+
+    stopped, events, running = asyncio.run(scenario())
+    assert stopped is None and running
+    assert [e['cow_id'] for e in events] == ['C002']
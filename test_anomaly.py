@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for milk yield anomaly flagging
+Run with: python -m pytest
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly import DROP_KINDS
+from herd_analytics import HerdAnalytics, normalize_production
+
+COWS = ('A', 'B', 'C')
+DAYS = 30
+
+
+def herd(changes=None, seed=0):
+    """DAYS of production for COWS with yield driven by the inputs; changes adds litres per (cow, day)"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for d in range(DAYS):
+        date = (pd.Timestamp('2025-05-01') + pd.Timedelta(days=d)).strftime('%Y-%m-%d')
+        for cow_id in COWS:
+            feed, temp = 12 + rng.normal(scale=1.5), 25 + rng.normal(scale=2)
+            humidity, milking_time = 60 + rng.normal(scale=5), 15 + rng.normal(scale=2)
+            liters = 4 + 0.9 * feed + 0.3 * milking_time - 0.1 * (temp - 25) + rng.normal(scale=0.4)
+            rows.append({'date': date, 'cow_id': cow_id, 'feed_kg': feed, 'temp_c': temp, 'humidity': humidity,
+                         'milking_time': milking_time,
+                         'milk_liters': liters + (changes or {}).get((cow_id, d), 0.0)})
+    return normalize_production(pd.DataFrame(rows))
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = HerdAnalytics(str(tmp_path / 'analytics.db'), seed=None)
+    yield analytics
+    analytics.close()
+
+
+def flagged(analytics):
+    return [(a['cow_id'], a['date'], a['kind']) for a in analytics.yield_anomalies(since='2025-01-01')]
+
+
+def test_steady_herd_is_not_flagged(analytics):
+    analytics.ingest(herd())
+    assert flagged(analytics) == []
+
+
+def test_sudden_drop_is_flagged_on_its_day(analytics):
+    analytics.ingest(herd({('A', 22): -8.0}))
+    assert flagged(analytics) == [('A', '2025-05-23', 'yield_drop')]
+    drop = analytics.yield_anomalies(since='2025-01-01')[0]
+    assert drop['z'] <= -3 and drop['liters'] < drop['expected_liters'] - 6
+
+
+def test_slow_slide_is_a_sustained_drop(analytics):
+    analytics.ingest(herd({('B', d): -1.2 for d in range(20, DAYS)}))
+    anomalies = analytics.yield_anomalies(since='2025-01-01')
+    assert anomalies and {(a['cow_id'], a['kind']) for a in anomalies} == {('B', 'sustained_drop')}
+    # No single day was far enough below expectation to be a sudden drop
+    assert all(a['z'] > -3 for a in anomalies)
+
+
+def test_cows_are_not_flagged_while_warming_up(analytics):
+    # The cow's sixth record, inside the WARMUP_RECORDS (7) window
+    analytics.ingest(herd({('C', 5): -8.0}))
+    assert flagged(analytics) == []
+
+
+def test_daily_ingests_flag_the_same_records_as_one_batch(analytics, tmp_path):
+    rows = herd({('A', 22): -8.0, **{('B', d): -1.2 for d in range(20, DAYS)}})
+    for _, day in rows.groupby('date'):
+        analytics.ingest(day)
+    batch = HerdAnalytics(str(tmp_path / 'batch.db'), seed=None)
+    batch.ingest(rows)
+    assert sorted(flagged(analytics)) == sorted(flagged(batch))
+    batch.close()
+
+
+def test_recent_drop_is_the_cows_health_signal(analytics):
+    analytics.ingest(herd({('A', DAYS - 1): -8.0}))
+    signal = analytics.yield_signal('A')
+    assert signal['kind'] in DROP_KINDS and signal['date'] == '2025-05-30'
+    assert analytics.yield_signal('B') is None
@@ -1,112 +1,244 @@
 #!/usr/bin/env python3
 """
-Test script for the Cattle Monitoring Platform
+Tests for the Cattle Monitoring Platform
+Run with: python -m pytest
+conftest.py points every store at a temporary directory first.
 """
 
-import requests
-import json
-import time
-import sys
-
-def test_application():
-    """Test the Flask application endpoints"""
-    base_url = "http://localhost:5000"
-    
-    print("🧪 Testing Cattle Monitoring Platform...")
-    print("=" * 50)
-    
-    # Test 1: Check if server is running
-    try:
-        response = requests.get(base_url, timeout=5)
-        print("✅ Server is running")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Server is not running: {e}")
-        print("Please start the server with: python app.py")
-        return False
-    
-    # Test 2: Test login page
-    try:
-        response = requests.get(f"{base_url}/login")
-        if response.status_code == 200:
-            print("✅ Login page loads correctly")
-        else:
-            print(f"❌ Login page failed: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Login page error: {e}")
-    
-    # Test 3: Test milk prediction API
-    try:
-        milk_data = {
-            "feed_kg": 12.0,
-            "temp_c": 25.0,
-            "humidity": 60,
-            "milking_time": 15.0
-        }
-        
-        response = requests.post(
-            f"{base_url}/predict_milk",
-            json=milk_data,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                print(f"✅ Milk prediction API works: {result['predicted_milk']} liters")
-            else:
-                print(f"❌ Milk prediction failed: {result.get('error')}")
-        else:
-            print(f"❌ Milk prediction API error: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Milk prediction error: {e}")
-    
-    # Test 4: Test disease detection API
-    try:
-        disease_data = {
-            "cow_id": "COW001",
-            "day": 15,
-            "months_after_birth": 6,
-            "previous_mastitis": 0,
-            "temperature": 38.5,
-            "breed": "Holstein"
-        }
-        
-        response = requests.post(
-            f"{base_url}/predict_disease",
-            json=disease_data,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                print(f"✅ Disease detection API works: {result['risk_level']} risk")
-            else:
-                print(f"❌ Disease detection failed: {result.get('error')}")
-        else:
-            print(f"❌ Disease detection API error: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Disease detection error: {e}")
-    
-    # Test 5: Test report export
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from app import app
+from conftest import API_KEYS
+from metrics import HTTP_REQUEST_SECONDS
+from features import IQRClipper
+from flat_forest import FlatForest, export_pipeline
+from herd_analytics import HerdAnalytics, SEED_DATA, normalize_production
+from tenancy import FARM_MAX_INFLIGHT, tenants
+
+MILK_INPUT = {'feed_kg': 12.0, 'temp_c': 25.0, 'humidity': 60, 'milking_time': 15.0}
+DISEASE_INPUT = {
+    'cow_id': 'C001', 'day': 15, 'months_after_birth': 6, 'previous_mastitis': 0, 'temperature': 38.5,
+    'breed': 'Holstein', 'iufl': 5.2, 'eufl': 5.1, 'iufr': 5.3, 'eufr': 5.0,
+    'iurl': 5.2, 'eurl': 5.1, 'iurr': 5.4, 'eurr': 5.2,
+}
+NORTH = {'X-API-Key': API_KEYS['north']}
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def logged_in(client):
+    client.post('/login', data={'username': 'farmer1', 'password': 'password123'})
+    return client
+
+
+def production_rows(days=3, cows=4):
+    """The first few days of farm_milk_production.csv as /api/production JSON rows"""
+    seed = pd.read_csv(SEED_DATA)
+    seed = seed[seed['Date'].isin(seed['Date'].unique()[:days]) & seed['Cow_ID'].isin(seed['Cow_ID'].unique()[:cows])]
+    return seed.to_dict(orient='records')
+
+
+def yield_state(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT cow_id, state, day FROM cow_yield_state ORDER BY cow_id').fetchall()
+
+
+def test_predict_milk(client):
+    response = client.post('/predict_milk', json=MILK_INPUT)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['success'] and result['predicted_milk'] > 0
+
+
+def test_predict_disease_batch(client):
+    rows = [DISEASE_INPUT, {**DISEASE_INPUT, 'cow_id': 'C002', 'iufl': 9.0}, {'cow_id': 'C003'}]
+    response = client.post('/predict_disease_batch', json={'rows': rows})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['count'] == 3 and result['errors'] == 1
+    assert [r['cow_id'] for r in result['results']] == ['C001', 'C002', 'C003']
+
+
+def test_predict_disease(client):
+    response = client.post('/predict_disease', json=DISEASE_INPUT)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['success'] and result['risk_level'] in ('low', 'medium', 'high')
+    assert result['sensor_source'] == 'request'
+    assert 0.0 <= result['probability'] <= 1.0
+
+
+def request_count(route, status):
+    prefix = f'{HTTP_REQUEST_SECONDS.name}_count{{'
+    return sum(float(line.rsplit(' ', 1)[1]) for line in HTTP_REQUEST_SECONDS.render().splitlines()
+               if line.startswith(prefix) and f'route="{route}"' in line and f'status="{status}"' in line)
+
+
+def test_request_metrics_count_unhandled_errors(client, monkeypatch):
+    ok = request_count('/model_status', 200)
+    client.get('/model_status')
+    assert request_count('/model_status', 200) == ok + 1
+
+    def broken():
+        raise RuntimeError('boom')
+    monkeypatch.setitem(app.view_functions, 'model_status', broken)
+    monkeypatch.setitem(app.config, 'PROPAGATE_EXCEPTIONS', False)
+    failed = request_count('/model_status', 500)
+    assert client.get('/model_status').status_code == 500
+    assert request_count('/model_status', 500) == failed + 1
+    assert request_count('/model_status', 200) == ok + 1
+
+
+def test_export_report_requires_login(client):
+    assert client.get('/export_report?format=csv').status_code == 302
+
+
+@pytest.mark.parametrize('query', [
+    'start=2025-13-01&end=2025-06-30',
+    'start=2025-06-01&end=June 30',
+    'end=not-a-date',
+])
+def test_export_report_rejects_malformed_dates(logged_in, query):
+    response = logged_in.get(f'/export_report?format=csv&{query}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'start and end must be dates in YYYY-MM-DD format'
+
+
+def test_export_report_rejects_reversed_window(logged_in):
+    response = logged_in.get('/export_report?format=csv&start=2025-06-30&end=2025-06-01')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'start must not be after end'
+
+
+def test_default_farm_is_never_busy(client):
+    for _ in range(FARM_MAX_INFLIGHT + 1):
+        tenants.default.enter()
+    assert client.post('/predict_milk', json=MILK_INPUT).status_code == 200
+
+
+def test_busy_farm_gets_429(client):
+    farm = tenants.get('north')
+    for _ in range(FARM_MAX_INFLIGHT):
+        farm.enter()
     try:
-        response = requests.get(f"{base_url}/export_report?format=csv")
-        if response.status_code == 200:
-            print("✅ Report export works")
-        else:
-            print(f"❌ Report export failed: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Report export error: {e}")
-    
-    print("=" * 50)
-    print("🎉 Testing completed!")
-    print("\n📱 To access the application:")
-    print("1. Open your browser")
-    print("2. Go to http://localhost:5000")
-    print("3. Login with: farmer1 / password123")
-    print("4. Explore the features!")
-    
-    return True
-
-if __name__ == "__main__":
-    test_application()
+        response = client.post('/predict_milk', json=MILK_INPUT, headers=NORTH)
+        assert response.status_code == 429
+        assert not response.get_json()['success']
+        # Only prediction routes count against the cap
+        assert client.get('/api/farm-analytics', headers=NORTH).status_code == 200
+    finally:
+        for _ in range(FARM_MAX_INFLIGHT):
+            farm.leave()
+    assert client.post('/predict_milk', json=MILK_INPUT, headers=NORTH).status_code == 200
+
+
+def test_api_key_picks_the_farm(client):
+    client.post('/api/production', json=production_rows(days=1), headers=NORTH)
+    north = client.get('/api/farm-analytics', headers=NORTH).get_json()
+    assert north['active_cows'] == 4
+    assert client.get('/api/farm-analytics', headers={**NORTH, 'X-Farm-ID': 'north'}).get_json() == north
+    assert client.get('/api/farm-analytics?farm_id=north', headers=NORTH).get_json() == north
+
+
+@pytest.mark.parametrize('headers, query, status', [
+    ({'X-Farm-ID': 'north'}, '', 401),
+    ({}, '?farm_id=north', 401),
+    ({'X-Farm-ID': 'nowhere'}, '', 401),
+    ({'X-API-Key': 'not-a-key'}, '', 401),
+    ({'X-API-Key': 'not-a-key', 'X-Farm-ID': 'north'}, '', 401),
+    ({**NORTH, 'X-Farm-ID': 'south'}, '', 403),
+    (NORTH, '?farm_id=south', 403),
+    (NORTH, '?farm_id=default', 403),
+])
+def test_farm_access_needs_that_farms_credentials(client, headers, query, status):
+    assert client.get(f'/api/farm-analytics{query}', headers=headers).status_code == status
+    assert client.post(f'/api/production{query}', json=production_rows(days=1), headers=headers).status_code == status
+
+
+def test_dashboard_user_stays_on_their_farm(logged_in):
+    assert logged_in.get('/api/farm-analytics').status_code == 200
+    assert logged_in.get('/api/farm-analytics', headers={'X-Farm-ID': 'north'}).status_code == 403
+    assert logged_in.get('/api/farm-analytics', headers=NORTH).status_code == 200
+
+
+@pytest.mark.parametrize('forest', [
+    RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0),
+    RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0),
+])
+def test_flat_forest_matches_sklearn(tmp_path, forest):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 6))
+    X[:5] *= 20  # outliers for the clipper
+    y = X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.1, size=400)
+    if isinstance(forest, RandomForestClassifier):
+        y = (y > 0).astype(int)
+    pipeline = Pipeline([('clip', IQRClipper()), ('scale', StandardScaler()), ('model', forest)]).fit(X, y)
+    export_pipeline(pipeline, str(tmp_path))
+    flat = FlatForest.load(str(tmp_path))
+
+    X_test = rng.normal(size=(2500, 6)) * 2
+    if isinstance(forest, RandomForestClassifier):
+        np.testing.assert_allclose(flat.predict_proba(X_test), pipeline.predict_proba(X_test), atol=1e-9)
+        np.testing.assert_array_equal(flat.predict(X_test), pipeline.predict(X_test))
+    else:
+        np.testing.assert_allclose(flat.predict(X_test), pipeline.predict(X_test), atol=1e-9)
+    # Single rows take a different walk
+    np.testing.assert_allclose(flat.predict(X_test[:1]), pipeline.predict(X_test[:1]), atol=1e-9)
+
+
+def test_duplicate_ingest_is_idempotent(client):
+    rows = production_rows()
+    headers = {'X-API-Key': API_KEYS['south']}
+    first = client.post('/api/production', json=rows, headers=headers).get_json()
+    assert first['success'] and first['ingested'] == len(rows)
+    summary = client.get('/api/farm-analytics', headers=headers).get_json()
+    state = yield_state(tenants.get('south').analytics.path)
+
+    again = client.post('/api/production', json=rows + rows[:2], headers=headers).get_json()
+    assert again['success'] and again['ingested'] == 0
+    assert client.get('/api/farm-analytics', headers=headers).get_json() == summary
+    assert yield_state(tenants.get('south').analytics.path) == state
+
+
+def test_corrected_record_replaces_the_old_one(tmp_path):
+    rows = normalize_production(pd.DataFrame(production_rows()))
+    analytics = HerdAnalytics(str(tmp_path / 'analytics.db'), seed=None)
+    analytics.ingest(rows)
+    before = analytics.summary()
+
+    corrected = rows.tail(1).assign(milk_liters=rows['milk_liters'].iloc[-1] + 4.0)
+    assert analytics.ingest(corrected) == 1
+    after = analytics.summary()
+    assert after['total_milk_production'] == pytest.approx(before['total_milk_production'] + 4.0)
+    assert [d['cows'] for d in after['daily_production']] == [d['cows'] for d in before['daily_production']]
+
+    # Sending the original back restores every rollup
+    analytics.ingest(rows.tail(1))
+    assert analytics.summary() == before
+    analytics.close()
+
+
+def test_replayed_cow_days_do_not_update_the_yield_fit(tmp_path):
+    rows = normalize_production(pd.DataFrame(production_rows(days=10)))
+    analytics = HerdAnalytics(str(tmp_path / 'analytics.db'), seed=None)
+    analytics.ingest(rows)
+    state = yield_state(analytics.path)
+
+    conn = analytics._conn()
+    with conn:
+        assert analytics.monitor.update(conn, rows) == []
+    assert yield_state(analytics.path) == state
+    analytics.close()
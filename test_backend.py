@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the FastAPI backend
+Run with: python -m pytest
+"""
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import alert_brokers, app, batchers
+from conftest import API_KEYS
+from tenancy import tenants
+
+MILK_INPUT = {'feed_kg': 12.0, 'temp_c': 25.0, 'humidity': 60, 'milking_time': 15.0}
+NORTH = {'X-API-Key': API_KEYS['north']}
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_predict_milk(client):
+    response = client.post('/predict_milk', json=MILK_INPUT)
+    assert response.status_code == 200
+    assert response.json()['predicted_yield'] > 0
+
+
+@pytest.mark.parametrize('headers, status', [
+    ({}, 200),
+    (NORTH, 200),
+    ({**NORTH, 'X-Farm-ID': 'north'}, 200),
+    ({'X-Farm-ID': 'north'}, 401),
+    ({'X-API-Key': 'not-a-key'}, 401),
+    ({**NORTH, 'X-Farm-ID': 'south'}, 403),
+])
+def test_farm_access_needs_that_farms_credentials(client, headers, status):
+    assert client.get('/api/farm-analytics', headers=headers).status_code == status
+    assert client.post('/predict_milk', json=MILK_INPUT, headers=headers).status_code == status
+
+
+def test_closed_farm_drops_its_broker_and_batchers(client):
+    south = {'X-API-Key': API_KEYS['south']}
+    assert client.get('/model_status', headers=south).status_code == 200
+    assert client.get('/api/alerts/stats', headers=south).status_code == 200
+    broker = alert_brokers['south']
+    assert ('south', 'milk') in batchers
+
+    tenants._sweep(time.monotonic() + 10 ** 6)
+    deadline = time.monotonic() + 5
+    while 'south' in alert_brokers and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert 'south' not in alert_brokers
+    assert not [key for key in batchers if key[0] == 'south']
+    assert broker._task is None
+    # Nothing polls the closed farm back open
+    time.sleep(1)
+    assert not tenants._farms['south'].is_open()
+
+    # The next request starts over with a fresh broker
+    assert client.get('/api/alerts/stats', headers=south).json()['subscribers'] == 0
+    assert alert_brokers['south'] is not broker
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for batch scoring and streamed CSV uploads
+Run with: python -m pytest
+"""
+
+import io
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from backend import app as backend_app
+from batch_scoring import DISEASE_INPUT_FIELDS, MILK_INPUT_FIELDS, SCORE_COLUMNS, batch_frame, stream_scored_csv
+
+HERD_CSV = 'clinical_mastitis_cows_version1.csv'
+
+
+def herd_csv(rows=7, bad_row=3):
+    """The first rows of the mastitis CSV, with one unparseable temperature"""
+    herd = pd.read_csv(HERD_CSV, nrows=rows)
+    herd['Temperature'] = herd['Temperature'].astype(object)
+    herd.loc[bad_row, 'Temperature'] = 'abc'
+    return herd, herd.to_csv(index=False)
+
+
+def test_streamed_chunks_keep_scores_under_their_header():
+    herd, text = herd_csv()
+    out = ''.join(stream_scored_csv(io.StringIO(text), 'disease', chunk_rows=2))
+    scored = pd.read_csv(io.StringIO(out))
+
+    assert list(scored.columns) == list(herd.columns) + SCORE_COLUMNS['disease']
+    assert len(scored) == len(herd)
+    assert scored['Cow_ID'].tolist() == herd['Cow_ID'].tolist()
+    bad = scored.iloc[3]
+    assert 'temperature' in bad['error'] and pd.isna(bad['probability']) and pd.isna(bad['risk_level'])
+    good = scored.drop(index=3)
+    assert good['error'].isna().all()
+    assert good['probability'].between(0, 1).all()
+    assert good['risk_level'].isin(['low', 'medium', 'high']).all()
+
+
+def test_streamed_ndjson_numbers_rows_across_chunks():
+    _, text = herd_csv()
+    out = ''.join(stream_scored_csv(io.StringIO(text), 'disease', output_format='ndjson', chunk_rows=2))
+    results = [pd.read_json(io.StringIO(line), typ='series') for line in out.splitlines()]
+    assert [r['index'] for r in results] == list(range(7))
+    assert 'error' in results[3] and all('error' not in r for i, r in enumerate(results) if i != 3)
+
+
+def test_upload_csv_route_matches_the_generator():
+    _, text = herd_csv()
+    with app.test_client() as client:
+        response = client.post('/upload_csv?model=disease&chunk_rows=2', data=text, content_type='text/csv')
+        assert response.status_code == 200
+        body = response.get_data(as_text=True)
+    assert body == ''.join(stream_scored_csv(io.StringIO(text), 'disease', chunk_rows=2))
+
+
+@pytest.mark.parametrize('route, fields, columns', [
+    ('/predict_disease_batch', DISEASE_INPUT_FIELDS, {'IUFL': [5.2], 'iufl': [5.3]}),
+    ('/predict_milk_batch', MILK_INPUT_FIELDS, {'milking_time_min': [15.0], 'Milking_Time': [14.0]}),
+])
+def test_columns_naming_one_field_twice_are_rejected(route, fields, columns):
+    payload = {'cow_id': ['C001'], **columns}
+    with pytest.raises(ValueError, match='given more than once'):
+        batch_frame(payload, fields)
+    with app.test_client() as client:
+        result = client.post(route, json=payload).get_json()
+        assert not result['success'] and 'given more than once' in result['error']
+    response = TestClient(backend_app).post(route, json=payload)
+    assert response.status_code == 422 and 'given more than once' in response.json()['detail']
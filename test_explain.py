@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for prediction explanations
+Run with: python -m pytest
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from app import app
+from explain import path_contributions, shap_contributions
+from features import IQRClipper
+from flat_forest import FlatForest, flatten_pipeline
+from test_app import DISEASE_INPUT
+
+# Clinical signs present, so the forest has something to attribute
+SICK_COW = {**DISEASE_INPUT, 'temperature': 40.1, 'iufl': 7.9, 'hardness': 1, 'pain': 1, 'milk_visibility': 1}
+
+
+def fitted(forest):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 5))
+    y = X[:, 0] + 2 * X[:, 1] * X[:, 2] + rng.normal(scale=0.1, size=300)
+    if isinstance(forest, RandomForestClassifier):
+        y = (y > 0).astype(int)
+    # Column 4 is constant, so no tree ever splits on it
+    X[:, 4] = 1.0
+    pipeline = Pipeline([('clip', IQRClipper()), ('scale', StandardScaler()), ('model', forest)]).fit(X, y)
+    return pipeline, rng.normal(size=(50, 5)) * 2
+
+
+@pytest.mark.parametrize('forest', [
+    RandomForestRegressor(n_estimators=15, max_depth=6, random_state=0),
+    RandomForestClassifier(n_estimators=15, max_depth=6, random_state=0),
+])
+def test_path_contributions_add_up_to_the_prediction(forest):
+    pipeline, X = fitted(forest)
+    flat = FlatForest(*flatten_pipeline(pipeline))
+    if isinstance(forest, RandomForestClassifier):
+        base, values = path_contributions(flat, X, output=1)
+        expected = pipeline.predict_proba(X)[:, 1]
+    else:
+        base, values = path_contributions(flat, X)
+        expected = pipeline.predict(X)
+    np.testing.assert_allclose(base + values.sum(axis=1), expected, atol=1e-9)
+    assert not values[:, 4].any()
+
+
+def test_shap_contributions_add_up_to_the_prediction():
+    shap = pytest.importorskip('shap')
+    pipeline, X = fitted(RandomForestRegressor(n_estimators=15, max_depth=6, random_state=0))
+    columns = [f'f{i}' for i in range(5)]
+    pipeline.fit(pd.DataFrame(X, columns=columns), pipeline.predict(X))
+    base, values = shap_contributions(shap.TreeExplainer(pipeline.steps[-1][1]), pipeline[:-1], columns, X)
+    np.testing.assert_allclose(base + values.sum(axis=1), pipeline.predict(pd.DataFrame(X, columns=columns)),
+                               atol=1e-6)
+
+
+def explanation(client, explanation_id):
+    deadline = time.monotonic() + 10
+    while True:
+        response = client.get(f'/explain/{explanation_id}')
+        if response.status_code != 202 or time.monotonic() > deadline:
+            return response
+        time.sleep(0.02)
+
+
+def test_single_and_batch_explanations_agree_with_the_score():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        scored = client.post('/predict_disease', json=SICK_COW).get_json()
+        response = explanation(client, scored['explanation_id'])
+        batch = client.post('/predict_disease_batch?explain=1', json={'rows': [SICK_COW]}).get_json()
+
+    assert response.status_code == 200
+    single = response.get_json()['explanation']
+    assert single['prediction'] == pytest.approx(scored['probability'], abs=1e-3)
+    assert single['base_value'] + sum(single['contributions'].values()) == pytest.approx(scored['probability'], abs=2e-3)
+    assert single['top_features'][0] == max(single['contributions'], key=lambda f: abs(single['contributions'][f]))
+
+    row = batch['results'][0]
+    assert row['probability'] == pytest.approx(scored['probability'], abs=1e-3)
+    assert row['contributions'] == single['contributions']
+    assert batch['explanation'] == {key: single[key] for key in ('method', 'scale', 'base_value')}
+
+
+@pytest.mark.parametrize('explanation_id', [
+    'disease.00000000.AAAAAAAAAAA',
+    'disease.nothex',
+    'herd.00000000.AAAAAAAAAAA',
+])
+def test_unknown_explanations_are_404(explanation_id):
+    with app.test_client() as client:
+        assert client.get(f'/explain/{explanation_id}').status_code == 404
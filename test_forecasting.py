@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for milk yield forecasting
+Run with: python -m pytest
+"""
+
+import pandas as pd
+import pytest
+
+from forecasting import MAX_HORIZON, MilkForecaster
+from herd_analytics import HerdAnalytics, SEED_DATA, normalize_production
+
+SEED = normalize_production(pd.read_csv(SEED_DATA))
+DAYS = sorted(SEED['date'].unique())
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = HerdAnalytics(str(tmp_path / 'analytics.db'), seed=None)
+    analytics.ingest(SEED[SEED['date'] <= DAYS[19]])
+    yield analytics
+    analytics.close()
+
+
+def fresh(analytics, **kwargs):
+    return MilkForecaster(analytics).forecast(**kwargs)
+
+
+def test_forecast_shape(analytics):
+    result = MilkForecaster(analytics).forecast(horizon=5)
+    assert result['last_recorded_day'] == DAYS[19]
+    assert result['dates'][0] == (pd.Timestamp(DAYS[19]) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    assert len(result['herd']) == 5 and len(result['cows']) == SEED['cow_id'].nunique()
+    for entry in result['herd']:
+        assert entry['lower'] <= entry['liters'] <= entry['upper']
+    assert result['herd'][0]['liters'] == pytest.approx(sum(c['liters'][0] for c in result['cows']), abs=0.05)
+
+
+def test_horizon_and_cow_are_checked(analytics):
+    forecaster = MilkForecaster(analytics)
+    with pytest.raises(ValueError):
+        forecaster.forecast(horizon=MAX_HORIZON + 1)
+    with pytest.raises(ValueError):
+        forecaster.forecast(horizon=1, weather=[{'temp_c': 30, 'humidity': 60}] * 2)
+    with pytest.raises(KeyError):
+        forecaster.forecast(cow_id='nobody')
+
+
+def test_hotter_weather_lowers_the_forecast(analytics):
+    forecaster = MilkForecaster(analytics)
+    mild = forecaster.forecast(horizon=1, weather=[{'temp_c': 20, 'humidity': 70}])['herd'][0]['liters']
+    hot = forecaster.forecast(horizon=1, weather=[{'temp_c': 38, 'humidity': 30}])['herd'][0]['liters']
+    assert hot != mild
+
+
+def test_new_days_match_a_fresh_forecaster(analytics):
+    forecaster = MilkForecaster(analytics)
+    forecaster.forecast()
+    for day in DAYS[20:23]:
+        analytics.ingest(SEED[SEED['date'] == day])
+        assert forecaster.forecast() == fresh(analytics)
+
+
+def test_backfilled_cow_is_picked_up(analytics):
+    forecaster = MilkForecaster(analytics)
+    forecaster.forecast()
+    # A cow whose history arrives late, for days already folded in
+    late = SEED[(SEED['cow_id'] == SEED['cow_id'].iloc[0]) & (SEED['date'] <= DAYS[18])].assign(cow_id='LATE1')
+    analytics.ingest(late)
+    result = forecaster.forecast()
+    assert 'LATE1' in [cow['cow_id'] for cow in result['cows']]
+    assert result == fresh(analytics)
+
+
+def test_corrected_day_is_refolded(analytics):
+    forecaster = MilkForecaster(analytics)
+    before = forecaster.forecast()
+    cow = SEED['cow_id'].iloc[0]
+    corrected = SEED[(SEED['cow_id'] == cow) & (SEED['date'] == DAYS[17])].assign(milk_liters=1.0)
+    analytics.ingest(corrected)
+    result = forecaster.forecast(cow_id=cow)
+    assert result == fresh(analytics, cow_id=cow)
+    assert result['cows'] != [c for c in before['cows'] if c['cow_id'] == cow]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the production rollups
+Run with: python -m pytest
+"""
+
+import pandas as pd
+import pytest
+
+from app import app
+from herd_analytics import HerdAnalytics, SEED_DATA, normalize_production, parse_production
+
+ROW = {'Date': '2025-06-01', 'Cow_ID': 'C001', 'Feed_kg': 9.61, 'Temp_C': 25.1, 'Humidity': 59,
+       'Milking_Time_min': 17, 'Milk_Liters': 17.7}
+
+
+@pytest.mark.parametrize('field, value', [
+    ('Milk_Liters', None),
+    ('Feed_kg', None),
+    ('Cow_ID', None),
+    ('Date', None),
+    ('Humidity', float('inf')),
+])
+def test_missing_values_are_rejected(field, value):
+    with pytest.raises(ValueError, match=field.lower().replace('_min', '')):
+        parse_production([ROW, dict(ROW, **{field: value})])
+
+
+def test_missing_csv_value_is_rejected():
+    text = 'Date,Cow_ID,Feed_kg,Temp_C,Humidity,Milking_Time_min,Milk_Liters\n2025-06-01,C001,9.6,25.1,59,17,\n'
+    with pytest.raises(ValueError, match='milk_liters'):
+        parse_production(text)
+
+
+def test_missing_values_are_a_400():
+    with app.test_client() as client:
+        response = client.post('/api/production', json=[dict(ROW, Milk_Liters=None)])
+        assert response.status_code == 400
+        assert 'milk_liters' in response.get_json()['error']
+        text = 'Date,Cow_ID,Feed_kg,Temp_C,Humidity,Milking_Time_min,Milk_Liters\n2025-06-01,C001,9.6,,59,17,17\n'
+        assert client.post('/api/production', data=text, content_type='text/csv').status_code == 400
+
+
+def test_summary_matches_the_records(tmp_path):
+    seed = normalize_production(pd.read_csv(SEED_DATA))
+    analytics = HerdAnalytics(str(tmp_path / 'analytics.db'), seed=None)
+    analytics.ingest(seed)
+    first, last = seed['date'].min(), seed['date'].max()
+    summary = analytics.summary(since=first, until=last)
+    assert summary['total_milk_production'] == pytest.approx(seed['milk_liters'].sum(), abs=0.01)
+    assert summary['active_cows'] == seed['cow_id'].nunique()
+    assert len(summary['daily_production']) == seed['date'].nunique()
+    top = seed.groupby('cow_id')['milk_liters'].sum().idxmax()
+    assert summary['top_performing_cows'][0]['cow_id'] == top
+    analytics.close()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for metrics shared across serve.py workers
+"""
+
+import os
+
+import pytest
+
+import metrics
+from metrics import ERRORS, MODEL_BATCH_ROWS
+
+
+def sample(text, name, **labels):
+    wanted = [f'{key}="{value}"' for key, value in labels.items()]
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+               if line.startswith(name + '{') and all(label in line for label in wanted))
+
+
+def in_worker(record):
+    """Run record() in a forked worker that shares metrics, then let it exit"""
+    directory = metrics._directory
+    pid = os.fork()
+    if pid == 0:
+        try:
+            metrics.share(directory)
+            record()
+            metrics.flush()
+        finally:
+            os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+
+
+@pytest.fixture
+def shared(tmp_path):
+    metrics.share(str(tmp_path))
+    yield tmp_path
+    metrics.share(None)
+
+
+def test_scrape_sums_every_worker(shared):
+    metrics.count_error('/metrics-test', ValueError())
+    MODEL_BATCH_ROWS.observe(3, model='metrics-test')
+
+    def record():
+        for _ in range(2):
+            metrics.count_error('/metrics-test', ValueError())
+        MODEL_BATCH_ROWS.observe(300, model='metrics-test')
+    in_worker(record)
+    in_worker(record)
+
+    text = metrics.render()
+    assert sample(text, ERRORS.name, route='/metrics-test', exception='ValueError') == 5
+    assert sample(text, MODEL_BATCH_ROWS.name + '_count', model='metrics-test') == 3
+    assert sample(text, MODEL_BATCH_ROWS.name + '_sum', model='metrics-test') == 603
+    assert sample(text, MODEL_BATCH_ROWS.name + '_bucket', model='metrics-test', le='4') == 1
+    assert sample(text, MODEL_BATCH_ROWS.name + '_bucket', model='metrics-test', le='+Inf') == 3
+    # Both exited workers keep their files; this process's own values are never double counted
+    assert len(list(shared.glob('*.json'))) == 3
+
+
+def test_gauges_are_not_summed(shared):
+    def record():
+        metrics.MODEL_INFO.set(1, model='metrics-test', version='v1', format='flat', family='forest')
+    in_worker(record)
+    record()
+    assert sample(metrics.render(), metrics.MODEL_INFO.name, model='metrics-test') == 1
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the prediction cache
+Run with: python -m pytest
+"""
+
+import prediction_cache
+from app import app
+from prediction_cache import PredictionCache, cache_key
+from tenancy import tenants
+from test_app import DISEASE_INPUT
+
+
+def test_keys_round_features_and_keep_models_apart():
+    assert cache_key('milk', 'v1', [12.5, -0.0]) == cache_key('milk', 'v1', [12.5000001, 0.0])
+    assert cache_key('milk', 'v1', [12.5]) != cache_key('milk', 'v1', [12.51])
+    assert cache_key('milk', 'v1', [12.5]) != cache_key('milk', 'v2', [12.5])
+    assert cache_key('milk', 'v1', [12.5]) != cache_key('disease', 'v1', [12.5])
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_size=2)
+    a, b, c = (cache_key('milk', 'v1', [x]) for x in (1, 2, 3))
+    cache.put(a, 1.0)
+    cache.put(b, 2.0)
+    assert cache.get(a) == 1.0
+    cache.put(c, 3.0)
+    assert cache.get(b) is None
+    assert cache.get(a) == 1.0 and cache.get(c) == 3.0
+    stats = cache.stats('milk')
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (3, 1, 1, 2)
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    cache = PredictionCache(max_size=10, ttl=60)
+    key = cache_key('disease', 'v1', [38.5])
+    cache.put(key, 0.7)
+    now[0] += 59
+    assert cache.get(key) == 0.7
+    now[0] += 2
+    assert cache.get(key) is None
+    assert cache.stats('disease')['expirations'] == 1
+
+
+def test_clear_and_disabled_cache():
+    cache = PredictionCache(max_size=10)
+    key = cache_key('milk', 'v1', [1])
+    cache.put(key, 1.0)
+    cache.clear()
+    assert cache.get(key) is None and cache.stats()['invalidations'] == 1
+
+    disabled = PredictionCache(max_size=0)
+    disabled.put(key, 1.0)
+    assert disabled.get(key) is None and disabled.stats()['entries'] == 0
+
+
+def test_repeated_request_is_served_from_the_cache():
+    app.config['TESTING'] = True
+    before = tenants.default.cache.stats('disease')
+    with app.test_client() as client:
+        first = client.post('/predict_disease', json={**DISEASE_INPUT, 'temperature': 39.123}).get_json()
+        again = client.post('/predict_disease', json={**DISEASE_INPUT, 'temperature': 39.1230001}).get_json()
+    after = tenants.default.cache.stats('disease')
+    assert first['success'] and again['probability'] == first['probability']
+    assert after['hits'] == before['hits'] + 1
+    assert after['misses'] == before['misses'] + 1
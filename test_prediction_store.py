@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for the prediction history
+Run with: python -m pytest
+"""
+
+from datetime import datetime
+
+import pytest
+
+from prediction_store import PredictionStore
+
+DAY = datetime(2025, 6, 1)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PredictionStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def score(store, cow_id, hour, probability, risk_level, day=DAY):
+    store.record('disease', cow_id=cow_id, probability=probability, risk_level=risk_level,
+                 timestamp=day.replace(hour=hour))
+
+
+def test_cows_at_risk_uses_each_cows_latest_score(store):
+    score(store, 'recovered', 8, 0.9, 'high')
+    score(store, 'recovered', 18, 0.1, 'low')
+    score(store, 'worsened', 8, 0.1, 'low')
+    score(store, 'worsened', 18, 0.8, 'high')
+    score(store, 'watch', 9, 0.5, 'medium')
+    score(store, 'watch', 10, 0.55, 'medium')
+    score(store, 'yesterday', 23, 0.95, 'high', day=datetime(2025, 5, 31))
+    store.record('milk', cow_id='recovered', predicted_milk=20.0, timestamp=DAY.replace(hour=19))
+    store.flush()
+
+    high = store.cows_at_risk('2025-06-01')
+    assert [r['cow_id'] for r in high] == ['worsened']
+    flagged = store.cows_at_risk('2025-06-01', risk_levels=('high', 'medium'))
+    assert [(r['cow_id'], r['probability']) for r in flagged] == [('worsened', 0.8), ('watch', 0.55)]
+    assert store.cows_at_risk('2025-06-02') == []
+
+
+def test_history_is_newest_first(store):
+    for hour in range(3):
+        store.record('milk', cow_id='C001', predicted_milk=10.0 + hour, timestamp=DAY.replace(hour=hour))
+    store.flush()
+    rows, total = store.history(cow_id='C001', kind='milk')
+    assert total == 3
+    assert [r['predicted_milk'] for r in rows] == [12.0, 11.0, 10.0]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for report export jobs
+Run with: python -m pytest
+"""
+
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+from app import app
+from conftest import API_KEYS
+from reports import ReportJobs
+
+
+@pytest.fixture
+def north_user(monkeypatch):
+    monkeypatch.setitem(app_module.users, 'asha', {
+        'password': generate_password_hash('north-pass'), 'name': 'Asha Rao', 'farm_name': 'North', 'farm_id': 'north'})
+
+
+def login(client, username, password):
+    client.post('/login', data={'username': username, 'password': password})
+    return client
+
+
+def wait_for(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f'/export_report/{job_id}').get_json()
+        if status['status'] != 'pending':
+            return status
+        time.sleep(0.2)
+    raise AssertionError(f'report {job_id} still pending')
+
+
+def test_reports_only_answer_their_owner(north_user):
+    with app.test_client() as owner:
+        login(owner, 'farmer1', 'password123')
+        owner.post('/predict_milk', json={'feed_kg': 12.0, 'temp_c': 25.0, 'humidity': 60, 'milking_time': 15.0})
+        response = owner.get('/export_report?format=csv&start=2025-06-01&end=2025-06-30')
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        assert wait_for(owner, job_id)['status'] == 'done'
+        download = owner.get(f'/export_report/{job_id}/download')
+        assert download.status_code == 200 and download.data.startswith(b'Report Type')
+
+    with app.test_client() as other:
+        login(other, 'asha', 'north-pass')
+        assert other.get(f'/export_report/{job_id}').status_code == 404
+        assert other.get(f'/export_report/{job_id}/download').status_code == 404
+
+    with app.test_client() as anonymous:
+        assert anonymous.get(f'/export_report/{job_id}/download', headers={'X-API-Key': API_KEYS['north']}).status_code == 302
+
+
+def test_status_checks_the_owner(tmp_path):
+    jobs = ReportJobs(directory=str(tmp_path))
+    job_id = jobs.job_id('Farm', 'farmer1', '2025-06-01', '2025-06-30', 'csv', 0, {})
+    (tmp_path / f'{job_id}.csv').write_text('done')
+    (tmp_path / f'{job_id}.csv.owner').write_text('{"user": "farmer1", "farm_id": "default"}')
+    assert jobs.status(job_id)['status'] == 'done'
+    assert jobs.status(job_id, owner={'user': 'farmer1', 'farm_id': 'default'})['status'] == 'done'
+    assert jobs.status(job_id, owner={'user': 'asha', 'farm_id': 'default'})['status'] == 'unknown'
+    assert jobs.status(job_id, owner={'user': 'farmer1', 'farm_id': 'north'})['status'] == 'unknown'
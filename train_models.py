@@ -6,114 +6,326 @@ Train and save ML models for the Smart Dairy Farm Management System
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+from sklearn.ensemble import (RandomForestRegressor, RandomForestClassifier,
+                              HistGradientBoostingRegressor, HistGradientBoostingClassifier)
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.metrics import r2_score, accuracy_score, classification_report
+import argparse
+import copy
+import hashlib
+import json
 import pickle
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def train_milk_production_model():
-    """Train the milk production prediction model"""
-    print("🥛 Training Milk Production Model...")
+from features import MILK_FEATURES, DISEASE_FEATURES, IQRClipper, temp_humidity_ratio
+from flat_forest import FlatForest, export_flat_models, flatten_pipeline, model_family
+from model_snapshots import activate, current_version, list_snapshots, save_snapshot, set_current
+from rolling_features import RollingFeatureEngine, HERD_STATE_FILE, uses_rolling_features
+
+MILK_DATA = 'farm_milk_production.csv'
+DISEASE_DATA = 'clinical_mastitis_cows_version1.csv'
+
+# Parsed, feature-engineered frames keyed by source file hash
+CACHE_DIR = os.path.join('.cache', 'training')
+# Bump when prepare_*_data changes so stale cached features are rebuilt
+FEATURE_VERSION = 1
+TARGET_COLUMN = '__target__'
+
+# Incremental updates: trees added per update, forest size cap (oldest trees are
+# dropped), previously seen rows replayed per new row, and the holdout score drop
+# that keeps a new snapshot from being activated
+ADD_TREES = 10
+MAX_TREES = 300
+REPLAY_RATIO = 4
+MIN_REPLAY_ROWS = 200
+SCORE_TOLERANCE = 0.02
+
+# Model families tried by --model-family auto; xgboost and lightgbm join when installed
+MODEL_FAMILIES = ['forest', 'hgb', 'xgboost', 'lightgbm']
+
+# Model choice: among candidates within SCORE_BUDGET of the best holdout score, the
+# fastest one whose single-row serving latency fits LATENCY_BUDGET_MS (or the fastest
+# of them if none fits)
+LATENCY_BUDGET_MS = 1.0
+SCORE_BUDGET = 0.01
+LATENCY_REPEATS = 200
+
+def prepare_milk_data(df):
+    """Feature engineering for the milk model (matching the notebook)"""
+    X = pd.DataFrame({
+        'Feed_kg': df['Feed_kg'],
+        'Milking_Time_min': df['Milking_Time_min'],
+        'temp_humidity_ratio': temp_humidity_ratio(df['Temp_C'], df['Humidity'])
+    }, columns=MILK_FEATURES)
+    y = df['Milk_Liters']
+    return X, y
+
+def available_families():
+    """Model families that can be trained here: forests and sklearn's histogram boosting always,
+    XGBoost / LightGBM when installed"""
+    families = ['forest', 'hgb']
+    for family in ('xgboost', 'lightgbm'):
+        try:
+            __import__(family)
+            families.append(family)
+        except ImportError:
+            pass
+    return families
+
+def build_estimator(family, is_classifier, n_estimators=100, n_jobs=None):
+    """Final pipeline step for a model family; boosted families use n_estimators as rounds"""
+    if family == 'forest':
+        model = RandomForestClassifier if is_classifier else RandomForestRegressor
+        return model(n_estimators=n_estimators, n_jobs=n_jobs, random_state=42)
+    if family == 'hgb':
+        # Fixed rounds (no early stopping) so warm-start updates can add more
+        model = HistGradientBoostingClassifier if is_classifier else HistGradientBoostingRegressor
+        return model(max_iter=n_estimators, early_stopping=False, random_state=42)
+    if family == 'xgboost':
+        import xgboost
+        model = xgboost.XGBClassifier if is_classifier else xgboost.XGBRegressor
+        return model(n_estimators=n_estimators, tree_method='hist', n_jobs=n_jobs, random_state=42)
+    if family == 'lightgbm':
+        import lightgbm
+        model = lightgbm.LGBMClassifier if is_classifier else lightgbm.LGBMRegressor
+        return model(n_estimators=n_estimators, n_jobs=n_jobs, random_state=42, verbose=-1)
+    raise ValueError(f"unknown model family '{family}'; expected one of {MODEL_FAMILIES}")
+
+def build_milk_pipeline(n_estimators=100, n_jobs=None, family='forest'):
+    """Milk yield pipeline; outliers are clipped to the training IQR bounds inside the
+    pipeline so serving applies exactly the same clipping"""
+    return Pipeline([
+        ('clip', IQRClipper()),
+        ('scaler', StandardScaler()),
+        ('model', build_estimator(family, False, n_estimators, n_jobs))
+    ])
+
+def prepare_disease_data(df, engine=None):
+    """Sensor and clinical features for the mastitis model
+
+    With a RollingFeatureEngine the per-cow rolling features are appended,
+    feeding each cow's days through the engine in Day order.
+    """
+    X = df[DISEASE_FEATURES].copy()
+    if engine is not None:
+        X = engine.frame(X, df['Cow_ID'], df['Day'], df['Previous_Mastits_status'])
+    y = df['class1']  # 0 = healthy, 1 = mastitis
+    return X, y
+
+def build_disease_pipeline(n_estimators=100, n_jobs=None, family='forest'):
+    return Pipeline([
+        ('scaler', StandardScaler()),
+        ('model', build_estimator(family, True, n_estimators, n_jobs))
+    ])
+
+def _predict_single_threaded(pipeline):
+    # joblib / OpenMP dispatch costs more than it saves on one row
+    model = pipeline.steps[-1][1]
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=1 if model_family(model) in ('xgboost', 'lightgbm') else None)
+
+def serving_latency_ms(pipeline, X, is_classifier, repeats=LATENCY_REPEATS):
+    """Median single-row latency the way the registry will serve this model
+
+    Forests are served from their flat export, so they are timed on one;
+    everything else is timed through the pickled pipeline.
+    """
+    model = FlatForest(*flatten_pipeline(pipeline)) if model_family(pipeline) == 'forest' else pipeline
+    method = model.predict_proba if is_classifier else model.predict
+    row = X.iloc[:1] if model is pipeline else X.iloc[:1].to_numpy()
+    method(row)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        method(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000
+
+def batch_us_per_row(pipeline, X, is_classifier, rows=1000):
+    """Per-row cost of scoring a herd-sized batch through the pickled pipeline"""
+    batch = X.iloc[np.arange(rows) % len(X)]
+    method = pipeline.predict_proba if is_classifier else pipeline.predict
+    started = time.perf_counter()
+    method(batch)
+    return (time.perf_counter() - started) * 1e6 / rows
+
+def select_model(build, X_train, y_train, X_test, y_test, is_classifier, families, n_jobs=-1,
+                 latency_budget_ms=LATENCY_BUDGET_MS, score_budget=SCORE_BUDGET):
+    """Train one pipeline per family and pick one by holdout score and serving latency
+
+    Returns (pipeline, selection), where selection records every candidate's
+    score, fit time, latency and size along with the budgets used.
+    """
+    candidates, pipelines = {}, {}
+    for family in families:
+        pipeline = build(n_jobs=n_jobs, family=family)
+        started = time.perf_counter()
+        pipeline.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - started
+        _predict_single_threaded(pipeline)
+        pipelines[family] = pipeline
+        candidates[family] = {
+            'estimator': type(pipeline.steps[-1][1]).__name__,
+            'score': round(_score(pipeline, X_test, y_test, is_classifier), 4),
+            'fit_seconds': round(fit_seconds, 3),
+            'single_row_ms': round(serving_latency_ms(pipeline, X_test, is_classifier), 4),
+            'batch_us_per_row': round(batch_us_per_row(pipeline, X_test, is_classifier), 2),
+            'model_bytes': len(pickle.dumps(pipeline)),
+        }
     
-    # Load data
-    df = pd.read_csv('farm_milk_production.csv')
+    best = max(c['score'] for c in candidates.values())
+    accurate = [f for f, c in candidates.items() if c['score'] >= best - score_budget]
+    fast = [f for f in accurate if candidates[f]['single_row_ms'] <= latency_budget_ms]
+    chosen = min(fast or accurate, key=lambda f: candidates[f]['single_row_ms'])
+    selection = {
+        'family': chosen,
+        'latency_budget_ms': latency_budget_ms,
+        'score_budget': score_budget,
+        'within_latency_budget': bool(fast),
+        'candidates': candidates,
+    }
+    return pipelines[chosen], selection
+
+def _report_selection(label, selection):
+    for family, candidate in selection['candidates'].items():
+        marker = '*' if family == selection['family'] else ' '
+        print(f"   {marker} {label} {family:8s} score={candidate['score']:.4f} fit={candidate['fit_seconds']:.2f}s "
+              f"single={candidate['single_row_ms']:.3f}ms batch={candidate['batch_us_per_row']:.1f}us/row "
+              f"size={candidate['model_bytes'] / 1e6:.2f}MB")
+    if not selection['within_latency_budget']:
+        print(f"⚠️  No accurate {label} model scores a row within {selection['latency_budget_ms']} ms; "
+              f"using the fastest ({selection['family']})")
+
+def file_hash(path):
+    """SHA-256 of a file's contents, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_format():
+    # Parquet when pyarrow is installed, otherwise pandas' own pickle format
+    try:
+        import pyarrow  # noqa: F401
+        return 'parquet'
+    except ImportError:
+        return 'pkl'
+
+def load_features(source, prepare):
+    """Return (X, y) for a CSV, reusing the cached feature frame if the file is unchanged"""
+    started = time.perf_counter()
+    fmt = _cache_format()
+    name = os.path.splitext(os.path.basename(source))[0]
+    path = os.path.join(CACHE_DIR, f"{name}_{prepare.__name__}_v{FEATURE_VERSION}_{file_hash(source)[:16]}.{fmt}")
     
-    # Feature engineering (matching the notebook)
-    df['temp_humidity_ratio'] = df['Temp_C'] / (df['Humidity'] + 1)
+    if os.path.exists(path):
+        frame = pd.read_parquet(path) if fmt == 'parquet' else pd.read_pickle(path)
+        print(f"⚡ Loaded cached features for {source} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return frame.drop(columns=[TARGET_COLUMN]), frame[TARGET_COLUMN]
     
-    # Prepare features
-    X = df[['Feed_kg', 'Milking_Time_min', 'temp_humidity_ratio']].copy()
-    y = df['Milk_Liters']
+    X, y = prepare(pd.read_csv(source))
+    frame = X.copy()
+    frame[TARGET_COLUMN] = y.to_numpy()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.partial"
+    if fmt == 'parquet':
+        frame.to_parquet(partial, index=False)
+    else:
+        frame.to_pickle(partial)
+    os.replace(partial, path)
+    print(f"📦 Parsed and cached features for {source} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return X, y
+
+def train_milk_production_model(n_jobs=-1, families=('forest',), latency_budget_ms=LATENCY_BUDGET_MS,
+                                score_budget=SCORE_BUDGET):
+    """Train the milk production prediction model; returns (pipeline, selection)"""
+    print("🥛 Training Milk Production Model...")
     
-    # Handle outliers
-    for col in X.columns:
-        q1 = X[col].quantile(0.25)
-        q3 = X[col].quantile(0.75)
-        iqr = q3 - q1
-        X[col] = X[col].clip(q1 - 1.5*iqr, q3 + 1.5*iqr)
+    # Load data and prepare features
+    X, y = load_features(MILK_DATA, prepare_milk_data)
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    # Create pipeline
-    pipeline = Pipeline([
-        ('scaler', StandardScaler()),
-        ('model', RandomForestRegressor(n_estimators=100, random_state=42))
-    ])
-    
-    # Train model
-    pipeline.fit(X_train, y_train)
+    # Train every candidate family and keep the one that fits the budgets
+    pipeline, selection = select_model(build_milk_pipeline, X_train, y_train, X_test, y_test, False,
+                                       families, n_jobs, latency_budget_ms, score_budget)
+    _report_selection('milk', selection)
     
     # Evaluate
-    y_pred = pipeline.predict(X_test)
-    r2 = r2_score(y_test, y_pred)
-    print(f"✅ Milk Production Model R² Score: {r2:.4f}")
+    r2 = selection['candidates'][selection['family']]['score']
+    print(f"✅ Milk Production Model ({selection['family']}) R² Score: {r2:.4f}")
     
     # Save model
     with open('milk_production_model.pkl', 'wb') as f:
         pickle.dump(pipeline, f)
     print("✅ Milk production model saved successfully")
     
-    return pipeline
+    return pipeline, selection
 
-def train_disease_detection_model():
-    """Train the disease detection model"""
+def train_disease_detection_model(n_jobs=-1, rolling=False, families=('forest',),
+                                  latency_budget_ms=LATENCY_BUDGET_MS, score_budget=SCORE_BUDGET):
+    """Train the disease detection model; returns (pipeline, selection)"""
     print("🏥 Training Disease Detection Model...")
     
-    # Load data
-    df = pd.read_csv('clinical_mastitis_cows_version1.csv')
-    
-    # Prepare features
-    feature_cols = ['IUFL', 'EUFL', 'IUFR', 'EUFR', 'IURL', 'EURL', 'IURR', 'EURR', 
-                   'Temperature', 'Hardness', 'Pain', 'Milk_visibility']
-    X = df[feature_cols].copy()
-    y = df['class1']  # 0 = healthy, 1 = mastitis
+    # Load data and prepare features
+    if rolling:
+        # Rolling features are rebuilt from the full history; the resulting herd
+        # state is saved so serving continues each cow where training stopped
+        engine = RollingFeatureEngine()
+        X, y = prepare_disease_data(pd.read_csv(DISEASE_DATA), engine)
+        engine.save(HERD_STATE_FILE)
+        print(f"📈 Rolling features for {len(engine.slots)} cows saved to {HERD_STATE_FILE}")
+    else:
+        X, y = load_features(DISEASE_DATA, prepare_disease_data)
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    # Create pipeline
-    pipeline = Pipeline([
-        ('scaler', StandardScaler()),
-        ('model', RandomForestClassifier(n_estimators=100, random_state=42))
-    ])
-    
-    # Train model
-    pipeline.fit(X_train, y_train)
+    # Train every candidate family and keep the one that fits the budgets
+    pipeline, selection = select_model(build_disease_pipeline, X_train, y_train, X_test, y_test, True,
+                                       families, n_jobs, latency_budget_ms, score_budget)
+    _report_selection('disease', selection)
     
     # Evaluate
-    y_pred = pipeline.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
-    print(f"✅ Disease Detection Model Accuracy: {accuracy:.4f}")
+    accuracy = selection['candidates'][selection['family']]['score']
+    print(f"✅ Disease Detection Model ({selection['family']}) Accuracy: {accuracy:.4f}")
     
     # Save model
     with open('cattle_disease_detector.pkl', 'wb') as f:
         pickle.dump(pipeline, f)
     print("✅ Disease detection model saved successfully")
     
-    return pipeline
+    return pipeline, selection
 
-def create_ensemble_model():
+def create_ensemble_model(milk_model=None, disease_model=None, version='1.0', trained_date=None, selection=None):
     """Create an ensemble model combining both predictions"""
     print("🤖 Creating Ensemble Model...")
     
-    # Load individual models
-    with open('milk_production_model.pkl', 'rb') as f:
-        milk_model = pickle.load(f)
+    # Load individual models only when they were not just trained in this process
+    if milk_model is None:
+        with open('milk_production_model.pkl', 'rb') as f:
+            milk_model = pickle.load(f)
     
-    with open('cattle_disease_detector.pkl', 'rb') as f:
-        disease_model = pickle.load(f)
+    if disease_model is None:
+        with open('cattle_disease_detector.pkl', 'rb') as f:
+            disease_model = pickle.load(f)
     
     # Create ensemble
     ensemble = {
         'milk_model': milk_model,
         'disease_model': disease_model,
-        'version': '1.0',
-        'trained_date': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+        'version': version,
+        'trained_date': trained_date or pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+        # Which model family was picked for each task and how the candidates compared
+        'model_selection': selection or {}
     }
     
     # Save ensemble
@@ -123,23 +335,197 @@ def create_ensemble_model():
     
     return ensemble
 
-def main():
+def _score(pipeline, X, y, is_classifier):
+    y_pred = pipeline.predict(X)
+    return accuracy_score(y, y_pred) if is_classifier else r2_score(y, y_pred)
+
+def warm_start_update(pipeline, X_new, y_new, X_seen, y_seen, is_classifier,
+                      add_trees=ADD_TREES, max_trees=MAX_TREES):
+    """Grow a fitted forest pipeline with trees trained on new rows plus a replay sample
+
+    The clipper and scaler stay frozen so existing trees keep seeing the same
+    inputs; only the final forest is warm-started. HistGradientBoosting models get
+    add_trees more boosting rounds instead (no cap: later rounds depend on earlier
+    ones). Returns (updated, before, after) holdout scores of the original and
+    updated pipelines.
+    """
+    replay = min(len(X_seen), max(MIN_REPLAY_ROWS, REPLAY_RATIO * len(X_new)))
+    sample = X_seen.sample(n=replay, random_state=len(X_new)).index
+    X = pd.concat([X_new, X_seen.loc[sample]], ignore_index=True)
+    y = pd.concat([y_new, y_seen.loc[sample]], ignore_index=True)
+    X_fit, X_hold, y_fit, y_hold = train_test_split(X, y, test_size=0.2, random_state=42)
+    
+    updated = copy.deepcopy(pipeline)
+    forest = updated.steps[-1][1]
+    family = model_family(forest)
+    if family not in ('forest', 'hgb'):
+        raise ValueError(f"{family} models cannot be updated incrementally; retrain with train_models.py")
+    if is_classifier and set(np.unique(y_fit)) != set(forest.classes_):
+        raise ValueError("update rows must contain every class the model was trained on")
+    
+    if family == 'hgb':
+        forest.set_params(warm_start=True, max_iter=forest.n_iter_ + add_trees)
+        forest.fit(updated[:-1].transform(X_fit), y_fit)
+        forest.set_params(warm_start=False)
+        return updated, _score(pipeline, X_hold, y_hold, is_classifier), _score(updated, X_hold, y_hold, is_classifier)
+    
+    forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + add_trees, n_jobs=-1)
+    forest.fit(updated[:-1].transform(X_fit), y_fit)
+    forest.set_params(warm_start=False, n_jobs=None)
+    
+    # Sliding window: drop the oldest trees once the forest reaches its cap
+    if len(forest.estimators_) > max_trees:
+        forest.estimators_ = forest.estimators_[-max_trees:]
+        forest.n_estimators = max_trees
+    
+    return updated, _score(pipeline, X_hold, y_hold, is_classifier), _score(updated, X_hold, y_hold, is_classifier)
+
+def _n_trees(pipeline):
+    model = pipeline.steps[-1][1]
+    return len(model.estimators_) if hasattr(model, 'estimators_') else int(model.n_iter_)
+
+def update_models_incrementally(milk_csv=None, disease_csv=None, add_trees=ADD_TREES, max_trees=MAX_TREES):
+    """Update the active models from new daily rows only, snapshot, and activate if not worse"""
+    print("🔁 Incremental model update...")
+    started = time.perf_counter()
+    
+    with open('complete_detector.pkl', 'rb') as f:
+        ensemble = pickle.load(f)
+    models = {'milk': ensemble['milk_model'], 'disease': ensemble['disease_model']}
+    
+    tasks = {
+        'milk': (milk_csv, MILK_DATA, prepare_milk_data, False),
+        'disease': (disease_csv, DISEASE_DATA, prepare_disease_data, True),
+    }
+    info = {'kind': 'incremental', 'rows': {}, 'scores': {}, 'trees': {}}
+    regressed = False
+    # The live herd state matches the active models; it is only replaced if this snapshot is activated
+    rolling = uses_rolling_features(getattr(models['disease'], 'feature_names_in_', None))
+    herd_state = RollingFeatureEngine.load(HERD_STATE_FILE) if rolling and os.path.exists(HERD_STATE_FILE) else None
+    for name, (new_csv, source, prepare, is_classifier) in tasks.items():
+        if new_csv is None:
+            continue
+        if name == 'disease' and rolling:
+            # New days continue each cow's saved rolling state
+            X_seen, y_seen = prepare(pd.read_csv(source), RollingFeatureEngine())
+            herd_state = herd_state or RollingFeatureEngine()
+            X_new, y_new = prepare(pd.read_csv(new_csv), herd_state)
+        else:
+            X_new, y_new = prepare(pd.read_csv(new_csv))
+            X_seen, y_seen = load_features(source, prepare)
+        models[name], before, after = warm_start_update(
+            models[name], X_new, y_new, X_seen, y_seen, is_classifier, add_trees, max_trees)
+        
+        info['rows'][name] = len(X_new)
+        info['scores'][name] = {'before': round(before, 4), 'after': round(after, 4)}
+        info['trees'][name] = _n_trees(models[name])
+        regressed = regressed or after < before - SCORE_TOLERANCE
+        print(f"✅ {name} model: +{len(X_new)} rows, holdout score {before:.4f} -> {after:.4f}")
+    
+    info['families'] = {name: model_family(model) for name, model in models.items()}
+    info['activated'] = not regressed
+    version, _ = save_snapshot(models['milk'], models['disease'], info, ensemble.get('model_selection'),
+                               herd_state=herd_state)
+    if regressed:
+        print(f"⚠️  Snapshot {version} scores worse than {current_version()} and was not activated")
+    else:
+        activate(version)
+        print(f"🎉 Snapshot {version} is now active ({time.perf_counter() - started:.1f}s)")
+    return version
+
+def main(argv=None):
     """Main training function"""
+    parser = argparse.ArgumentParser(description='Train the milk yield and mastitis models')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='sweep dataset size, n_estimators and n_jobs and write timing results instead of training')
+    from benchmark_models import add_benchmark_arguments, run_benchmarks
+    parser.add_argument('--n-jobs', type=int, default=-1, help='cores used inside each forest (default: all)')
+    parser.add_argument('--rolling-features', action='store_true',
+                        help='add per-cow rolling sensor features to the mastitis model')
+    parser.add_argument('--model-family', default='auto', choices=['auto'] + MODEL_FAMILIES,
+                        help='model family to train; auto tries every installed one and picks by the budgets below')
+    parser.add_argument('--latency-budget-ms', type=float, default=LATENCY_BUDGET_MS,
+                        help=f'single-row serving latency allowed when picking a model (default: {LATENCY_BUDGET_MS})')
+    parser.add_argument('--score-budget', type=float, default=SCORE_BUDGET,
+                        help=f'holdout score drop from the best candidate that is still accepted (default: {SCORE_BUDGET})')
+    parser.add_argument('--update-milk', metavar='CSV', help='warm-start the active milk model with new rows')
+    parser.add_argument('--update-disease', metavar='CSV', help='warm-start the active disease model with new rows')
+    parser.add_argument('--add-trees', type=int, default=ADD_TREES, help='trees added per incremental update')
+    parser.add_argument('--max-trees', type=int, default=MAX_TREES, help='forest size cap for incremental updates')
+    parser.add_argument('--snapshots', action='store_true', help='list model snapshots')
+    parser.add_argument('--rollback', metavar='VERSION', help='activate an earlier snapshot, e.g. v0003')
+    parser.add_argument('--export-flat', action='store_true',
+                        help='re-export the live models as memory-mappable flat forests')
+    add_benchmark_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if args.benchmark:
+        run_benchmarks(args.scales, args.estimators, args.jobs, args.models.split(','), args.output,
+                       args.families.split(','))
+        return True
+    
+    if args.snapshots:
+        active = current_version()
+        for manifest in list_snapshots():
+            marker = '*' if manifest['version'] == active else ' '
+            print(f"{marker} {manifest['version']}  {manifest['created_at']}  {manifest['kind']:11s}  "
+                  f"{json.dumps(manifest.get('families', {}))}  {json.dumps(manifest.get('scores', {}))}")
+        return True
+    
+    if args.rollback:
+        activate(args.rollback)
+        print(f"⏪ Rolled back to snapshot {args.rollback}; reload the app to serve it")
+        return True
+    
+    if args.export_flat:
+        with open('complete_detector.pkl', 'rb') as f:
+            exported = export_flat_models(pickle.load(f))
+        return all(exported.values())
+    
+    if args.update_milk or args.update_disease:
+        version = update_models_incrementally(args.update_milk, args.update_disease, args.add_trees, args.max_trees)
+        # A rejected update keeps the previous models, which a scheduled job should treat as a failure
+        return version == current_version()
+    
+    families = available_families() if args.model_family == 'auto' else [args.model_family]
+    if args.model_family not in ('auto', 'forest', 'hgb') and args.model_family not in families:
+        print(f"❌ {args.model_family} is not installed")
+        return False
+    budgets = (args.latency_budget_ms, args.score_budget)
+    
     print("🚀 Starting ML Model Training...")
+    print(f"🧪 Candidate model families: {', '.join(families)}")
     print("=" * 50)
     
     try:
-        # Train models
-        milk_model = train_milk_production_model()
-        disease_model = train_disease_detection_model()
-        ensemble = create_ensemble_model()
+        started = time.perf_counter()
+        
+        # Train both models at once; forest fitting releases the GIL, so threads
+        # run them in parallel and each forest also uses every core (n_jobs=-1)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            milk_future = pool.submit(train_milk_production_model, args.n_jobs, families, *budgets)
+            disease_future = pool.submit(train_disease_detection_model, args.n_jobs, args.rolling_features,
+                                         families, *budgets)
+            milk_model, milk_selection = milk_future.result()
+            disease_model, disease_selection = disease_future.result()
+        selection = {'milk': milk_selection, 'disease': disease_selection}
+        
+        # Keep every full retrain in the snapshot history so updates can be rolled back
+        version, bundle = save_snapshot(milk_model, disease_model, {
+            'kind': 'full',
+            'families': {name: s['family'] for name, s in selection.items()},
+        }, selection, herd_state=RollingFeatureEngine.load(HERD_STATE_FILE) if args.rolling_features else None)
+        ensemble = create_ensemble_model(milk_model, disease_model, version, bundle['trained_date'], selection)
+        export_flat_models(ensemble)
+        set_current(version)
         
         print("\n" + "=" * 50)
-        print("🎉 All models trained and saved successfully!")
+        print(f"🎉 All models trained and saved successfully in {time.perf_counter() - started:.1f}s!")
         print("📁 Files created:")
         print("   - milk_production_model.pkl")
         print("   - cattle_disease_detector.pkl") 
         print("   - complete_detector.pkl")
+        print("   - flat_models/ (memory-mappable node tables, forests only)")
         print("\n🔄 Restart the Flask app to use the trained models")
         
     except Exception as e:
@@ -149,4 +535,4 @@ def main():
     return True
 
 if __name__ == "__main__":
-    main()
+    sys.exit(0 if main() else 1)